@@ -1,4 +1,6 @@
 import uuid
+from contextlib import contextmanager
+
 from django.db import models
 
 class AuditableModel(models.Model):
@@ -7,4 +9,23 @@ class AuditableModel(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        abstract = True
\ No newline at end of file
+        abstract = True
+
+
+@contextmanager
+def preserve_timestamps(*model_classes):
+    """Lets bulk inserts keep the created_at/updated_at values they were given."""
+    fields = [
+        field
+        for model in model_classes
+        for field in model._meta.fields
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+    ]
+    original = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, original):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
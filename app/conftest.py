@@ -1,7 +1,11 @@
+from contextlib import contextmanager
+
 import pytest
+from core.queries import QueryTracker
 from django.urls import reverse
 from monitoring.models import User
 from monitoring.tests.factories import UserFactory
+from monitoring.utils import reset_rule_latencies
 from pytest_factoryboy import register
 from rest_framework.test import APIClient
 
@@ -55,3 +59,26 @@ def authenticate_user(api_client, active_user: User, auth_user_password):
         }
 
     return _user
+
+
+@pytest.fixture
+def assert_no_n_plus_one(db):
+    """Fails the test when the wrapped block repeats a query shape
+    more than `threshold` times."""
+
+    @contextmanager
+    def _check(threshold: int = None):
+        with QueryTracker(threshold=threshold) as tracker:
+            yield tracker
+        tracker.check()
+
+    return _check
+
+
+@pytest.fixture(autouse=True)
+def rule_latencies():
+    """Rule latency estimates are per process; a slow query in one test
+    must not make later tests defer rules."""
+    reset_rule_latencies()
+    yield
+    reset_rule_latencies()
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class CoreConfig(AppConfig):
+    """Project-level app. Celery is configured in core.celery and only
+    imported by the worker or on the first task dispatch."""
+
+    name = "core"
+    verbose_name = "Core"
@@ -10,4 +10,12 @@ environment = config('ENVIRONMENT')
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings."+environment)
 
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up; serves the flagged transaction SSE feed.
+from monitoring.live import not_found, with_live_feed  # noqa: E402
+
+# The API and the feed in one process, e.g. `uvicorn core.asgi:application`
+# in development. Production serves them apart (see core/serving.py).
+application = with_live_feed(django_application)
+feed_application = with_live_feed(not_found)
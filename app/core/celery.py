@@ -1,24 +1,30 @@
-from django.apps import apps, AppConfig
-from django.conf import settings
 import os
+
 from celery import Celery
+from celery.schedules import crontab
 from decouple import config
+from django.conf import settings
 
 if not settings.configured:
     environment = config('ENVIRONMENT')
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', "core.settings."+environment) 
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', "core.settings."+environment)
 
 APP = Celery('core')
+APP.config_from_object('django.conf:settings', namespace='CELERY')
+# Task modules are discovered lazily when the worker starts rather than
+# whenever Django boots.
+APP.autodiscover_tasks()
 
+APP.conf.beat_schedule = {
+    "export-analytics-snapshot": {
+        "task": "monitoring.tasks.export_analytics_snapshot",
+        "schedule": crontab(hour=settings.ANALYTICS_EXPORT_HOUR, minute=0),
+    },
+    "purge-idempotency-keys": {
+        "task": "monitoring.tasks.purge_idempotency_keys",
+        "schedule": crontab(minute=30),
+    },
+}
 
-class CeleryConfig(AppConfig):
-    name = 'core'
-    verbose_name = 'Celery Config'
-
-    def ready(self):
-        APP.config_from_object('django.conf:settings', namespace='CELERY')
-        installed_apps = [app_config.name for app_config in apps.get_app_configs()]
-        APP.autodiscover_tasks(installed_apps, force=True)
-
-    def tearDown(self):
-        ...
+# Connects the task telemetry signal handlers in publishers and workers.
+from core import task_metrics  # noqa: E402,F401
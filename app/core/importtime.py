@@ -0,0 +1,79 @@
+"""Import-time profiling of the process entry points.
+
+Each entry point is imported in a fresh interpreter started with
+`python -X importtime`; the per-module timings it prints to stderr are
+summed and compared against IMPORT_TIME_BUDGET_MS.
+"""
+import os
+import re
+import subprocess
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.conf import settings
+
+APP_ROOT = Path(__file__).resolve().parent.parent
+
+ENTRY_POINTS = {
+    "web": (
+        "import core.wsgi\n"
+        "from django.urls import get_resolver\n"
+        "get_resolver().url_patterns"
+    ),
+    "worker": (
+        "from celery.bin.celery import find_app\n"
+        "find_app('core').loader.import_default_modules()"
+    ),
+    "manage": "import django\ndjango.setup()",
+}
+
+_IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+@dataclass
+class ImportReport:
+    entry_point: str
+    modules: list = field(default_factory=list)
+
+    @property
+    def total_ms(self) -> float:
+        return sum(self_us for _, self_us, _ in self.modules) / 1000
+
+    def slowest(self, limit: int = 10) -> list:
+        """Top-level packages ordered by their summed import time in ms"""
+        packages = {}
+        for name, self_us, _ in self.modules:
+            package = name.split(".")[0]
+            packages[package] = packages.get(package, 0) + self_us / 1000
+        return sorted(packages.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    def imported(self, package: str) -> bool:
+        return any(
+            name == package or name.startswith(package + ".")
+            for name, _, _ in self.modules
+        )
+
+
+def parse_importtime(output: str) -> list:
+    """Parses `-X importtime` output into (module, self_us, cumulative_us)"""
+    modules = []
+    for line in output.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, _, name = match.groups()
+            modules.append((name, int(self_us), int(cumulative_us)))
+    return modules
+
+
+def measure(entry_point: str) -> ImportReport:
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", ENTRY_POINTS[entry_point]],
+        cwd=APP_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return ImportReport(entry_point, parse_importtime(result.stderr))
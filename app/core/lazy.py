@@ -0,0 +1,47 @@
+from django.utils.module_loading import import_string
+
+
+def lazy_view(dotted_path: str, **initkwargs):
+    """Defers importing a class-based view and its dependencies until the
+    view is first requested, keeping them out of process start-up."""
+    view = None
+
+    def _view(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            view = import_string(dotted_path).as_view(**initkwargs)
+        return view(request, *args, **kwargs)
+
+    _view.csrf_exempt = True
+    return _view
+
+
+_schema_extensions = []
+
+
+def extend_schema_lazily(**kwargs):
+    """Records `drf_spectacular.utils.extend_schema` arguments on a view
+    method; `apply_schema_extensions` applies them when a schema is generated,
+    so processes that never serve the schema don't import drf_spectacular.
+    Parameters are given as OpenApiParameter keyword dicts."""
+
+    def decorator(view_method):
+        _schema_extensions.append((view_method, kwargs))
+        return view_method
+
+    return decorator
+
+
+def apply_schema_extensions() -> None:
+    from drf_spectacular.utils import OpenApiParameter, extend_schema
+
+    while _schema_extensions:
+        view_method, kwargs = _schema_extensions.pop(0)
+        if "parameters" in kwargs:
+            kwargs = dict(
+                kwargs,
+                parameters=[
+                    OpenApiParameter(**parameter) for parameter in kwargs["parameters"]
+                ],
+            )
+        extend_schema(**kwargs)(view_method)
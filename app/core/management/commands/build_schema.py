@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.schema import build_schema
+
+
+class Command(BaseCommand):
+    help = "Generate the versioned OpenAPI schema artifact served at api/schema/."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--api-version", default=None)
+        parser.add_argument("--lang", default=None)
+
+    def handle(self, *args, **options):
+        try:
+            path = build_schema(options["api_version"], options["lang"])
+        except ValueError as error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(f"Schema written to {path}"))
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importtime import ENTRY_POINTS, measure
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure import time of the web, worker and manage.py entry points "
+        "and fail when one exceeds IMPORT_TIME_BUDGET_MS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "entry_points",
+            nargs="*",
+            help=f"Entry points to measure: {', '.join(ENTRY_POINTS)} (default all).",
+        )
+        parser.add_argument("--top", type=int, default=10)
+        parser.add_argument(
+            "--runs",
+            type=int,
+            default=3,
+            help="Keep the fastest of several runs to reduce noise.",
+        )
+        parser.add_argument(
+            "--check", action="store_true", help="Exit non-zero when over budget."
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options["entry_points"]) - set(ENTRY_POINTS)
+        if unknown:
+            raise CommandError(f"Unknown entry point(s): {', '.join(sorted(unknown))}")
+        over_budget = []
+        for entry_point in options["entry_points"] or ENTRY_POINTS:
+            report = min(
+                (measure(entry_point) for _ in range(max(options["runs"], 1))),
+                key=lambda report: report.total_ms,
+            )
+            budget = settings.IMPORT_TIME_BUDGET_MS.get(entry_point)
+            self.stdout.write(
+                f"{entry_point}: {report.total_ms:.0f}ms "
+                f"({len(report.modules)} modules, budget {budget}ms)"
+            )
+            for package, package_ms in report.slowest(options["top"]):
+                self.stdout.write(f"    {package_ms:8.1f}ms  {package}")
+            if budget is not None and report.total_ms > budget:
+                over_budget.append(f"{entry_point} ({report.total_ms:.0f}ms > {budget}ms)")
+        if over_budget and options["check"]:
+            raise CommandError("Import time over budget: " + ", ".join(over_budget))
@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core.task_metrics import collect, render_prometheus
+
+
+class Command(BaseCommand):
+    help = "Print the Celery task metrics merged from every worker process."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format", choices=("summary", "json", "prometheus"), default="summary"
+        )
+
+    def handle(self, *args, **options):
+        merged = collect()
+        if options["format"] == "json":
+            self.stdout.write(json.dumps(merged.snapshot(), indent=2))
+            return
+        if options["format"] == "prometheus":
+            self.stdout.write(render_prometheus(merged), ending="")
+            return
+        for task_name, metrics in sorted(merged.tasks.items()):
+            latency, runtime = metrics.queue_latency, metrics.runtime
+            self.stdout.write(
+                f"{task_name}: {metrics.counters['succeeded']} succeeded, "
+                f"{metrics.counters['failed']} failed, "
+                f"{metrics.counters['retried']} retried\n"
+                f"    queue latency p50<={latency.quantile(0.5)}s "
+                f"p95<={latency.quantile(0.95)}s\n"
+                f"    runtime       p50<={runtime.quantile(0.5)}s "
+                f"p95<={runtime.quantile(0.95)}s"
+            )
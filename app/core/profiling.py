@@ -0,0 +1,193 @@
+"""Opt-in profiling of individual requests.
+
+A request is profiled when it carries `X-Profile: <PROFILING_TOKEN>` or is
+picked by PROFILING_SAMPLE_RATE. The view then runs under cProfile (or, with
+`X-Profile-Mode: sample`, under a wall-clock stack sampler) while SQL
+timings are recorded, and the result is written to PROFILING_DIR:
+
+    <id>.json     request metadata, SQL timings and a pstats summary
+    <id>.prof     cProfile dump, loadable with pstats/snakeviz
+    <id>.folded   sampled stacks in flamegraph "folded" format
+
+Without PROFILING_ENABLED the middleware removes itself from the stack.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.crypto import constant_time_compare
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_MODE_HEADER = "X-Profile-Mode"
+
+
+def get_profile_dir() -> Path:
+    return Path(settings.PROFILING_DIR)
+
+
+class SQLTimer:
+    """Execute wrapper recording each statement and its duration"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            self.queries.append({"sql": sql, "duration_ms": round(duration_ms, 3)})
+
+
+class StackSampler(threading.Thread):
+    """Samples the stack of one thread at a fixed interval"""
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_filename}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+def list_profiles() -> list:
+    profile_dir = get_profile_dir()
+    if not profile_dir.exists():
+        return []
+    profiles = []
+    for path in sorted(profile_dir.glob("*.json"), reverse=True):
+        with open(path) as metadata:
+            profiles.append(json.load(metadata))
+    return profiles
+
+
+def get_profile(profile_id: str):
+    path = get_profile_dir() / f"{Path(profile_id).name}.json"
+    if not path.exists():
+        return None
+    with open(path) as metadata:
+        return json.load(metadata)
+
+
+def get_profile_file(profile_id: str, extension: str):
+    path = get_profile_dir() / f"{Path(profile_id).name}.{extension}"
+    return path if path.exists() else None
+
+
+def _prune(profile_dir: Path) -> None:
+    stored = sorted(profile_dir.glob("*.json"))
+    for metadata in stored[: max(len(stored) - settings.PROFILING_MAX_STORED, 0)]:
+        for path in profile_dir.glob(metadata.stem + ".*"):
+            path.unlink(missing_ok=True)
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, "PROFILING_ENABLED", False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.token = settings.PROFILING_TOKEN
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+
+    def should_profile(self, request) -> bool:
+        header = request.headers.get(PROFILE_HEADER)
+        if header and self.token:
+            return constant_time_compare(header, self.token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+        return self.profile(request)
+
+    def profile(self, request):
+        mode = request.headers.get(PROFILE_MODE_HEADER, "cprofile")
+        sql_timer = SQLTimer()
+        profiler = sampler = None
+        wrappers = [connections[alias].execute_wrapper(sql_timer) for alias in connections]
+        for wrapper in wrappers:
+            wrapper.__enter__()
+        started = time.perf_counter()
+        try:
+            if mode == "sample":
+                sampler = StackSampler(threading.get_ident())
+                sampler.start()
+                response = self.get_response(request)
+            else:
+                profiler = cProfile.Profile()
+                response = profiler.runcall(self.get_response, request)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            if sampler is not None:
+                sampler.stop()
+            for wrapper in reversed(wrappers):
+                wrapper.__exit__(None, None, None)
+        profile_id = self.store(
+            request, response, duration_ms, sql_timer, profiler, sampler
+        )
+        response["X-Profile-Id"] = profile_id
+        return response
+
+    def store(self, request, response, duration_ms, sql_timer, profiler, sampler):
+        profile_dir = get_profile_dir()
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        now = datetime.now(timezone.utc)
+        profile_id = f"{now:%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+        metadata = {
+            "id": profile_id,
+            "created_at": now.isoformat(),
+            "method": request.method,
+            "path": request.path,
+            "status_code": response.status_code,
+            "duration_ms": round(duration_ms, 3),
+            "mode": "sample" if sampler is not None else "cprofile",
+            "sql_count": len(sql_timer.queries),
+            "sql_duration_ms": round(
+                sum(query["duration_ms"] for query in sql_timer.queries), 3
+            ),
+            "sql": sql_timer.queries,
+        }
+        if profiler is not None:
+            profiler.dump_stats(profile_dir / f"{profile_id}.prof")
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(25)
+            metadata["summary"] = summary.getvalue()
+        if sampler is not None:
+            (profile_dir / f"{profile_id}.folded").write_text(sampler.folded())
+        tmp_path = profile_dir / f"{profile_id}.json.tmp"
+        tmp_path.write_text(json.dumps(metadata))
+        os.replace(tmp_path, profile_dir / f"{profile_id}.json")
+        _prune(profile_dir)
+        return profile_id
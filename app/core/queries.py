@@ -0,0 +1,127 @@
+"""Detection of N+1 query patterns.
+
+Every SQL statement executed while a `QueryTracker` is active is reduced to a
+fingerprint (literals and parameter lists replaced by `?`). A fingerprint
+executed more than `threshold` times within one request or test is reported
+together with the application call site that issued it first.
+
+Enable for requests with `NPLUSONE_DETECTION = "log"` or `"raise"` in the
+settings; the middleware removes itself when the setting is unset.
+"""
+import logging
+import re
+import traceback
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+APP_ROOT = str(Path(__file__).resolve().parent.parent)
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+def fingerprint(sql: str) -> str:
+    """Reduces a SQL statement to its shape"""
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = sql.replace("%s", "?")
+    sql = _PLACEHOLDER_LIST.sub("(?)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+def _call_site() -> list:
+    """Stack frames belonging to the project, excluding this module"""
+    return [
+        frame
+        for frame in traceback.extract_stack()
+        if frame.filename.startswith(APP_ROOT)
+        and "site-packages" not in frame.filename
+        and frame.filename != __file__
+    ]
+
+
+@dataclass
+class RepeatedQuery:
+    sql: str
+    count: int
+    stack: list
+
+    def __str__(self) -> str:
+        call_site = "".join(traceback.format_list(self.stack[-5:]))
+        return f"{self.count}x {self.sql}\n{call_site}"
+
+
+class QueryTracker:
+    """Context manager recording the fingerprint of every executed query"""
+
+    def __init__(self, threshold: int = None, using: list = None):
+        self.threshold = threshold or getattr(settings, "NPLUSONE_THRESHOLD", 5)
+        self.aliases = using or list(connections)
+        self.counts = Counter()
+        self.stacks = {}
+        self._wrappers = []
+
+    def __call__(self, execute, sql, params, many, context):
+        shape = fingerprint(sql)
+        self.counts[shape] += 1
+        if shape not in self.stacks:
+            self.stacks[shape] = _call_site()
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        for alias in self.aliases:
+            wrapper = connections[alias].execute_wrapper(self)
+            wrapper.__enter__()
+            self._wrappers.append(wrapper)
+        return self
+
+    def __exit__(self, *exc_info):
+        while self._wrappers:
+            self._wrappers.pop().__exit__(*exc_info)
+
+    @property
+    def repeated(self) -> list:
+        return [
+            RepeatedQuery(sql, count, self.stacks[sql])
+            for sql, count in self.counts.most_common()
+            if count > self.threshold
+        ]
+
+    def check(self, raise_error: bool = True) -> list:
+        repeated = self.repeated
+        if repeated:
+            message = "Repeated queries detected:\n" + "\n".join(map(str, repeated))
+            if raise_error:
+                raise NPlusOneError(message)
+            logger.warning(message)
+        return repeated
+
+
+class NPlusOneMiddleware:
+    """Reports or raises when a request repeats a query shape too often"""
+
+    def __init__(self, get_response):
+        self.mode = getattr(settings, "NPLUSONE_DETECTION", None)
+        if self.mode not in ("log", "raise"):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryTracker() as tracker:
+            response = self.get_response(request)
+        repeated = tracker.check(raise_error=self.mode == "raise")
+        if repeated:
+            response["X-Repeated-Queries"] = str(len(repeated))
+        return response
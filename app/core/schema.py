@@ -0,0 +1,159 @@
+"""Precomputed OpenAPI schema.
+
+Generating the schema introspects every view and serializer, so it is done
+once per code version and stored as a JSON artifact under
+SCHEMA_ARTIFACT_DIR (see the `build_schema` command). Workers load the
+artifact on first use and keep the rendered bodies in memory, answering
+repeated fetches with an ETag and 304 when `If-None-Match` matches.
+
+Only the API versions in ALLOWED_VERSIONS and the languages in LANGUAGES
+get their own artifact; the view serves the default schema for any other
+`version` or `lang`, so request parameters never reach the file system and
+the number of artifacts and cached bodies stays bounded.
+"""
+import hashlib
+import json
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.urls import get_resolver
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import translation
+from django.utils.http import parse_etags, quote_etag
+from drf_spectacular.openapi import AutoSchema
+from drf_spectacular.renderers import OpenApiJsonRenderer
+from drf_spectacular.settings import spectacular_settings
+from drf_spectacular.views import SpectacularAPIView
+from rest_framework.settings import api_settings
+
+from .lazy import apply_schema_extensions
+
+APP_ROOT = Path(__file__).resolve().parent.parent
+SKIPPED_DIRS = {"venv", ".venv", "site-packages", "node_modules", "__pycache__"}
+
+# Bodies are kept per (code version, API version, language, media type)
+MAX_RENDERED = 64
+
+_rendered = {}
+_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def get_code_version() -> str:
+    """CODE_VERSION when set (e.g. the git sha baked into the image),
+    otherwise a digest of the project's python sources."""
+    if settings.CODE_VERSION:
+        return settings.CODE_VERSION
+    digest = hashlib.sha1(str(spectacular_settings.VERSION).encode())
+    for root, dirs, files in os.walk(APP_ROOT):
+        dirs[:] = sorted(d for d in dirs if d not in SKIPPED_DIRS)
+        for name in sorted(files):
+            if name.endswith(".py"):
+                path = Path(root, name)
+                digest.update(str(path.relative_to(APP_ROOT)).encode())
+                digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+
+def is_known_version(api_version: str = None) -> bool:
+    return api_version is None or api_version in (api_settings.ALLOWED_VERSIONS or ())
+
+
+def is_known_language(lang: str = None) -> bool:
+    return lang is None or lang in dict(settings.LANGUAGES)
+
+
+def get_artifact_path(api_version: str = None, lang: str = None) -> Path:
+    if not is_known_version(api_version):
+        raise ValueError(f"Unknown API version {api_version!r}")
+    if not is_known_language(lang):
+        raise ValueError(f"Unknown language {lang!r}")
+    parts = ["openapi", get_code_version()]
+    parts += [part for part in (api_version, lang) if part]
+    return Path(settings.SCHEMA_ARTIFACT_DIR) / ("-".join(parts) + ".json")
+
+
+def _prepare_views() -> None:
+    """Gives the views drf_spectacular's AutoSchema, which settings leave out
+    so that no other process imports it (DRF routers resolve
+    DEFAULT_SCHEMA_CLASS while registering viewsets), then applies the schema
+    extensions the views recorded when the URLconf imported them."""
+    api_settings.DEFAULT_SCHEMA_CLASS = AutoSchema
+    get_resolver().url_patterns
+    apply_schema_extensions()
+
+
+def build_schema(api_version: str = None, lang: str = None) -> Path:
+    """Generates the schema and writes it to its versioned artifact"""
+    _prepare_views()
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS(api_version=api_version)
+    with translation.override(lang):
+        schema = generator.get_schema(request=None, public=True)
+        body = OpenApiJsonRenderer().render(schema, renderer_context={"indent": None})
+    path = get_artifact_path(api_version, lang)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(body)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_schema(api_version: str = None, lang: str = None) -> dict:
+    path = get_artifact_path(api_version, lang)
+    if not path.exists():
+        build_schema(api_version, lang)
+    with open(path) as artifact:
+        return json.load(artifact)
+
+
+def get_rendered_schema(
+    renderer, media_type: str, api_version: str = None, lang: str = None
+) -> tuple:
+    """Returns (body, etag) for the schema rendered by `renderer`,
+    generating or loading the artifact only once per process."""
+    key = (get_code_version(), api_version, lang, media_type)
+    if key not in _rendered:
+        with _lock:
+            if key not in _rendered:
+                schema = load_schema(api_version, lang)
+                body = renderer.render(schema, media_type, {})
+                etag = quote_etag(hashlib.sha1(body).hexdigest())
+                if len(_rendered) >= MAX_RENDERED:
+                    # Oldest first; only a code version change fills it up
+                    del _rendered[next(iter(_rendered))]
+                _rendered[key] = (body, etag)
+    return _rendered[key]
+
+
+def clear_schema_cache() -> None:
+    _rendered.clear()
+    get_code_version.cache_clear()
+
+
+class CachedSpectacularAPIView(SpectacularAPIView):
+    def _get_schema_response(self, request):
+        version = (
+            self.api_version or request.version or self._get_version_parameter(request)
+        )
+        if not is_known_version(version):
+            version = None
+        lang = request.GET.get("lang") if settings.USE_I18N else None
+        if not is_known_language(lang):
+            lang = None
+        body, etag = get_rendered_schema(
+            request.accepted_renderer, request.accepted_media_type, version, lang
+        )
+        if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+        if etag in if_none_match or "*" in if_none_match:
+            response = HttpResponseNotModified()
+            response["ETag"] = etag
+            return response
+        response = HttpResponse(body, content_type=request.accepted_media_type)
+        response["ETag"] = etag
+        response["Content-Disposition"] = (
+            f'inline; filename="{self._get_filename(request, version)}"'
+        )
+        return response
@@ -0,0 +1,132 @@
+"""Production serving modes.
+
+`gunicorn`, started from the app directory, reads gunicorn.conf.py and
+serves the mode named by SERVER_MODE. The API is served by one of:
+
+    sync     core.wsgi, one request at a time per worker process
+    gthread  core.wsgi, GUNICORN_THREADS requests at a time per worker
+    uvicorn  core.asgi under uvicorn workers
+
+and the live feed of flagged transactions, whichever of them is used, by
+
+    feed     the stream alone, in a single uvicorn process
+
+The feed polls the database for flags set by any process, so one process
+sees every event and numbers them consistently for reconnecting clients.
+
+`runserver` is only a baseline for `manage.py benchmark_serving`.
+"""
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from pathlib import Path
+
+APP_ROOT = Path(__file__).resolve().parent.parent
+
+MODES = {
+    "sync": {"worker_class": "sync", "app": "core.wsgi:application"},
+    "gthread": {"worker_class": "gthread", "app": "core.wsgi:application"},
+    "uvicorn": {
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "app": "core.asgi:django_application",
+    },
+}
+BASELINE = "runserver"
+FEED_MODE = "feed"
+FEED = {
+    "worker_class": "uvicorn.workers.UvicornWorker",
+    "app": "core.asgi:feed_application",
+}
+
+# Caches private to each process; throttle buckets kept in one would be
+# multiplied by the number of workers.
+PROCESS_LOCAL_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+def get_mode(mode: str) -> dict:
+    if mode == FEED_MODE:
+        return FEED
+    if mode not in MODES:
+        raise ValueError(f"Unknown serving mode {mode!r}")
+    return MODES[mode]
+
+
+def default_workers(mode: str, cpus: int = None) -> int:
+    """One process per core in every mode. Threaded and async workers
+    overlap waiting on the database themselves; sync workers would usually
+    be 2 * cores + 1 to do the same, but SQLite takes one writer at a time,
+    so extra sync workers only queue on its lock and turn transfers into
+    503s once the retries run out. The feed is always one process."""
+    if mode == FEED_MODE:
+        return 1
+    return cpus or os.cpu_count() or 1
+
+
+def check_shared_cache(workers: int) -> None:
+    """Refuses to serve from several processes with a per-process cache
+    outside DEBUG: every worker would enforce the throttle rates on its own."""
+    from django.conf import settings
+
+    backend = settings.CACHES["default"]["BACKEND"]
+    if workers > 1 and not settings.DEBUG and backend in PROCESS_LOCAL_CACHES:
+        raise RuntimeError(
+            f"{workers} workers cannot share the {backend} cache; set "
+            "CACHE_BACKEND and CACHE_LOCATION to a shared cache such as memcached"
+        )
+
+
+def server_command(mode: str, bind: str) -> list:
+    if mode == BASELINE:
+        return [sys.executable, "manage.py", "runserver", "--noreload", bind]
+    get_mode(mode)
+    return [sys.executable, "-m", "gunicorn"]
+
+
+def wait_until_ready(base_url: str, process, timeout: float) -> None:
+    """Polls until the server answers any HTTP response"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            urllib.request.urlopen(base_url + "/", timeout=1)
+            return
+        except urllib.error.HTTPError:
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"Server at {base_url} did not start in {timeout}s")
+
+
+@contextmanager
+def running_server(mode: str, port: int, workers: int = None, timeout: float = 30.0):
+    """Starts a server in `mode` on localhost:`port`; yields its base URL"""
+    bind = f"127.0.0.1:{port}"
+    env = dict(os.environ, SERVER_MODE=mode, GUNICORN_BIND=bind)
+    if workers:
+        env["WEB_CONCURRENCY"] = str(workers)
+    process = subprocess.Popen(
+        server_command(mode, bind),
+        cwd=APP_ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        base_url = f"http://{bind}"
+        wait_until_ready(base_url, process, timeout)
+        yield base_url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
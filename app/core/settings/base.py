@@ -3,9 +3,11 @@ Django settings for Transaction-Monitoring project.
 """
 import os
 from datetime import timedelta
+from importlib.util import find_spec
 from pathlib import Path
 
-from decouple import config
+from corsheaders.defaults import default_headers
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -29,8 +31,7 @@ INSTALLED_APPS = [
     "django.contrib.staticfiles",
     # Third-party Apps
     "corsheaders",
-    "drf_spectacular",
-    "core.celery.CeleryConfig",
+    "core.apps.CoreConfig",
     # Local Apps
     "monitoring",
 ]
@@ -40,6 +41,7 @@ AUTH_USER_MODEL = "monitoring.User"
 
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
+    "core.profiling.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -47,14 +49,25 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "core.queries.NPlusOneMiddleware",
 ]
 
+# Opt-in N+1 query detection: "log" or "raise" when a request repeats
+# the same query shape more than NPLUSONE_THRESHOLD times.
+NPLUSONE_DETECTION = config("NPLUSONE_DETECTION", default=None)
+NPLUSONE_THRESHOLD = config("NPLUSONE_THRESHOLD", default=5, cast=int)
+
 ROOT_URLCONF = "core.urls"
 
+# drf_spectacular is not an installed app, so that only the schema views and
+# the `build_schema` command import it; its templates are found by path.
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
-        "DIRS": [],
+        "DIRS": [
+            Path(path, "templates")
+            for path in find_spec("drf_spectacular").submodule_search_locations
+        ],
         "APP_DIRS": True,
         "OPTIONS": {
             "context_processors": [
@@ -73,18 +86,52 @@ STATIC_ROOT = "static/"
 WSGI_APPLICATION = "core.wsgi.application"
 ASGI_APPLICATION = "core.asgi.application"
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = list(default_headers) + ["idempotency-key"]
 CSRF_TRUSTED_ORIGINS = ["https://*.hereconomy.com"]
 LOGIN_URL = "rest_framework:login"
 LOGOUT_URL = "rest_framework:logout"
 
+# Seconds a worker keeps its database connections open between requests
+# (0 closes them after every request, as runserver does).
+CONN_MAX_AGE = config("CONN_MAX_AGE", default=0, cast=int)
+
+# Test databases are files too: in-memory SQLite shares one cache between
+# connections and fails lock waits at once instead of honouring the busy
+# timeout, so concurrent requests would not behave as they do when served.
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "CONN_MAX_AGE": CONN_MAX_AGE,
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
     }
 }
 
 
+def shard_database(alias: str) -> dict:
+    return {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": Path(TRANSACTION_SHARD_DIR) / f"{alias}.sqlite3",
+        "CONN_MAX_AGE": CONN_MAX_AGE,
+        "TEST": {"NAME": Path(TRANSACTION_SHARD_DIR) / f"test_{alias}.sqlite3"},
+    }
+
+
+# Transactions can be spread over TRANSACTION_SHARD_COUNT extra SQLite
+# databases (monitoring.sharding). Rows are routed by sender to the aliases
+# listed in TRANSACTION_SHARDS; while it is empty everything stays in
+# "default". Run `manage.py rebalance_transactions` after changing it.
+TRANSACTION_SHARD_DIR = config("TRANSACTION_SHARD_DIR", default=str(BASE_DIR))
+TRANSACTION_SHARD_COUNT = config("TRANSACTION_SHARD_COUNT", default=0, cast=int)
+TRANSACTION_SHARD_DATABASES = [
+    f"transactions_{index}" for index in range(TRANSACTION_SHARD_COUNT)
+]
+for alias in TRANSACTION_SHARD_DATABASES:
+    DATABASES[alias] = shard_database(alias)
+TRANSACTION_SHARDS = config("TRANSACTION_SHARDS", default="", cast=Csv())
+DATABASE_ROUTERS = ["monitoring.sharding.TransactionRouter"]
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -103,8 +150,9 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# DEFAULT_SCHEMA_CLASS stays DRF's own: routers resolve it on import, and
+# core.schema switches it to drf_spectacular's while generating the schema.
 REST_FRAMEWORK = {
-    "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "DEFAULT_PAGINATION_CLASS": "core.pagination.CustomPagination",
     "PAGE_SIZE": 20,
     "DEFAULT_AUTHENTICATION_CLASSES": (
@@ -113,6 +161,14 @@ REST_FRAMEWORK = {
         "rest_framework.authentication.SessionAuthentication",
     ),
     "TEST_REQUEST_DEFAULT_FORMAT": "json",
+    # Token buckets for transaction creation, see monitoring.throttling. Each
+    # user gets a burst limit and an hourly budget set by their tier.
+    "DEFAULT_THROTTLE_RATES": {
+        "transaction": config("THROTTLE_TRANSACTION_USER", default="30/min"),
+        "transaction_T1": config("THROTTLE_TRANSACTION_T1", default="300/hour"),
+        "transaction_T2": config("THROTTLE_TRANSACTION_T2", default="600/hour"),
+        "transaction_T3": config("THROTTLE_TRANSACTION_T3", default="1200/hour"),
+    },
 }
 
 
@@ -143,6 +199,78 @@ CELERY_RESULT_SERIALIZER = "json"
 CELERY_TASK_SERIALIZER = "json"
 FLOWER_BASIC_AUTH = os.environ.get("FLOWER_BASIC_AUTH")
 
+# Time evaluate_policy may spend before deferring the remaining slow rules
+# to the reevaluate_deferred_rules task.
+POLICY_LATENCY_BUDGET_MS = config("POLICY_LATENCY_BUDGET_MS", default=50, cast=float)
+
+# Server-sent events feed of flagged transactions (monitoring.live)
+LIVE_FEED_BUFFER_SIZE = config("LIVE_FEED_BUFFER_SIZE", default=1000, cast=int)
+LIVE_FEED_QUEUE_SIZE = config("LIVE_FEED_QUEUE_SIZE", default=100, cast=int)
+LIVE_FEED_HEARTBEAT_SECONDS = config("LIVE_FEED_HEARTBEAT_SECONDS", default=15, cast=int)
+LIVE_FEED_RETRY_MS = config("LIVE_FEED_RETRY_MS", default=3000, cast=int)
+LIVE_FEED_POLL_SECONDS = config("LIVE_FEED_POLL_SECONDS", default=1, cast=float)
+
+# Task telemetry (core.task_metrics): every worker process dumps its
+# histograms to CELERY_METRICS_DIR; with CELERY_METRICS_PORT set the worker
+# serves the merged view at :<port>/metrics.
+CELERY_METRICS_DIR = config(
+    "CELERY_METRICS_DIR", default=str(BASE_DIR.parent / "task_metrics")
+)
+CELERY_METRICS_PORT = config("CELERY_METRICS_PORT", default=0, cast=int)
+CELERY_METRICS_DUMP_INTERVAL = config(
+    "CELERY_METRICS_DUMP_INTERVAL", default=15, cast=int
+)
+
+# Transactions older than the retention horizon are moved into
+# compressed segment files by the `archive_transactions` command.
+TRANSACTION_RETENTION_DAYS = config("TRANSACTION_RETENTION_DAYS", default=90, cast=int)
+ARCHIVE_ROOT = config("ARCHIVE_ROOT", default=str(BASE_DIR.parent / "archive"))
+
+# Idempotency-Key on POST /api/v1/transaction/: responses are kept for
+# IDEMPOTENCY_KEY_TTL_HOURS (and cached for IDEMPOTENCY_CACHE_SECONDS); a
+# request that has not finished after IDEMPOTENCY_LOCK_SECONDS can be retried.
+IDEMPOTENCY_KEY_TTL_HOURS = config("IDEMPOTENCY_KEY_TTL_HOURS", default=24, cast=int)
+IDEMPOTENCY_CACHE_SECONDS = config("IDEMPOTENCY_CACHE_SECONDS", default=300, cast=int)
+IDEMPOTENCY_LOCK_SECONDS = config("IDEMPOTENCY_LOCK_SECONDS", default=60, cast=int)
+
+# Shadow (champion/challenger) evaluation: this fraction of transfers is
+# replayed by a worker against each rule set named in SHADOW_CHALLENGERS
+# (see monitoring/shadow.py) without affecting the live decision.
+SHADOW_SAMPLE_RATE = config("SHADOW_SAMPLE_RATE", default=0.0, cast=float)
+SHADOW_CHALLENGERS = config("SHADOW_CHALLENGERS", default="", cast=Csv())
+
+# When a user is flagged, transfers they received in the last
+# FLAGGED_RECIPIENT_LOOKBACK_DAYS are flagged RESCORE_BATCH_SIZE at a time.
+FLAGGED_RECIPIENT_LOOKBACK_DAYS = config(
+    "FLAGGED_RECIPIENT_LOOKBACK_DAYS", default=30, cast=int
+)
+RESCORE_BATCH_SIZE = config("RESCORE_BATCH_SIZE", default=500, cast=int)
+
+# Users changed per UPDATE (and audit record) by the bulk moderation API.
+USER_MODERATION_BATCH_SIZE = config("USER_MODERATION_BATCH_SIZE", default=500, cast=int)
+
+# Admin changelists count at most this many matching rows; unfiltered lists
+# of larger tables show the database's row estimate instead.
+ADMIN_EXACT_COUNT_LIMIT = config("ADMIN_EXACT_COUNT_LIMIT", default=10000, cast=int)
+
+# Nightly columnar snapshots for analytics (see monitoring/analytics.py). The
+# last ANALYTICS_REFRESH_DAYS days are re-exported to pick up late flags.
+ANALYTICS_ROOT = config("ANALYTICS_ROOT", default=str(BASE_DIR.parent / "analytics"))
+ANALYTICS_REFRESH_DAYS = config("ANALYTICS_REFRESH_DAYS", default=2, cast=int)
+ANALYTICS_EXPORT_HOUR = config("ANALYTICS_EXPORT_HOUR", default=1, cast=int)
+
+# Throttle buckets and other shared counters live here; point it at a shared
+# backend with atomic increments (e.g. PyMemcacheCache, as
+# docker-compose.prod.yml does) when running several workers.
+CACHES = {
+    "default": {
+        "BACKEND": config(
+            "CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": config("CACHE_LOCATION", default=""),
+    }
+}
+
 SESSION_ENGINE = "django.contrib.sessions.backends.cache"
 SESSION_CACHE_ALIAS = "default"
 
@@ -179,6 +307,31 @@ SPECTACULAR_SETTINGS = {
     "OAUTH2_SCOPES": None,
 }
 
+# Serve list endpoints from values() rows rendered with orjson
+FAST_LIST_SERIALIZATION = config("FAST_LIST_SERIALIZATION", default=True, cast=bool)
+
+# Per-request profiling, triggered by an `X-Profile: <PROFILING_TOKEN>` header
+# or for a random PROFILING_SAMPLE_RATE share of requests.
+PROFILING_ENABLED = config("PROFILING_ENABLED", default=False, cast=bool)
+PROFILING_TOKEN = config("PROFILING_TOKEN", default="")
+PROFILING_SAMPLE_RATE = config("PROFILING_SAMPLE_RATE", default=0.0, cast=float)
+PROFILING_DIR = config("PROFILING_DIR", default=str(BASE_DIR.parent / "profiles"))
+PROFILING_MAX_STORED = config("PROFILING_MAX_STORED", default=200, cast=int)
+
+# The OpenAPI schema is generated once per code version into this directory.
+# Set CODE_VERSION (e.g. the git sha) at build time to skip hashing sources.
+SCHEMA_ARTIFACT_DIR = config(
+    "SCHEMA_ARTIFACT_DIR", default=str(BASE_DIR.parent / "schema_cache")
+)
+CODE_VERSION = config("CODE_VERSION", default="")
+
+# Regression budget for `manage.py importtime_report --check`.
+IMPORT_TIME_BUDGET_MS = {
+    "web": 900,
+    "worker": 1200,
+    "manage": 600,
+}
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -14,4 +14,10 @@ EMAIL_USE_TLS = True
 
 CELERY_BROKER_URL = config("RABBITMQ_URL")
 
+# At least two shard databases, so the sharding layer can be exercised
+# locally and by the test suite (unused until listed in TRANSACTION_SHARDS).
+for index in range(TRANSACTION_SHARD_COUNT, 2):
+    TRANSACTION_SHARD_DATABASES.append(f"transactions_{index}")
+    DATABASES[f"transactions_{index}"] = shard_database(f"transactions_{index}")
+
 LOGGING = {}
@@ -0,0 +1,299 @@
+"""Celery task telemetry.
+
+Signal handlers record, per task name:
+
+- queue latency: publish (stamped by `before_task_publish`) to task start
+- runtime: `task_prerun` to `task_postrun`
+- succeeded, failed and retried counts
+- named event counts tasks record themselves with `registry.count()`
+
+as cumulative histograms and counters. Prefork pool children each hold their own
+registry, so every process dumps a snapshot to CELERY_METRICS_DIR after tasks
+and from a timer while idle, and the worker's main process merges the snapshots and
+serves them in Prometheus text format on CELERY_METRICS_PORT. The
+`task_metrics` management command prints the same merged view.
+"""
+import json
+import logging
+import math
+import os
+import socket
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from celery.signals import (
+    before_task_publish,
+    task_failure,
+    task_postrun,
+    task_prerun,
+    task_retry,
+    worker_process_init,
+    worker_process_shutdown,
+    worker_ready,
+)
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, math.inf)
+RUNTIME_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, math.inf)
+COUNTERS = ("succeeded", "failed", "retried")
+
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self) -> dict:
+        return {"counts": self.counts, "sum": self.sum, "count": self.count}
+
+    def merge(self, data: dict) -> None:
+        self.counts = [a + b for a, b in zip(self.counts, data["counts"])]
+        self.sum += data["sum"]
+        self.count += data["count"]
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+
+class TaskMetrics:
+    def __init__(self):
+        self.queue_latency = Histogram(LATENCY_BUCKETS)
+        self.runtime = Histogram(RUNTIME_BUCKETS)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.events = Counter()
+
+    def to_dict(self) -> dict:
+        return {
+            "queue_latency": self.queue_latency.to_dict(),
+            "runtime": self.runtime.to_dict(),
+            **self.counters,
+            "events": dict(self.events),
+        }
+
+    def merge(self, data: dict) -> None:
+        self.queue_latency.merge(data["queue_latency"])
+        self.runtime.merge(data["runtime"])
+        for counter in COUNTERS:
+            self.counters[counter] += data[counter]
+        self.events.update(data.get("events", {}))
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.tasks = {}
+        self._lock = threading.Lock()
+        self._last_dump = 0.0
+        self._dump_name = None
+        self._dump_pid = None
+
+    def get(self, task_name: str) -> TaskMetrics:
+        if task_name not in self.tasks:
+            self.tasks[task_name] = TaskMetrics()
+        return self.tasks[task_name]
+
+    def observe(self, task_name: str, metric: str, value: float) -> None:
+        with self._lock:
+            getattr(self.get(task_name), metric).observe(value)
+
+    def increment(self, task_name: str, counter: str) -> None:
+        with self._lock:
+            self.get(task_name).counters[counter] += 1
+
+    def count(self, task_name: str, event: str, amount: int = 1) -> None:
+        """Counts an event of the task's own, e.g. a rule it evaluated"""
+        with self._lock:
+            self.get(task_name).events[event] += amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {name: metrics.to_dict() for name, metrics in self.tasks.items()}
+
+    def merge(self, snapshot: dict) -> None:
+        with self._lock:
+            for name, data in snapshot.items():
+                self.get(name).merge(data)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.tasks.clear()
+
+    def dump(self, force: bool = False) -> None:
+        """Writes this process' snapshot, at most every CELERY_METRICS_DUMP_INTERVAL"""
+        now = time.monotonic()
+        if not force and now - self._last_dump < settings.CELERY_METRICS_DUMP_INTERVAL:
+            return
+        self._last_dump = now
+        if self._dump_pid != os.getpid():
+            # The start time keeps a reused pid from overwriting a dead process' counts
+            self._dump_pid = os.getpid()
+            started = time.time_ns()
+            self._dump_name = f"{socket.gethostname()}-{self._dump_pid}-{started}.json"
+        metrics_dir = Path(settings.CELERY_METRICS_DIR)
+        metrics_dir.mkdir(parents=True, exist_ok=True)
+        path = metrics_dir / self._dump_name
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text(json.dumps(self.snapshot()))
+        os.replace(tmp_path, path)
+
+
+registry = MetricsRegistry()
+_started = {}
+
+
+def collect() -> MetricsRegistry:
+    """Merges the snapshots dumped by every worker process"""
+    merged = MetricsRegistry()
+    metrics_dir = Path(settings.CELERY_METRICS_DIR)
+    if metrics_dir.exists():
+        for path in metrics_dir.glob("*.json"):
+            try:
+                merged.merge(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                logger.warning("Skipping unreadable task metrics file %s", path)
+    return merged
+
+
+def render_prometheus(merged: MetricsRegistry) -> str:
+    lines = []
+    for metric, help_text in (
+        ("queue_latency", "Seconds from publish to task start"),
+        ("runtime", "Task execution time in seconds"),
+    ):
+        name = f"celery_task_{metric}_seconds"
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for task_name, metrics in sorted(merged.tasks.items()):
+            histogram = getattr(metrics, metric)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else bound
+                lines.append(f'{name}_bucket{{task="{task_name}",le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{task="{task_name}"}} {histogram.sum}')
+            lines.append(f'{name}_count{{task="{task_name}"}} {histogram.count}')
+    for counter in COUNTERS:
+        name = f"celery_task_{counter}_total"
+        lines += [f"# TYPE {name} counter"]
+        for task_name, metrics in sorted(merged.tasks.items()):
+            lines.append(f'{name}{{task="{task_name}"}} {metrics.counters[counter]}')
+    name = "celery_task_events_total"
+    lines += [f"# TYPE {name} counter"]
+    for task_name, metrics in sorted(merged.tasks.items()):
+        for event, count in sorted(metrics.events.items()):
+            lines.append(f'{name}{{task="{task_name}",event="{event}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+
+def _published_at(request):
+    published_at = getattr(request, "published_at", None)
+    if published_at is None:
+        published_at = (getattr(request, "headers", None) or {}).get("published_at")
+    return published_at
+
+
+@before_task_publish.connect
+def stamp_publish_time(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault("published_at", time.time())
+
+
+@task_prerun.connect
+def record_task_start(task_id=None, task=None, **kwargs):
+    published_at = _published_at(task.request)
+    if published_at is not None:
+        registry.observe(task.name, "queue_latency", max(time.time() - published_at, 0))
+    _started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def record_task_end(task_id=None, task=None, state=None, **kwargs):
+    started = _started.pop(task_id, None)
+    if started is not None:
+        registry.observe(task.name, "runtime", time.perf_counter() - started)
+    if state == "SUCCESS":
+        registry.increment(task.name, "succeeded")
+    registry.dump()
+
+
+@task_failure.connect
+def record_task_failure(sender=None, **kwargs):
+    registry.increment(sender.name, "failed")
+
+
+@task_retry.connect
+def record_task_retry(sender=None, **kwargs):
+    registry.increment(sender.name, "retried")
+
+
+@worker_process_shutdown.connect
+def dump_on_shutdown(**kwargs):
+    registry.dump(force=True)
+
+
+def dump_periodically(stop: threading.Event) -> None:
+    while not stop.wait(settings.CELERY_METRICS_DUMP_INTERVAL):
+        try:
+            registry.dump(force=True)
+        except OSError:
+            logger.exception("Could not dump task metrics")
+
+
+@worker_process_init.connect
+def start_dump_timer(**kwargs):
+    """Dumps from every pool child, so an idle one still publishes its last tasks"""
+    threading.Thread(
+        target=dump_periodically, args=(threading.Event(),), daemon=True
+    ).start()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        registry.dump(force=True)
+        body = render_prometheus(collect()).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+@worker_ready.connect
+def start_metrics_server(**kwargs):
+    port = settings.CELERY_METRICS_PORT
+    if not port:
+        return
+    hostname = socket.gethostname()
+    for stale in Path(settings.CELERY_METRICS_DIR).glob(f"{hostname}-*.json"):
+        stale.unlink(missing_ok=True)
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info("Serving task metrics on :%s/metrics", port)
@@ -1,17 +1,23 @@
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import (
-    SpectacularAPIView,
-    SpectacularRedocView,
-    SpectacularSwaggerView,
-)
+
+from .lazy import lazy_view
 
 urlpatterns = [
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
-    path('api/v1/doc/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
-    path('api/v1/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+    path('api/schema/', lazy_view('core.schema.CachedSpectacularAPIView'), name='schema'),
+    path(
+        'api/v1/doc/',
+        lazy_view('drf_spectacular.views.SpectacularSwaggerView', url_name='schema'),
+        name='swagger-ui',
+    ),
+    path(
+        'api/v1/redoc/',
+        lazy_view('drf_spectacular.views.SpectacularRedocView', url_name='schema'),
+        name='redoc',
+    ),
     path('admin/', admin.site.urls),
     path('api/v1/auth/', include('monitoring.urls.auth')),
     path('api/v1/user/', include('monitoring.urls.user')),
     path('api/v1/transaction/', include('monitoring.urls.transaction')),
+    path('api/v1/profile/', include('monitoring.urls.profile')),
 ]
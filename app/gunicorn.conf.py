@@ -0,0 +1,55 @@
+"""Gunicorn settings for serving the API in production, read by `gunicorn`
+when started from this directory. See core/serving.py for the modes."""
+# Not imported by name: gunicorn would read `config` as its own setting.
+import decouple
+
+from core.serving import FEED_MODE, default_workers, get_mode
+
+mode = decouple.config("SERVER_MODE", default="gthread")
+wsgi_app = get_mode(mode)["app"]
+worker_class = get_mode(mode)["worker_class"]
+if mode == FEED_MODE:
+    # Each process would poll and number the events on its own
+    workers = 1
+else:
+    workers = decouple.config(
+        "WEB_CONCURRENCY", default=default_workers(mode), cast=int
+    )
+threads = decouple.config("GUNICORN_THREADS", default=4, cast=int)  # gthread only
+bind = decouple.config("GUNICORN_BIND", default="0.0.0.0:8000")
+
+# Import Django and the project once in the master; forked workers share
+# those pages copy-on-write and start serving without importing anything.
+preload_app = True
+
+# Recycle each worker after a few thousand requests to bound memory growth;
+# the jitter keeps workers from restarting all at once.
+max_requests = decouple.config("GUNICORN_MAX_REQUESTS", default=5000, cast=int)
+max_requests_jitter = decouple.config(
+    "GUNICORN_MAX_REQUESTS_JITTER", default=500, cast=int
+)
+
+# Workers silent for `timeout` seconds are restarted; on shutdown or reload,
+# requests in flight get `graceful_timeout` seconds to finish.
+timeout = decouple.config("GUNICORN_TIMEOUT", default=30, cast=int)
+graceful_timeout = decouple.config(
+    "GUNICORN_GRACEFUL_TIMEOUT", default=30, cast=int
+)
+keepalive = decouple.config("GUNICORN_KEEPALIVE", default=5, cast=int)
+
+accesslog = decouple.config("GUNICORN_ACCESS_LOG", default="-")
+
+
+def on_starting(server):
+    # The app is preloaded, so Django's settings are available here
+    from core.serving import check_shared_cache
+
+    check_shared_cache(server.cfg.workers)
+
+
+def post_fork(server, worker):
+    # Each worker opens its own database connections (kept for CONN_MAX_AGE)
+    # rather than sharing any the master opened while preloading.
+    from django.db import connections
+
+    connections.close_all()
@@ -0,0 +1,326 @@
+"""Columnar analytics snapshots of users and transactions.
+
+A nightly export writes every complete day of transactions to its own
+partition of fixed-width NumPy columns, so analysts can filter and aggregate
+memory-mapped files instead of scanning the live database:
+
+    <ANALYTICS_ROOT>/manifest.json
+    <ANALYTICS_ROOT>/users/{id,tier,is_flagged,is_admin,created_at}.npy
+    <ANALYTICS_ROOT>/transactions/2023/08/27/{id,amount,created_at,sender,
+                                             receiver,violation_codes,is_flagged}.npy
+
+Amounts are integers in minor units (kobo) and timestamps are microseconds
+since the epoch (UTC). Users are dictionary encoded: `sender`/`receiver`
+hold an index into the users columns. Codes are only ever appended, so
+partitions written on earlier nights stay valid. Past days are immutable
+except for the last ANALYTICS_REFRESH_DAYS, which are rewritten to pick up
+flags set after the fact.
+"""
+import json
+import os
+import shutil
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models.functions import TruncDate
+
+from .models import Transaction, User
+from .sharding import get_transaction_databases
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+TIERS = [tier for tier, _label in User.TIER_CHOICES]
+USER_COLUMNS = {
+    "id": "S16",
+    "tier": "u1",
+    "is_flagged": "?",
+    "is_admin": "?",
+    "created_at": "i8",
+}
+TRANSACTION_COLUMNS = {
+    "id": "S16",
+    "amount": "i8",
+    "created_at": "i8",
+    "sender": "i4",
+    "receiver": "i4",
+    "violation_codes": "u2",
+    "is_flagged": "?",
+}
+
+
+def get_analytics_root() -> Path:
+    return Path(settings.ANALYTICS_ROOT)
+
+
+def to_micros(moment: datetime) -> int:
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def to_minor_units(amount) -> int:
+    return int(amount.scaleb(2))
+
+
+def _partition_dir(root: Path, day: date) -> Path:
+    return root / "transactions" / f"{day:%Y}" / f"{day:%m}" / f"{day:%d}"
+
+
+def _write_columns(directory: Path, columns: dict) -> None:
+    """Replaces `directory` with the given columns in one rename, so readers
+    never see a partially written partition. Files already memory-mapped
+    by readers stay valid until they are closed."""
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = directory.with_name(f".{directory.name}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir()
+    for name, values in columns.items():
+        np.save(tmp_dir / f"{name}.npy", values)
+    old_dir = directory.with_name(f".{directory.name}.old")
+    if directory.exists():
+        os.replace(directory, old_dir)
+    os.replace(tmp_dir, directory)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def _read_manifest(root: Path) -> dict:
+    path = root / "manifest.json"
+    if not path.exists():
+        return {"partitions": {}}
+    return json.loads(path.read_text())
+
+
+def _export_users(root: Path) -> dict:
+    """Rewrites the user columns; returns {user id bytes: code}"""
+    users_dir = root / "users"
+    codes = {}
+    if (users_dir / "id.npy").exists():
+        codes = {key: code for code, key in enumerate(np.load(users_dir / "id.npy"))}
+    rows = {}
+    for user_id, tier, is_flagged, is_admin, created_at in (
+        User.objects.order_by("created_at")
+        .values_list("id", "tier", "is_flagged", "is_admin", "created_at")
+        .iterator()
+    ):
+        key = user_id.bytes
+        codes.setdefault(key, len(codes))
+        rows[key] = (TIERS.index(tier), is_flagged, is_admin, to_micros(created_at))
+    columns = {
+        name: np.zeros(len(codes), dtype=dtype) for name, dtype in USER_COLUMNS.items()
+    }
+    for key, code in codes.items():
+        columns["id"][code] = key
+        if key in rows:  # users deleted since an earlier export keep their code
+            tier, is_flagged, is_admin, created_at = rows[key]
+            columns["tier"][code] = tier
+            columns["is_flagged"][code] = is_flagged
+            columns["is_admin"][code] = is_admin
+            columns["created_at"][code] = created_at
+    _write_columns(users_dir, columns)
+    return codes
+
+
+def _export_day(root: Path, day: date, user_codes: dict, batch_size: int) -> int:
+    start = datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc)
+    fields = ["id", "amount", "created_at", "sender_id", "receiver_id"]
+    fields += ["violation_codes", "is_flagged"]
+    querysets = [
+        Transaction.objects.using(alias)
+        .filter(created_at__gte=start, created_at__lt=start + timedelta(days=1))
+        .order_by()
+        .values_list(*fields)
+        for alias in get_transaction_databases()
+    ]
+    total = sum(queryset.count() for queryset in querysets)
+    columns = {
+        name: np.empty(total, dtype=dtype) for name, dtype in TRANSACTION_COLUMNS.items()
+    }
+    position = 0
+    for queryset in querysets:
+        rows = queryset.iterator(chunk_size=batch_size)
+        while chunk := list(islice(rows, batch_size)):
+            end = position + len(chunk)
+            ids, amounts, created, senders, receivers, codes, flagged = zip(*chunk)
+            columns["id"][position:end] = [value.bytes for value in ids]
+            columns["amount"][position:end] = [to_minor_units(a) for a in amounts]
+            columns["created_at"][position:end] = [to_micros(c) for c in created]
+            columns["sender"][position:end] = [user_codes[s.bytes] for s in senders]
+            columns["receiver"][position:end] = [user_codes[r.bytes] for r in receivers]
+            columns["violation_codes"][position:end] = codes
+            columns["is_flagged"][position:end] = flagged
+            position = end
+    order = np.argsort(columns["created_at"][:position], kind="stable")
+    _write_columns(
+        _partition_dir(root, day),
+        {name: values[:position][order] for name, values in columns.items()},
+    )
+    return position
+
+
+def export_snapshot(
+    until: date = None, refresh_days: int = None, batch_size: int = 10000
+) -> dict:
+    """Exports users and every complete day before `until` (default today,
+    UTC) that has not been exported or lies within the refresh window.
+    Returns {day: row count} for the partitions written."""
+    root = get_analytics_root()
+    root.mkdir(parents=True, exist_ok=True)
+    until = until or datetime.now(timezone.utc).date()
+    if refresh_days is None:
+        refresh_days = settings.ANALYTICS_REFRESH_DAYS
+    manifest = _read_manifest(root)
+    user_codes = _export_users(root)
+
+    days = set()
+    for alias in get_transaction_databases():
+        days.update(
+            Transaction.objects.using(alias)
+            .filter(created_at__lt=datetime.combine(until, datetime.min.time(), tzinfo=timezone.utc))
+            .annotate(day=TruncDate("created_at", tzinfo=timezone.utc))
+            .order_by()
+            .values_list("day", flat=True)
+            .distinct()
+        )
+    refresh_from = until - timedelta(days=refresh_days)
+    exported = {}
+    for day in sorted(days):
+        if day.isoformat() in manifest["partitions"] and day < refresh_from:
+            continue
+        exported[day.isoformat()] = _export_day(root, day, user_codes, batch_size)
+
+    manifest["partitions"].update(exported)
+    manifest["users"] = len(user_codes)
+    manifest["exported_at"] = datetime.now(timezone.utc).isoformat()
+    tmp_path = root / "manifest.json.tmp"
+    tmp_path.write_text(json.dumps(manifest, sort_keys=True))
+    os.replace(tmp_path, root / "manifest.json")
+    return exported
+
+
+class Columns:
+    """Memory-mapped columns of one directory, loaded on first access"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._columns = {}
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name not in self._columns:
+            self._columns[name] = np.load(self.path / f"{name}.npy", mmap_mode="r")
+        return self._columns[name]
+
+    def __len__(self) -> int:
+        return len(self["id"])
+
+
+class Partition(Columns):
+    def __init__(self, day: date, path: Path):
+        super().__init__(path)
+        self.day = day
+
+
+class Selection:
+    """Rows of several partitions matching a filter. Masks are evaluated
+    per partition, so only the selected values are ever copied."""
+
+    def __init__(self, snapshot: "Snapshot", parts: list):
+        self.snapshot = snapshot
+        self.parts = parts
+
+    def count(self) -> int:
+        return int(sum(np.count_nonzero(mask) for _partition, mask in self.parts))
+
+    def values(self, column: str) -> np.ndarray:
+        arrays = [partition[column][mask] for partition, mask in self.parts]
+        if not arrays:
+            return np.empty(0, dtype=TRANSACTION_COLUMNS[column])
+        return np.concatenate(arrays)
+
+    def sum(self, column: str = "amount") -> int:
+        return int(sum(partition[column][mask].sum() for partition, mask in self.parts))
+
+    def group_by_user(self, by: str = "sender", column: str = None) -> np.ndarray:
+        """Per-user totals of `column` (or row counts), indexed by user code"""
+        totals = np.zeros(len(self.snapshot.users), dtype=np.int64)
+        for partition, mask in self.parts:
+            weights = partition[column][mask] if column else None
+            totals += np.bincount(
+                partition[by][mask], weights=weights, minlength=len(totals)
+            ).astype(np.int64)
+        return totals
+
+    def top_users(self, by: str = "sender", column: str = None, limit: int = 10) -> list:
+        """[(user id, total)] of the users with the largest totals"""
+        totals = self.group_by_user(by, column)
+        codes = np.argsort(totals)[::-1][:limit]
+        return [
+            (self.snapshot.user_id(code), int(totals[code]))
+            for code in codes
+            if totals[code]
+        ]
+
+
+class Snapshot:
+    """Read-only access to the exported columns; never touches the database"""
+
+    def __init__(self, root: Path = None):
+        self.root = Path(root or get_analytics_root())
+        self.manifest = _read_manifest(self.root)
+        self.users = Columns(self.root / "users")
+
+    def user_code(self, user_id):
+        key = uuid.UUID(str(user_id)).bytes
+        matches = np.flatnonzero(self.users["id"] == key)
+        return int(matches[0]) if len(matches) else None
+
+    def user_id(self, code: int) -> uuid.UUID:
+        return uuid.UUID(bytes=bytes(self.users["id"][code]))
+
+    def partitions(self, start: date = None, end: date = None) -> list:
+        """Partitions of days in [start, end]"""
+        partitions = []
+        for day in sorted(self.manifest["partitions"]):
+            day = date.fromisoformat(day)
+            if (start is None or day >= start) and (end is None or day <= end):
+                partitions.append(Partition(day, _partition_dir(self.root, day)))
+        return partitions
+
+    def select(
+        self,
+        start: date = None,
+        end: date = None,
+        sender=None,
+        receiver=None,
+        flagged: bool = None,
+        violation: int = None,
+        min_amount=None,
+        max_amount=None,
+    ) -> Selection:
+        """Transactions of days in [start, end] matching every given filter.
+        Amounts are in major units; violation is a ViolationCode mask."""
+        conditions = []
+        for column, user_id in (("sender", sender), ("receiver", receiver)):
+            if user_id is not None:
+                code = self.user_code(user_id)
+                if code is None:
+                    return Selection(self, [])
+                conditions.append(lambda part, column=column, code=code: part[column] == code)
+        if flagged is not None:
+            conditions.append(lambda part: part["is_flagged"] == flagged)
+        if violation is not None:
+            conditions.append(lambda part: (part["violation_codes"] & int(violation)) != 0)
+        if min_amount is not None:
+            minor = round(min_amount * 100)
+            conditions.append(lambda part: part["amount"] >= minor)
+        if max_amount is not None:
+            minor = round(max_amount * 100)
+            conditions.append(lambda part: part["amount"] <= minor)
+
+        parts = []
+        for partition in self.partitions(start, end):
+            mask = np.ones(len(partition), dtype=bool)
+            for condition in conditions:
+                mask &= condition(partition)
+            parts.append((partition, mask))
+        return Selection(self, parts)
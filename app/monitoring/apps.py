@@ -1,7 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 from django.utils.translation import gettext_lazy as _
 
 
 class MonitoringConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
     name = 'monitoring'
     verbose_name = _('monitoring')
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        post_migrate.connect(signals.create_user_search_index, sender=self)
+        post_migrate.connect(signals.create_flagged_outbox, sender=self)
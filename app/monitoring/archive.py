@@ -0,0 +1,296 @@
+"""Cold storage for old transactions.
+
+Transactions older than the retention horizon are moved out of the hot table
+into gzip compressed JSON-lines segment files partitioned by creation date:
+
+    <ARCHIVE_ROOT>/2023/08/27/seg-20231019T101500123456.jsonl.gz
+    <ARCHIVE_ROOT>/2023/08/27/seg-20231019T101500123456.idx.json
+
+Segments are written once and never modified. Each segment has a small sidecar
+index holding its row ids and the users involved with their row counts, so
+lookups only decompress the segments that can contain a match and a user's
+archive can be counted and paged without decompressing anything else.
+
+A batch's segment is first written under a `.pending` name and only renamed
+into place once the rows are deleted from the database, so a failed batch
+leaves no segment behind. A run interrupted between the two is finished by
+the next one.
+"""
+import gzip
+import json
+import os
+from bisect import bisect_left
+from collections import Counter
+from functools import lru_cache
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction as db_transaction
+from django.db.models.functions import TruncDate
+
+from .models import Transaction
+from .sharding import get_transaction_databases
+
+ARCHIVE_FIELDS = [
+    "id",
+    "sender_id",
+    "receiver_id",
+    "amount",
+    "is_flagged",
+    "violation_codes",
+    "created_at",
+    "updated_at",
+]
+SEGMENT_SUFFIX = ".jsonl.gz"
+INDEX_SUFFIX = ".idx.json"
+PENDING_SUFFIX = ".pending"
+
+
+def get_archive_root() -> Path:
+    return Path(settings.ARCHIVE_ROOT)
+
+
+def _partition_dir(day: date) -> Path:
+    return get_archive_root() / f"{day:%Y}" / f"{day:%m}" / f"{day:%d}"
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as tmp_file:
+        tmp_file.write(data)
+        tmp_file.flush()
+        os.fsync(tmp_file.fileno())
+    os.replace(tmp_path, path)
+
+
+def _index_path(segment_path: Path) -> Path:
+    return segment_path.with_name(
+        segment_path.name[: -len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+    )
+
+
+def _segment_path(index_path: Path) -> Path:
+    return index_path.with_name(index_path.name[: -len(INDEX_SUFFIX)] + SEGMENT_SUFFIX)
+
+
+def _pending(path: Path) -> Path:
+    return path.with_name(path.name + PENDING_SUFFIX)
+
+
+def write_segment(day: date, rows: list, pending: bool = False) -> Path:
+    """Writes rows into a new immutable segment for the given day. A pending
+    segment stays invisible to readers until `publish_segment` is called."""
+    partition = _partition_dir(day)
+    partition.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    segment_path = partition / f"seg-{stamp}{SEGMENT_SUFFIX}"
+
+    payload = "".join(json.dumps(row, cls=DjangoJSONEncoder) + "\n" for row in rows)
+    user_rows = Counter()
+    for row in rows:
+        user_rows.update({str(row["sender_id"]), str(row["receiver_id"])})
+    users = sorted(user_rows)
+    index = {
+        "date": day.isoformat(),
+        "count": len(rows),
+        "ids": sorted(str(row["id"]) for row in rows),
+        "users": users,
+        "user_rows": [user_rows[user] for user in users],
+    }
+    data_path, index_path = segment_path, _index_path(segment_path)
+    if pending:
+        data_path, index_path = _pending(data_path), _pending(index_path)
+    # The index goes last: a segment is visible once its index is in place
+    _write_atomic(data_path, gzip.compress(payload.encode(), compresslevel=9))
+    _write_atomic(index_path, json.dumps(index).encode())
+    return segment_path
+
+
+def publish_segment(segment_path: Path) -> None:
+    """Renames a pending segment into place, index last."""
+    for path in (segment_path, _index_path(segment_path)):
+        if _pending(path).exists():
+            os.replace(_pending(path), path)
+
+
+def discard_segment(segment_path: Path) -> None:
+    for path in (segment_path, _index_path(segment_path)):
+        _pending(path).unlink(missing_ok=True)
+
+
+def recover_pending_segments() -> None:
+    """Finishes segments an interrupted run left pending. Rows of a batch are
+    deleted all at once, so one id tells whether the batch committed: if it
+    did the segment is published, otherwise it is dropped and the rows are
+    archived again."""
+    root = get_archive_root()
+    if not root.exists():
+        return
+    for index_path in root.glob(f"*/*/*/*{INDEX_SUFFIX}{PENDING_SUFFIX}"):
+        segment_path = _segment_path(index_path.with_name(index_path.stem))
+        with open(index_path) as index_file:
+            first_id = json.load(index_file)["ids"][0]
+        committed = not any(
+            Transaction.objects.using(alias).filter(id=first_id).exists()
+            for alias in get_transaction_databases()
+        )
+        if committed:
+            publish_segment(segment_path)
+        else:
+            discard_segment(segment_path)
+    # Written before a run failed to write its index
+    for data_path in root.glob(f"*/*/*/*{SEGMENT_SUFFIX}{PENDING_SUFFIX}"):
+        if not _pending(_index_path(data_path.with_name(data_path.stem))).exists():
+            data_path.unlink()
+
+
+def archive_transactions(before: datetime, batch_size: int = 5000) -> int:
+    """Moves transactions created before `before` into segment files.
+    A batch's segment is published only after its rows are deleted, so a
+    failed batch leaves the hot table untouched and no segment behind."""
+    recover_pending_segments()
+    return sum(
+        _archive_database(alias, before, batch_size)
+        for alias in get_transaction_databases()
+    )
+
+
+def _archive_database(alias: str, before: datetime, batch_size: int) -> int:
+    archived = 0
+    old_transactions = Transaction.objects.using(alias).filter(created_at__lt=before)
+    days = (
+        old_transactions.annotate(day=TruncDate("created_at", tzinfo=timezone.utc))
+        .order_by("day")
+        .values_list("day", flat=True)
+        .distinct()
+    )
+    for day in list(days):
+        day_start = datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc)
+        day_end = datetime.combine(day, datetime.max.time(), tzinfo=timezone.utc)
+        day_queryset = old_transactions.filter(
+            created_at__gte=day_start, created_at__lte=day_end
+        ).order_by("created_at")
+        while True:
+            segment_path = None
+            try:
+                with db_transaction.atomic(using=alias):
+                    rows = list(day_queryset.values(*ARCHIVE_FIELDS)[:batch_size])
+                    if not rows:
+                        break
+                    segment_path = write_segment(day, rows, pending=True)
+                    old_transactions.filter(id__in=[row["id"] for row in rows]).delete()
+            except BaseException:
+                if segment_path is not None:
+                    discard_segment(segment_path)
+                raise
+            publish_segment(segment_path)
+            archived += len(rows)
+    return archived
+
+
+def _index_contains(sorted_values: list, value: str) -> bool:
+    position = bisect_left(sorted_values, value)
+    return position < len(sorted_values) and sorted_values[position] == value
+
+
+@lru_cache(maxsize=4096)
+def _load_index(index_path: Path) -> dict:
+    # Segments never change once published, so their indexes are read once
+    with open(index_path) as index_file:
+        return json.load(index_file)
+
+
+def _iter_indexes() -> Iterator[tuple]:
+    root = get_archive_root()
+    if not root.exists():
+        return
+    for index_path in sorted(root.glob(f"*/*/*/*{INDEX_SUFFIX}"), reverse=True):
+        yield _segment_path(index_path), _load_index(index_path)
+
+
+def _read_segment(segment_path: Path) -> Iterator[dict]:
+    with gzip.open(segment_path, "rt") as segment:
+        for line in segment:
+            yield json.loads(line)
+
+
+def _user_segment_rows(segment_path: Path, user_id: str) -> list:
+    rows = (
+        row
+        for row in _read_segment(segment_path)
+        if user_id in (row["sender_id"], row["receiver_id"])
+    )
+    return sorted(rows, key=lambda row: row["created_at"], reverse=True)
+
+
+def iter_archived_transactions(user_id: Optional[str] = None) -> Iterator[dict]:
+    """Yields archived transactions, newest partitions first.
+    When user_id is given only rows where the user is sender or receiver
+    are returned and segments not involving the user are skipped."""
+    user_id = str(user_id) if user_id is not None else None
+    for segment_path, index in _iter_indexes():
+        if user_id is None:
+            rows = _read_segment(segment_path)
+            yield from sorted(rows, key=lambda row: row["created_at"], reverse=True)
+        elif _index_contains(index["users"], user_id):
+            yield from _user_segment_rows(segment_path, user_id)
+
+
+class ArchivedTransactions:
+    """A user's archived transactions, newest partitions first, as a lazy
+    sequence for pagination. Counting reads only segment indexes and a slice
+    decompresses only the segments it overlaps."""
+
+    def __init__(self, user_id):
+        self.user_id = str(user_id)
+        self._segments = None
+
+    def _get_segments(self) -> list:
+        """(segment path, number of the user's rows) of matching segments"""
+        if self._segments is None:
+            self._segments = []
+            for segment_path, index in _iter_indexes():
+                users = index["users"]
+                position = bisect_left(users, self.user_id)
+                if position == len(users) or users[position] != self.user_id:
+                    continue
+                if "user_rows" in index:
+                    count = index["user_rows"][position]
+                else:  # Written before indexes counted rows per user
+                    count = len(_user_segment_rows(segment_path, self.user_id))
+                self._segments.append((segment_path, count))
+        return self._segments
+
+    def count(self) -> int:
+        return sum(count for _, count in self._get_segments())
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError("ArchivedTransactions only supports slicing")
+        start, stop, _ = key.indices(self.count())
+        rows, offset = [], 0
+        for segment_path, count in self._get_segments():
+            if offset >= stop:
+                break
+            if offset + count > start:
+                segment_rows = _user_segment_rows(segment_path, self.user_id)
+                rows.extend(segment_rows[max(start - offset, 0) : stop - offset])
+            offset += count
+        return rows
+
+
+def get_archived_transaction(transaction_id: str) -> Optional[dict]:
+    transaction_id = str(transaction_id)
+    for segment_path, index in _iter_indexes():
+        if not _index_contains(index["ids"], transaction_id):
+            continue
+        for row in _read_segment(segment_path):
+            if row["id"] == transaction_id:
+                return row
+    return None
@@ -1,5 +1,35 @@
+from enum import IntFlag
+
 TIER_AMOUNT = {
     "T1": 1_000_000.00,  # 1m
     "T2": 2_000_000.00,  # 2m
     "T3": 3_000_000.00,  # 3m
 }
+
+
+class ViolationCode(IntFlag):
+    """Bit flags describing why a transaction was flagged.
+    Stored combined as an integer bitmask on Transaction.violation_codes."""
+
+    NEW_RECIPIENT = 1
+    FLAGGED_RECIPIENT = 2
+    TIER_LIMIT = 4
+    TIMING_WINDOW = 8
+    MAX_AMOUNT = 16
+    AMOUNT_ANOMALY = 32
+
+    @classmethod
+    def all_masks_with(cls, code: "ViolationCode") -> list:
+        """Every possible bitmask value that has `code` set.
+        With few codes this list is small, so `violation_codes IN (...)`
+        stays an indexed lookup instead of a bitwise scan."""
+        full_mask = sum(member.value for member in cls)
+        return [mask for mask in range(1, full_mask + 1) if mask & code]
+
+    @classmethod
+    def names(cls, mask: int) -> list:
+        """Returns lowercased violation names contained in a bitmask"""
+        return [member.name.lower() for member in cls if mask & member]
+
+
+VIOLATION_CHOICES = [(member.name.lower(), member.name.lower()) for member in ViolationCode]
@@ -0,0 +1,126 @@
+import django_filters
+from django.db import connections
+from django.db.models import Q
+from rest_framework import filters
+
+from .enums import VIOLATION_CHOICES, ViolationCode
+from .models import Transaction, User
+from .search import (
+    MATCHING_USER_IDS_SQL,
+    is_search_indexed,
+    match_expression,
+    matching_user_ids,
+    search_users,
+)
+from .sharding import is_sharded
+
+
+class UserFilter(django_filters.FilterSet):
+    created_after = django_filters.IsoDateTimeFilter(
+        field_name="created_at",
+        lookup_expr="gte",
+        help_text="Users created at or after this time e.g. 2023-08-01T00:00:00Z",
+    )
+    created_before = django_filters.IsoDateTimeFilter(
+        field_name="created_at",
+        lookup_expr="lt",
+        help_text="Users created before this time",
+    )
+
+    class Meta:
+        model = User
+        fields = ["tier", "is_flagged", "created_after", "created_before"]
+
+
+class TransactionFilter(django_filters.FilterSet):
+    violation = django_filters.MultipleChoiceFilter(
+        choices=VIOLATION_CHOICES,
+        method="filter_violation",
+        help_text="Filter by violation reason e.g. ?violation=tier_limit",
+    )
+    min_amount = django_filters.NumberFilter(
+        field_name="amount", lookup_expr="gte", help_text="Smallest amount, inclusive"
+    )
+    max_amount = django_filters.NumberFilter(
+        field_name="amount", lookup_expr="lte", help_text="Largest amount, inclusive"
+    )
+    created_after = django_filters.IsoDateTimeFilter(
+        field_name="created_at",
+        lookup_expr="gte",
+        help_text="Transactions made at or after this time e.g. 2023-08-01T00:00:00Z",
+    )
+    created_before = django_filters.IsoDateTimeFilter(
+        field_name="created_at",
+        lookup_expr="lt",
+        help_text="Transactions made before this time",
+    )
+
+    class Meta:
+        model = Transaction
+        fields = [
+            "is_flagged",
+            "violation",
+            "min_amount",
+            "max_amount",
+            "created_after",
+            "created_before",
+        ]
+
+    def filter_violation(self, queryset, name, value):
+        codes = [ViolationCode[reason.upper()] for reason in value]
+        return queryset.with_violations(*codes)
+
+
+def search_user_queryset(queryset, text: str):
+    """Users matching every whitespace separated term of `text`, as the
+    user list's ?search= does"""
+    for term in text.replace(",", " ").split():
+        if is_search_indexed(queryset.db):
+            queryset = search_users(queryset, term)
+        else:
+            queryset = queryset.filter(
+                Q(email__icontains=term) | Q(firstname__icontains=term)
+            )
+    return queryset
+
+
+class UserSearchFilter(filters.SearchFilter):
+    """Matches name and email prefixes through the full-text index
+    (see monitoring.search) instead of scanning with icontains."""
+
+    def filter_queryset(self, request, queryset, view):
+        if not is_search_indexed(queryset.db):
+            return super().filter_queryset(request, queryset, view)
+        for term in self.get_search_terms(request):
+            queryset = search_users(queryset, term)
+        return queryset
+
+
+class TransactionSearchFilter(filters.SearchFilter):
+    """Finds transactions whose sender or receiver name matches, through
+    the user full-text index. Transaction shards do not have the user table,
+    so when sharded the term is matched among the users on the shard's
+    transactions first, and only those ids are sent back to the shard."""
+
+    def filter_queryset(self, request, queryset, view):
+        if not is_search_indexed():
+            return super().filter_queryset(request, queryset, view)
+        for term in self.get_search_terms(request):
+            if is_sharded():
+                counterparty_ids = set()
+                for ids in queryset.order_by().values_list("sender_id", "receiver_id"):
+                    counterparty_ids.update(ids)
+                user_ids = matching_user_ids(term, among=counterparty_ids)
+                queryset = queryset.filter(
+                    Q(sender_id__in=user_ids) | Q(receiver_id__in=user_ids)
+                )
+                continue
+            table = connections[queryset.db].ops.quote_name(Transaction._meta.db_table)
+            queryset = queryset.extra(
+                where=[
+                    f"({table}.sender_id IN ({MATCHING_USER_IDS_SQL})"
+                    f" OR {table}.receiver_id IN ({MATCHING_USER_IDS_SQL}))"
+                ],
+                params=[match_expression(term)] * 2,
+            )
+        return queryset
@@ -0,0 +1,193 @@
+"""Idempotency-Key support for endpoints that create records.
+
+The first request carrying a key claims it by inserting an `IdempotencyKey`
+row (unique on user and key) before doing any work. Once it succeeds the
+response is stored on the row and in the cache, so a retry is answered with
+one cache (or indexed row) lookup instead of being evaluated and inserted
+again. A retry that arrives while the original is still running gets 409; a
+claim older than IDEMPOTENCY_LOCK_SECONDS is assumed to belong to a crashed
+request and can be taken over. Failed requests release their claim.
+
+The view runs in one transaction on "default" with the write storing its
+response, so a crash cannot commit the record without the response (and a
+retry then make it again). The transaction opens with a write to the key's
+row, which takes SQLite's write lock before the view reads anything. With
+sharded transactions the record is committed to its shard just before
+"default" and deleted again if "default" does not commit (see
+`atomic_with_shards`). Only a process dying between the two commits leaves a
+record whose key is claimed but has no response; retries then get 409 until
+the claim goes stale.
+"""
+import functools
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.db import transaction as db_transaction
+from django.db.models import F
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions, status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+from .sharding import atomic_with_shards
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyKeyInUse(exceptions.APIException):
+    status_code = 409
+    default_detail = _("A request with this Idempotency-Key is still in progress.")
+    default_code = "idempotency_key_in_use"
+
+
+class IdempotencyKeyMismatch(exceptions.APIException):
+    status_code = 422
+    default_detail = _("This Idempotency-Key was used with a different request.")
+    default_code = "idempotency_key_mismatch"
+
+
+def request_fingerprint(request) -> str:
+    data = request.data
+    if hasattr(data, "lists"):
+        data = dict(data.lists())
+    payload = json.dumps(
+        [request.method, request.path, data], sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _cache_key(user_id, key: str) -> str:
+    # Hashed because keys are client supplied and may not be valid cache keys
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f"idempotency:{user_id}:{digest}"
+
+
+def _stored(record: IdempotencyKey) -> dict:
+    return {
+        "fingerprint": record.fingerprint,
+        "status": record.status_code,
+        "data": record.response,
+    }
+
+
+def claim(user, key: str, fingerprint: str):
+    """Claims `key` for a new request and returns None, or returns the
+    stored response of the request that already completed with it."""
+    cache_key = _cache_key(user.pk, key)
+    if (stored := cache.get(cache_key)) is not None:
+        return stored
+    now = datetime.now(timezone.utc)
+    expires_at = now + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    for _attempt in range(2):
+        try:
+            with db_transaction.atomic():
+                IdempotencyKey.objects.create(
+                    user=user,
+                    key=key,
+                    fingerprint=fingerprint,
+                    locked_at=now,
+                    expires_at=expires_at,
+                )
+            return None
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if record is None:  # released or swept in between
+            continue
+        if record.expires_at <= now:
+            IdempotencyKey.objects.filter(pk=record.pk, expires_at__lte=now).delete()
+            continue
+        if record.status_code is not None:
+            stored = _stored(record)
+            cache.set(cache_key, stored, settings.IDEMPOTENCY_CACHE_SECONDS)
+            return stored
+        stale_before = now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+        if record.locked_at < stale_before and IdempotencyKey.objects.filter(
+            pk=record.pk, locked_at=record.locked_at, status_code__isnull=True
+        ).update(locked_at=now, fingerprint=fingerprint):
+            return None
+        break
+    raise IdempotencyKeyInUse()
+
+
+def lock(user, key: str) -> None:
+    """Writes the claimed row without changing it, to take the write lock"""
+    IdempotencyKey.objects.filter(user=user, key=key).update(locked_at=F("locked_at"))
+
+
+def complete(user, key: str, fingerprint: str, response: Response) -> None:
+    """Stores the response; cached once the current transaction commits"""
+    IdempotencyKey.objects.filter(user=user, key=key).update(
+        status_code=response.status_code, response=response.data
+    )
+    stored = {
+        "fingerprint": fingerprint,
+        "status": response.status_code,
+        "data": response.data,
+    }
+    db_transaction.on_commit(
+        lambda: cache.set(
+            _cache_key(user.pk, key), stored, settings.IDEMPOTENCY_CACHE_SECONDS
+        )
+    )
+
+
+def release(user, key: str) -> None:
+    IdempotencyKey.objects.filter(user=user, key=key, status_code__isnull=True).delete()
+
+
+def replay(stored: dict, fingerprint: str) -> Response:
+    if stored["fingerprint"] != fingerprint:
+        raise IdempotencyKeyMismatch()
+    return Response(
+        stored["data"], status=stored["status"], headers={REPLAYED_HEADER: "true"}
+    )
+
+
+def idempotent(view_method):
+    """Makes a view method honour the Idempotency-Key header. Only
+    successful responses are stored; errors can be retried with the key."""
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return view_method(self, request, *args, **kwargs)
+        if not 0 < len(key) <= MAX_KEY_LENGTH:
+            raise exceptions.ValidationError(
+                {IDEMPOTENCY_HEADER: f"Must be 1 to {MAX_KEY_LENGTH} characters long."}
+            )
+        fingerprint = request_fingerprint(request)
+        if (stored := claim(request.user, key, fingerprint)) is not None:
+            return replay(stored, fingerprint)
+        try:
+            with atomic_with_shards():
+                lock(request.user, key)
+                response = view_method(self, request, *args, **kwargs)
+                if status.is_success(response.status_code):
+                    complete(request.user, key, fingerprint, response)
+        except BaseException:
+            release(request.user, key)
+            raise
+        if not status.is_success(response.status_code):
+            release(request.user, key)
+        return response
+
+    return wrapper
+
+
+def purge_expired_keys(batch_size: int = 5000) -> int:
+    """Deletes expired keys in batches; returns how many were deleted"""
+    now = datetime.now(timezone.utc)
+    deleted = 0
+    while True:
+        expired = IdempotencyKey.objects.filter(expires_at__lte=now)
+        expired = list(expired.values_list("pk", flat=True)[:batch_size])
+        if not expired:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=expired).delete()[0]
@@ -0,0 +1,344 @@
+"""Live feed of flagged transactions over server-sent events.
+
+Every path that flags a transaction, when it is created or later (deferred
+rules, rescoring, admin actions), lands a row in the commit-ordered outbox of
+its database (see monitoring.outbox). A `FlaggedPoller` thread reads the new
+outbox rows of every transaction database and publishes their transactions
+to an in-process `FlaggedFeed`, so a stream sees flags set by any process.
+The feed keeps the last LIVE_FEED_BUFFER_SIZE events in a ring buffer and
+fans each event out to the bounded queue of every connected admin.
+
+The stream is a plain ASGI application mounted in front of Django (see
+core/asgi.py), so an idle connection costs one coroutine and a queue rather
+than a thread. A client that falls more than LIVE_FEED_QUEUE_SIZE events
+behind is disconnected instead of buffering without limit; EventSource then
+reconnects with `Last-Event-ID` and the missed events are replayed from the
+ring buffer.
+
+Each serving process polls on its own once its first stream connects, so
+production serves the stream from one process of its own (the `feed` mode
+of core/serving.py) rather than from every API worker.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from urllib.parse import parse_qs
+from uuid import UUID
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from rest_framework.exceptions import NotAuthenticated, NotFound, PermissionDenied
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from .models import Transaction
+from .outbox import OUTBOX_SIZE, last_seq, read_outbox
+from .sharding import get_transaction_databases
+
+logger = logging.getLogger(__name__)
+
+STREAM_PATH = "/api/v1/transaction/flagged/stream/"
+
+
+def transaction_event(transaction: Transaction) -> dict:
+    return {
+        "id": str(transaction.id),
+        "sender": str(transaction.sender_id),
+        "receiver": str(transaction.receiver_id),
+        "amount": str(transaction.amount),
+        "violations": transaction.violations,
+        "violation_codes": transaction.violation_codes,
+        "created_at": transaction.created_at.isoformat(),
+        "updated_at": transaction.updated_at.isoformat(),
+    }
+
+
+class Subscriber:
+    def __init__(self, queue_size: int):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.loop = asyncio.get_running_loop()
+        self.closed = False
+
+    def deliver(self, event: tuple) -> None:
+        """Runs on the subscriber's event loop"""
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.close()
+
+    def close(self) -> None:
+        """Drops pending events and wakes the consumer with the None sentinel"""
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class FlaggedFeed:
+    """In-process pub/sub with a bounded replay buffer.
+
+    Event ids are microsecond timestamps forced to increase, so a
+    Last-Event-ID handed out by another process still means "after this
+    moment" here.
+    """
+
+    def __init__(self, buffer_size: int = None, queue_size: int = None):
+        self.buffer = deque(maxlen=buffer_size or settings.LIVE_FEED_BUFFER_SIZE)
+        self.queue_size = queue_size or settings.LIVE_FEED_QUEUE_SIZE
+        self.subscribers = set()
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def publish(self, data: dict) -> int:
+        """Thread safe; called from sync request handlers"""
+        with self._lock:
+            self._last_id = max(self._last_id + 1, time.time_ns() // 1000)
+            event = (self._last_id, data)
+            self.buffer.append(event)
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.deliver, event)
+            except RuntimeError:  # loop closed
+                self.unsubscribe(subscriber)
+        return event[0]
+
+    def subscribe(self, last_event_id: int = None) -> Subscriber:
+        """Must be called from the event loop serving the connection.
+        Events after last_event_id still in the buffer are queued first."""
+        with self._lock:
+            replay = [
+                event
+                for event in self.buffer
+                if last_event_id is not None and event[0] > last_event_id
+            ]
+            subscriber = Subscriber(self.queue_size + len(replay))
+            for event in replay:
+                subscriber.deliver(event)
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            self.subscribers.discard(subscriber)
+
+
+class FlaggedPoller:
+    """Publishes transactions flagged by any process to a feed.
+
+    Keeps the last outbox seq read from each database. Outbox rows appear in
+    commit order, so a transaction flagged by a slow writer is still read
+    after it commits. A transaction flagged again (e.g. with another
+    violation) is published again.
+    """
+
+    def __init__(self, feed: FlaggedFeed, interval: float = None):
+        self.feed = feed
+        self.interval = interval or settings.LIVE_FEED_POLL_SECONDS
+        # In the outbox's flagged_at format
+        self.started_at = f"{datetime.now(timezone.utc):%Y-%m-%d %H:%M:%S.%f}"[:-3]
+        self.cursors = {}  # alias: last outbox seq read
+        self._thread = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def poll(self) -> int:
+        """Publishes rows flagged since the last poll; returns their number"""
+        count = 0
+        for alias in get_transaction_databases():
+            if alias not in self.cursors:
+                # Flags set before the poller was created are not news
+                self.cursors[alias] = last_seq(alias, flagged_before=self.started_at)
+            entries = read_outbox(alias, after=self.cursors[alias])
+            if not entries:
+                continue
+            if self.cursors[alias] and entries[0][0] > self.cursors[alias] + 1:
+                logger.warning(
+                    "Flagged feed fell more than %s transactions behind on %s",
+                    OUTBOX_SIZE,
+                    alias,
+                )
+            transactions = Transaction.objects.using(alias).in_bulk(
+                {transaction_id for _seq, transaction_id in entries}
+            )
+            for _seq, transaction_id in entries:
+                transaction = transactions.get(UUID(transaction_id))
+                if transaction is not None and transaction.is_flagged:
+                    self.feed.publish(transaction_event(transaction))
+                    count += 1
+            self.cursors[alias] = entries[-1][0]
+        return count
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="flagged-poller", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Polling flagged transactions failed")
+                # Reconnect on the next poll
+                connections.close_all()
+
+
+_feed = None
+_poller = None
+_feed_lock = threading.Lock()
+
+
+def get_feed() -> FlaggedFeed:
+    global _feed
+    if _feed is None:
+        with _feed_lock:
+            if _feed is None:
+                _feed = FlaggedFeed()
+    return _feed
+
+
+def get_poller() -> FlaggedPoller:
+    global _poller
+    if _poller is None:
+        feed = get_feed()
+        with _feed_lock:
+            if _poller is None:
+                _poller = FlaggedPoller(feed)
+    return _poller
+
+
+def reset_feed() -> None:
+    global _feed, _poller
+    if _poller is not None:
+        _poller.stop()
+    _feed = _poller = None
+
+
+def format_event(event: tuple) -> bytes:
+    event_id, data = event
+    return f"id: {event_id}\nevent: flagged\ndata: {json.dumps(data)}\n\n".encode()
+
+
+def _get_header(scope: dict, name: bytes):
+    for key, value in scope.get("headers", []):
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _authenticate(raw_token: str):
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+async def _send_json(send, status: int, data: dict) -> None:
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json")],
+        }
+    )
+    await send({"type": "http.response.body", "body": json.dumps(data).encode()})
+
+
+async def _send_chunk(send, body: bytes) -> None:
+    await send({"type": "http.response.body", "body": body, "more_body": True})
+
+
+async def _wait_for_disconnect(receive) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def flagged_stream(scope, receive, send):
+    """ASGI application streaming flagged transactions to admins.
+    EventSource cannot set headers, so the access token may also be
+    passed as `?token=`."""
+    query = parse_qs(scope.get("query_string", b"").decode())
+    scheme, _, raw_token = (_get_header(scope, b"authorization") or "").partition(" ")
+    if scheme != "Bearer":
+        raw_token = query.get("token", [None])[0]
+    user = await sync_to_async(_authenticate)(raw_token) if raw_token else None
+    if user is None:
+        await _send_json(send, 401, {"detail": str(NotAuthenticated.default_detail)})
+        return
+    if not user.is_admin:
+        await _send_json(send, 403, {"detail": str(PermissionDenied.default_detail)})
+        return
+
+    last_event_id = _get_header(scope, b"last-event-id")
+    last_event_id = last_event_id or query.get("last_event_id", [""])[0]
+    feed = get_feed()
+    get_poller().start()
+    subscriber = feed.subscribe(int(last_event_id) if last_event_id.isdigit() else None)
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no"),
+                ],
+            }
+        )
+        await _send_chunk(send, f"retry: {settings.LIVE_FEED_RETRY_MS}\n\n".encode())
+        while True:
+            next_event = asyncio.ensure_future(subscriber.queue.get())
+            done, _pending = await asyncio.wait(
+                {next_event, disconnected},
+                timeout=settings.LIVE_FEED_HEARTBEAT_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnected in done:
+                next_event.cancel()
+                return
+            if next_event not in done:
+                next_event.cancel()
+                await _send_chunk(send, b": ping\n\n")
+                continue
+            event = next_event.result()
+            if event is None:  # fell behind; the client reconnects and replays
+                break
+            await _send_chunk(send, format_event(event))
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        disconnected.cancel()
+        feed.unsubscribe(subscriber)
+
+
+async def not_found(scope, receive, send):
+    """Answers every other path when the feed is served alone"""
+    if scope["type"] == "http":
+        await _send_json(send, 404, {"detail": str(NotFound.default_detail)})
+
+
+def with_live_feed(application):
+    """Wraps the Django ASGI application, serving STREAM_PATH itself"""
+
+    async def router(scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == STREAM_PATH:
+            return await flagged_stream(scope, receive, send)
+        return await application(scope, receive, send)
+
+    return router
@@ -0,0 +1,291 @@
+"""Synthetic data and traffic for capacity testing.
+
+`seed_users`/`seed_transactions` bulk insert realistic volumes of data and
+`LoadDriver` replays concurrent login, transfer and list traffic against a
+running server. Both are exposed as management commands:
+
+    python manage.py seed_load_data --users 100000 --transactions 2000000
+    python manage.py run_load_test --base-url http://localhost:8000
+"""
+import base64
+import json
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Iterator
+
+from django.contrib.auth.hashers import make_password
+from common.models import preserve_timestamps
+from django.db import transaction as db_transaction
+
+from .enums import TIER_AMOUNT, ViolationCode
+from .models import AmountStatistics, Transaction, User
+from .utils import MAX_TRANSACTION_AMOUNT
+
+LOADTEST_EMAIL = "loadtest{}@example.com"
+LOADTEST_PASSWORD = "loadtest@@@111"
+
+TIER_WEIGHTS = {"T1": 0.7, "T2": 0.2, "T3": 0.1}
+FLAGGED_USER_RATE = 0.005
+NEW_RECIPIENT_RATE = 0.02
+# Median transfer of ~25k with a long tail; roughly 2% exceed a T1 limit.
+AMOUNT_LOG_MEAN = math.log(25_000)
+AMOUNT_LOG_SIGMA = 1.6
+TIMING_WINDOW_SECONDS = 60
+
+
+def _chunks(iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def seed_users(
+    count: int,
+    start_date: datetime,
+    end_date: datetime,
+    batch_size: int = 5000,
+    rng=random,
+):
+    """Bulk creates `count` active load-test users joining between the given
+    dates and returns (id, tier, is_flagged) tuples for transaction generation."""
+    # Hashing is deliberately slow, so every seeded user shares one hash.
+    password_hash = make_password(LOADTEST_PASSWORD)
+    offset = User.objects.filter(email__startswith="loadtest").count()
+    tiers, weights = zip(*TIER_WEIGHTS.items())
+    span_seconds = max((end_date - start_date).total_seconds(), 1)
+    created = []
+
+    def build():
+        for number in range(offset, offset + count):
+            created_at = start_date + timedelta(seconds=rng.uniform(0, span_seconds))
+            yield User(
+                email=LOADTEST_EMAIL.format(number),
+                password=password_hash,
+                firstname=f"Load{number}",
+                is_active=True,
+                is_flagged=rng.random() < FLAGGED_USER_RATE,
+                tier=rng.choices(tiers, weights)[0],
+                created_at=created_at,
+                updated_at=created_at,
+            )
+
+    with preserve_timestamps(User):
+        for chunk in _chunks(build(), batch_size):
+            with db_transaction.atomic():
+                User.objects.bulk_create(chunk, batch_size=batch_size)
+            created.extend((user.id, user.tier, user.is_flagged) for user in chunk)
+    return created
+
+
+def seed_transactions(
+    users: list, count: int, start_date: datetime, batch_size: int = 5000, rng=random
+) -> int:
+    """Bulk creates `count` transactions between the given users in
+    chronological order. Gaps between transfers are exponentially distributed,
+    senders are skewed towards a minority of heavy users and flags are derived
+    from the same rules evaluate_policy applies. Bulk inserts skip the
+    post_save handler, so the senders' amount statistics are accumulated
+    alongside and written in bulk at the end."""
+    user_count = len(users)
+    if user_count < 2:  # every transfer needs a receiver besides its sender
+        return 0
+    span_seconds = max((datetime.now(timezone.utc) - start_date).total_seconds(), 1)
+    mean_gap = span_seconds / max(count, 1)
+    last_sent = {}
+    stats = {}
+    for chunk in _chunks((user_id for user_id, _, _ in users), batch_size):
+        stats.update(AmountStatistics.objects.in_bulk(chunk))
+    existing = set(stats)
+
+    def build():
+        moment = start_date
+        for _ in range(count):
+            moment += timedelta(seconds=rng.expovariate(1 / mean_gap))
+            sender_id, tier, _ = users[int(user_count * rng.random() ** 2)]
+            receiver_id = sender_id
+            while receiver_id == sender_id:
+                receiver_id, _, receiver_flagged = users[rng.randrange(user_count)]
+            amount = round(
+                min(rng.lognormvariate(AMOUNT_LOG_MEAN, AMOUNT_LOG_SIGMA), 10_000_000), 2
+            )
+            codes = 0
+            if rng.random() < NEW_RECIPIENT_RATE:
+                codes |= ViolationCode.NEW_RECIPIENT
+            if receiver_flagged:
+                codes |= ViolationCode.FLAGGED_RECIPIENT
+            if amount > TIER_AMOUNT[tier]:
+                codes |= ViolationCode.TIER_LIMIT
+            previous = last_sent.get(sender_id)
+            if previous and (moment - previous).total_seconds() < TIMING_WINDOW_SECONDS:
+                codes |= ViolationCode.TIMING_WINDOW
+            if amount > MAX_TRANSACTION_AMOUNT:
+                codes |= ViolationCode.MAX_AMOUNT
+            last_sent[sender_id] = moment
+            if sender_id not in stats:
+                stats[sender_id] = AmountStatistics(user_id=sender_id)
+            stats[sender_id].observe(amount)
+            stats[sender_id].last_sent_at = moment
+            yield Transaction(
+                sender_id=sender_id,
+                receiver_id=receiver_id,
+                amount=Decimal(str(amount)),
+                is_flagged=bool(codes),
+                violation_codes=int(codes),
+                created_at=moment,
+                updated_at=moment,
+            )
+
+    created = 0
+    with preserve_timestamps(Transaction):
+        for chunk in _chunks(build(), batch_size):
+            with db_transaction.atomic():
+                Transaction.objects.bulk_create(chunk, batch_size=batch_size)
+            created += len(chunk)
+    with db_transaction.atomic():
+        AmountStatistics.objects.bulk_create(
+            [row for user_id, row in stats.items() if user_id not in existing],
+            batch_size=batch_size,
+        )
+        AmountStatistics.objects.bulk_update(
+            [row for user_id, row in stats.items() if user_id in existing],
+            ["count", "mean", "m2", "ewm_mean", "ewm_var", "last_sent_at"],
+            batch_size=batch_size,
+        )
+    return created
+
+
+def percentile(sorted_values: list, percent: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(percent / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+class LoadDriver:
+    """Replays a weighted mix of login, transfer and list requests from
+    `concurrency` threads, each acting as a different seeded user."""
+
+    def __init__(
+        self,
+        base_url: str,
+        concurrency: int = 10,
+        duration: float = 30.0,
+        user_pool: int = 1000,
+        mix: dict = None,
+        timeout: float = 10.0,
+        rng=random,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.duration = duration
+        self.user_pool = user_pool
+        self.mix = mix or {"login": 1, "transfer": 3, "list": 6}
+        self.timeout = timeout
+        self.rng = rng
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._recipients = []
+        self._lock = threading.Lock()
+
+    def _request(self, method: str, path: str, token: str = None, body: dict = None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(
+            self.base_url + path, data=data, method=method
+        )
+        request.add_header("Content-Type", "application/json")
+        if token:
+            request.add_header("Authorization", "Bearer " + token)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read() or b"null")
+
+    def _timed(self, operation: str, method: str, path: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = self._request(method, path, **kwargs)
+        except (urllib.error.URLError, OSError, ValueError):
+            with self._lock:
+                self.errors[operation] += 1
+            return None
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies[operation].append(elapsed)
+        return result
+
+    def _login(self, number: int):
+        credentials = {
+            "email": LOADTEST_EMAIL.format(number),
+            "password": LOADTEST_PASSWORD,
+        }
+        result = self._timed("login", "POST", "/api/v1/auth/login/", body=credentials)
+        if not result:
+            return None, None
+        token = result["access"]
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return token, claims["user_id"]
+
+    def _worker(self, deadline: float):
+        number = self.rng.randrange(self.user_pool)
+        token, user_id = self._login(number)
+        if not token:
+            return
+        with self._lock:
+            self._recipients.append(user_id)
+        operations, weights = zip(*self.mix.items())
+        while time.monotonic() < deadline:
+            operation = self.rng.choices(operations, weights)[0]
+            if operation == "login":
+                new_token, new_user_id = self._login(self.rng.randrange(self.user_pool))
+                if new_token:
+                    token, user_id = new_token, new_user_id
+            elif operation == "transfer":
+                recipients = [rid for rid in self._recipients if rid != user_id]
+                if not recipients:
+                    continue
+                body = {
+                    "recipient": self.rng.choice(recipients),
+                    "amount": f"{self.rng.lognormvariate(AMOUNT_LOG_MEAN, 1):.2f}",
+                }
+                self._timed("transfer", "POST", "/api/v1/transaction/", token=token, body=body)
+            else:
+                self._timed("list", "GET", "/api/v1/transaction/", token=token)
+
+    def run(self) -> dict:
+        deadline = time.monotonic() + self.duration
+        started = time.perf_counter()
+        threads = [
+            threading.Thread(target=self._worker, args=(deadline,), daemon=True)
+            for _ in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.report(time.perf_counter() - started)
+
+    def report(self, elapsed: float) -> dict:
+        summary = {}
+        for operation in sorted(set(self.latencies) | set(self.errors)):
+            values = sorted(self.latencies[operation])
+            summary[operation] = {
+                "requests": len(values),
+                "errors": self.errors[operation],
+                "throughput": len(values) / elapsed if elapsed else 0.0,
+                "p50_ms": percentile(values, 50) * 1000,
+                "p90_ms": percentile(values, 90) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+            }
+        return summary
@@ -0,0 +1,24 @@
+import threading
+import zlib
+from contextlib import contextmanager
+
+
+class StripedLock:
+    """A fixed pool of locks shared out by key hash.
+    Work for the same key is serialized while different keys almost always
+    land on different stripes and proceed in parallel, without keeping a
+    lock per key alive."""
+
+    def __init__(self, stripes: int = 256):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def stripe(self, key) -> int:
+        return zlib.crc32(str(key).encode()) % len(self._locks)
+
+    @contextmanager
+    def hold(self, key):
+        with self._locks[self.stripe(key)]:
+            yield
+
+
+sender_locks = StripedLock()
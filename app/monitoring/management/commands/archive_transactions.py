@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from monitoring.archive import archive_transactions
+from monitoring.search import rebuild_search_index
+from monitoring.sharding import get_transaction_databases
+
+
+class Command(BaseCommand):
+    help = "Move transactions older than the retention horizon into archive segments."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.TRANSACTION_RETENTION_DAYS,
+            help="Archive transactions created more than this many days ago.",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--vacuum",
+            action="store_true",
+            help="Reclaim freed space once archiving completes (SQLite only).",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = datetime.now(timezone.utc) - timedelta(days=options["days"])
+        archived = archive_transactions(cutoff, batch_size=options["batch_size"])
+        if options["vacuum"] and archived:
+            for alias in get_transaction_databases():
+                connection = connections[alias]
+                if connection.vendor == "sqlite":
+                    with connection.cursor() as cursor:
+                        cursor.execute("VACUUM")
+            # VACUUM may renumber the user rowids the search index refers to.
+            rebuild_search_index()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Archived {archived} transaction(s) created before {cutoff:%Y-%m-%d %H:%M}."
+            )
+        )
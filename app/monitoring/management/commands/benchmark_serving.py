@@ -0,0 +1,76 @@
+import json
+
+from core.serving import BASELINE, MODES, running_server
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from monitoring.loadtest import LoadDriver
+
+
+class Command(BaseCommand):
+    help = (
+        "Start the API in each serving mode in turn, replay the same load test "
+        "against it and compare throughput and latency. Seed the database with "
+        "`seed_load_data` first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--modes",
+            default=",".join([BASELINE, *MODES]),
+            help="Comma-separated serving modes to compare.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="Worker processes per mode (default: one per CPU).",
+        )
+        parser.add_argument("--port", type=int, default=8100)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--duration", type=float, default=30.0, help="Seconds")
+        parser.add_argument("--user-pool", type=int, default=1000)
+        parser.add_argument("--mix", default="login:1,transfer:3,list:6")
+        parser.add_argument("--json", action="store_true", help="Output raw JSON")
+
+    def handle(self, *args, **options):
+        modes = [mode.strip() for mode in options["modes"].split(",") if mode.strip()]
+        unknown = set(modes) - {BASELINE, *MODES}
+        if unknown:
+            raise CommandError(f"Unknown modes: {', '.join(sorted(unknown))}")
+        mix = {
+            name: float(weight)
+            for name, weight in (item.split(":") for item in options["mix"].split(","))
+        }
+        if connection.vendor == "sqlite":
+            self.stderr.write(
+                "SQLite takes one writer at a time: beyond a few workers, more "
+                "processes add lock waits and transfer errors, not throughput. "
+                "Compare modes at the same --workers."
+            )
+        results = {}
+        for mode in modes:
+            self.stderr.write(f"Benchmarking {mode}...")
+            with running_server(mode, options["port"], options["workers"]) as base_url:
+                driver = LoadDriver(
+                    base_url,
+                    concurrency=options["concurrency"],
+                    duration=options["duration"],
+                    user_pool=options["user_pool"],
+                    mix=mix,
+                )
+                results[mode] = driver.run()
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(
+            f"{'mode':<10}{'operation':<10}{'requests':>10}{'errors':>8}"
+            f"{'req/s':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}"
+        )
+        for mode, summary in results.items():
+            for operation, stats in summary.items():
+                self.stdout.write(
+                    f"{mode:<10}{operation:<10}{stats['requests']:>10}"
+                    f"{stats['errors']:>8}{stats['throughput']:>10.1f}"
+                    f"{stats['p50_ms']:>10.1f}{stats['p90_ms']:>10.1f}"
+                    f"{stats['p99_ms']:>10.1f}"
+                )
@@ -0,0 +1,41 @@
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Export complete days of transactions into columnar analytics partitions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--until",
+            type=date.fromisoformat,
+            help="Export days before this date (YYYY-MM-DD, default today UTC).",
+        )
+        parser.add_argument(
+            "--refresh-days",
+            type=int,
+            default=settings.ANALYTICS_REFRESH_DAYS,
+            help="Re-export this many already exported days before --until.",
+        )
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        try:
+            from monitoring.analytics import export_snapshot
+        except ImportError as error:
+            raise CommandError(f"Analytics snapshots require numpy: {error}")
+
+        exported = export_snapshot(
+            until=options["until"],
+            refresh_days=options["refresh_days"],
+            batch_size=options["batch_size"],
+        )
+        for day, rows in sorted(exported.items()):
+            self.stdout.write(f"{day}: {rows} transaction(s)")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Exported {len(exported)} partition(s) to {settings.ANALYTICS_ROOT}."
+            )
+        )
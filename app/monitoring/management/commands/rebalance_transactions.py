@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from monitoring.sharding import get_shards, rebalance
+
+
+class Command(BaseCommand):
+    help = (
+        "Move transactions into the shard of their sender, e.g. after "
+        "changing TRANSACTION_SHARDS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        moved = rebalance(batch_size=options["batch_size"])
+        for alias, count in sorted(moved.items()):
+            self.stdout.write(f"Moved {count} transaction(s) out of {alias}.")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Transactions balanced across {', '.join(get_shards())}."
+            )
+        )
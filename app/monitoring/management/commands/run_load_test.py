@@ -0,0 +1,56 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from monitoring.loadtest import LoadDriver
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay concurrent login, transfer and list traffic against a running "
+        "server seeded with `seed_load_data`, then report throughput and latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://localhost:8000")
+        parser.add_argument("--concurrency", type=int, default=10)
+        parser.add_argument("--duration", type=float, default=30.0, help="Seconds")
+        parser.add_argument(
+            "--user-pool",
+            type=int,
+            default=1000,
+            help="Number of seeded users to log in as.",
+        )
+        parser.add_argument(
+            "--mix",
+            default="login:1,transfer:3,list:6",
+            help="Relative weights of each operation.",
+        )
+        parser.add_argument("--json", action="store_true", help="Output raw JSON")
+
+    def handle(self, *args, **options):
+        mix = {
+            name: float(weight)
+            for name, weight in (item.split(":") for item in options["mix"].split(","))
+        }
+        driver = LoadDriver(
+            options["base_url"],
+            concurrency=options["concurrency"],
+            duration=options["duration"],
+            user_pool=options["user_pool"],
+            mix=mix,
+        )
+        summary = driver.run()
+        if options["json"]:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+        self.stdout.write(
+            f"{'operation':<10}{'requests':>10}{'errors':>8}{'req/s':>10}"
+            f"{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}"
+        )
+        for operation, stats in summary.items():
+            self.stdout.write(
+                f"{operation:<10}{stats['requests']:>10}{stats['errors']:>8}"
+                f"{stats['throughput']:>10.1f}{stats['p50_ms']:>10.1f}"
+                f"{stats['p90_ms']:>10.1f}{stats['p99_ms']:>10.1f}"
+            )
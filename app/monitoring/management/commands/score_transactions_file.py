@@ -0,0 +1,70 @@
+import csv
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from monitoring.scoring import OUTPUT_FIELDS, output_row, read_records, score_records
+
+
+class Command(BaseCommand):
+    help = "Score a CSV or JSONL file of transfers against the policy rules."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file of transfers.")
+        parser.add_argument("--format", choices=["csv", "jsonl"], dest="file_format")
+        parser.add_argument("--output", help="Write results here instead of stdout.")
+        parser.add_argument(
+            "--output-format", choices=["csv", "jsonl"], default="jsonl"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Scoring processes; 0 scores in this process.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument(
+            "--all", action="store_true", help="Output every record, not only flagged."
+        )
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options["path"]):
+            raise CommandError(f"No such file: {options['path']}")
+        output = open(options["output"], "w", newline="") if options["output"] else None
+        stream = output or self.stdout
+        writer = None
+        if options["output_format"] == "csv":
+            writer = csv.DictWriter(stream, fieldnames=OUTPUT_FIELDS)
+            writer.writeheader()
+
+        started = time.perf_counter()
+        total = flagged = skipped = 0
+        try:
+            records = read_records(options["path"], options["file_format"])
+            for scored, chunk_skipped in score_records(
+                records, workers=options["workers"], chunk_size=options["chunk_size"]
+            ):
+                skipped += chunk_skipped
+                for record, codes in scored:
+                    total += 1
+                    flagged += bool(codes)
+                    if not (codes or options["all"]):
+                        continue
+                    row = output_row(record, codes)
+                    if writer:
+                        row["violations"] = " ".join(row["violations"])
+                        writer.writerow(row)
+                    else:
+                        stream.write(json.dumps(row) + "\n")
+        finally:
+            if output:
+                output.close()
+
+        elapsed = time.perf_counter() - started
+        rate = total / elapsed if elapsed else 0
+        self.stderr.write(
+            f"Scored {total} record(s), {flagged} flagged, {skipped} skipped "
+            f"in {elapsed:.1f}s ({rate:,.0f}/s)."
+        )
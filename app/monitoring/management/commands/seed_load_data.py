@@ -0,0 +1,52 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+
+from monitoring.loadtest import seed_transactions, seed_users
+
+
+class Command(BaseCommand):
+    help = "Bulk insert synthetic users and transactions for capacity testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10_000)
+        parser.add_argument("--transactions", type=int, default=100_000)
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=30,
+            help="Spread transactions over this many days up to now.",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, help="Seed for reproducible data.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        now = datetime.now(timezone.utc)
+        start_date = now - timedelta(days=options["days"])
+        started = time.perf_counter()
+        users = seed_users(
+            options["users"],
+            start_date - timedelta(days=options["days"]),
+            start_date,
+            batch_size=options["batch_size"],
+            rng=rng,
+        )
+        self.stdout.write(
+            f"Created {len(users)} users in {time.perf_counter() - started:.1f}s"
+        )
+        started = time.perf_counter()
+        created = seed_transactions(
+            users,
+            options["transactions"],
+            start_date,
+            batch_size=options["batch_size"],
+            rng=rng,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {created} transactions in {time.perf_counter() - started:.1f}s"
+            )
+        )
@@ -1,6 +1,11 @@
+from collections import defaultdict
+
 from django.contrib.auth.base_user import BaseUserManager
+from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+from .enums import ViolationCode
+
 
 class CustomUserManager(BaseUserManager):
     """
@@ -22,13 +27,44 @@ class CustomUserManager(BaseUserManager):
         """
         Create and save a SuperUser with the given email and password.
         """
-        extra_fields.setdefault("is_staff", True)
-        extra_fields.setdefault("is_superuser", True)
+        extra_fields.setdefault("is_admin", True)
         extra_fields.setdefault("is_active", True)
 
-        if extra_fields.get("is_staff") is not True:
-            raise ValueError(_("Superuser must have is_staff=True."))
-        if extra_fields.get("is_superuser") is not True:
-            raise ValueError(_("Superuser must have is_superuser=True."))
-        user = self.create_user(email, password, **extra_fields)
-        user.save()
+        if extra_fields.get("is_admin") is not True:
+            raise ValueError(_("Superuser must have is_admin=True."))
+        return self.create_user(email, password, **extra_fields)
+
+
+class TransactionQuerySet(models.QuerySet):
+    def with_violations(self, *codes: ViolationCode):
+        """Transactions having any of the given violation codes.
+        Expressed as an IN lookup so the violation_codes index is used."""
+        masks = set()
+        for code in codes:
+            masks.update(ViolationCode.all_masks_with(code))
+        return self.filter(violation_codes__in=sorted(masks))
+
+    def create(self, **kwargs):
+        """Without an explicit database, the row is written to the shard of
+        its sender (see monitoring.sharding)."""
+        from .sharding import is_sharded, shard_for
+
+        if self._db is not None or not is_sharded():
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True, using=shard_for(obj.sender_id))
+        return obj
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """Like create(), groups rows by the shard of their sender"""
+        from .sharding import is_sharded, shard_for
+
+        if self._db is not None or not is_sharded():
+            return super().bulk_create(objs, *args, **kwargs)
+        objs = list(objs)
+        by_shard = defaultdict(list)
+        for obj in objs:
+            by_shard[shard_for(obj.sender_id)].append(obj)
+        for alias, shard_objs in by_shard.items():
+            self.using(alias).bulk_create(shard_objs, *args, **kwargs)
+        return objs
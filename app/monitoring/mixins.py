@@ -0,0 +1,108 @@
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+class FastListMixin:
+    """Serves `list` from `values()` rows instead of serializer instances.
+
+    Views define `fast_list_values` (arguments to values()) and
+    `fast_list_row`, which must return the same keys, in the same order,
+    as the serializer would. Disabled with FAST_LIST_SERIALIZATION = False.
+    """
+
+    fast_list_values = ()
+    fast_list_annotations = {}
+
+    def fast_list_row(self, row: dict) -> dict:
+        return row
+
+    def use_fast_list(self) -> bool:
+        return settings.FAST_LIST_SERIALIZATION
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_fast_list():
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = queryset.values(*self.fast_list_values, **self.fast_list_annotations)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response([self.fast_list_row(row) for row in page])
+        return Response([self.fast_list_row(row) for row in rows])
+
+
+class ConditionalGetMixin:
+    """Answers list and retrieve with 304 Not Modified when the client's
+    If-None-Match / If-Modified-Since still match.
+
+    A list's ETag hashes the count and latest `updated_at` of the filtered
+    queryset, one aggregate over indexed columns. Lists get no Last-Modified:
+    a row leaving the filter or deleted does not move the latest `updated_at`
+    of the rows left, so If-Modified-Since would answer 304 for a changed
+    list. A detail's validators are the row's `updated_at`.
+
+    Writes that bypass save() must set `updated_at` themselves for clients
+    to see them, and changes to related rows (e.g. a sender renamed) are
+    only seen once the row itself changes.
+    """
+
+    def _conditional_response(self, request, fingerprint: list, last_modified):
+        """Returns a 304 response, or None with the validators kept
+        for finalize_response()"""
+        fingerprint += [
+            request.user.pk,
+            request.get_full_path(),
+            request.accepted_renderer.format,
+        ]
+        digest = hashlib.blake2b(repr(fingerprint).encode(), digest_size=16).hexdigest()
+        # HTTP dates have whole seconds; the ETag catches sub-second changes.
+        seconds = int(last_modified.timestamp()) if last_modified else None
+        self._validators = (f'W/"{digest}"', seconds)
+        return get_conditional_response(
+            request, etag=self._validators[0], last_modified=self._validators[1]
+        )
+
+    def _list_fingerprint(self, queryset) -> list:
+        querysets = getattr(queryset, "querysets", [queryset])  # ScatterQuerySet
+        count, last_modified = 0, None
+        for shard_queryset in querysets:
+            aggregate = shard_queryset.order_by().aggregate(
+                count=Count("pk"), last_modified=Max("updated_at")
+            )
+            count += aggregate["count"]
+            if aggregate["last_modified"] and (
+                last_modified is None or aggregate["last_modified"] > last_modified
+            ):
+                last_modified = aggregate["last_modified"]
+        return [count, last_modified]
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        fingerprint = self._list_fingerprint(queryset)
+        not_modified = self._conditional_response(request, fingerprint, None)
+        return not_modified or super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        not_modified = self._conditional_response(
+            request, [instance.pk, instance.updated_at], instance.updated_at
+        )
+        if not_modified:
+            return not_modified
+        return Response(self.get_serializer(instance).data)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        validators = getattr(self, "_validators", None)
+        if validators and response.status_code in (200, 304):
+            etag, last_modified = validators
+            response["ETag"] = etag
+            if last_modified:
+                response["Last-Modified"] = http_date(last_modified)
+            response["Cache-Control"] = "private, no-cache"
+            patch_vary_headers(response, ["Authorization"])
+        return response
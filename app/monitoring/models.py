@@ -3,11 +3,21 @@ from datetime import datetime, timezone
 from common.models import AuditableModel
 from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import ExpressionWrapper, F, FloatField, Value
 from django.utils.translation import gettext_lazy as _
 
-from .enums import TIER_AMOUNT
-from .managers import CustomUserManager
+from .enums import TIER_AMOUNT, ViolationCode
+from .managers import CustomUserManager, TransactionQuerySet
+
+# Smoothing factor of the exponentially decayed amount statistics
+AMOUNT_STATS_DECAY = 0.05
+# Accounts younger than this are new recipients
+NEW_USER_SECONDS = 20 * 60
+
+
+def _as_float(expression):
+    return ExpressionWrapper(expression, output_field=FloatField())
 
 
 class User(AbstractBaseUser, AuditableModel):
@@ -30,10 +40,31 @@ class User(AbstractBaseUser, AuditableModel):
 
     class Meta:
         ordering = ("-created_at",)
+        indexes = [
+            models.Index(fields=["created_at"], name="user_created_idx"),
+            models.Index(fields=["tier", "created_at"], name="user_tier_idx"),
+            models.Index(fields=["is_flagged", "created_at"], name="user_flagged_idx"),
+            models.Index(fields=["updated_at"], name="user_updated_idx"),
+        ]
 
     def __str__(self) -> str:
         return self.email
 
+    # Admins (is_admin) are the Django admin's staff and have every permission.
+    @property
+    def is_staff(self) -> bool:
+        return self.is_admin
+
+    @property
+    def is_superuser(self) -> bool:
+        return self.is_admin
+
+    def has_perm(self, perm, obj=None) -> bool:
+        return self.is_active and self.is_admin
+
+    def has_module_perms(self, app_label) -> bool:
+        return self.is_active and self.is_admin
+
     def save_last_login(self) -> None:
         self.last_login = datetime.now(timezone.utc)
         self.save()
@@ -41,7 +72,7 @@ class User(AbstractBaseUser, AuditableModel):
     @property
     def is_new(self) -> bool:
         """A user is new when created within 20mins ago"""
-        allowable_in_seconds = float(20 * 60)
+        allowable_in_seconds = float(NEW_USER_SECONDS)
         now = datetime.now(timezone.utc)
         created_at = (now - self.created_at).total_seconds()
         if created_at >= allowable_in_seconds:
@@ -60,10 +91,15 @@ class User(AbstractBaseUser, AuditableModel):
         """Checks if the transaction is within a 1-minute timing window.
         This is based on the timing of the last transaction (sent funds) by the user.
         """
+        return self.sent_within_timing_window(datetime.now(timezone.utc))
+
+    def sent_within_timing_window(self, moment: datetime) -> bool:
+        """Checks if the user sent funds less than a minute before `moment`.
+        Used to re-evaluate the window for a transaction after the fact."""
         allowable_window_in_seconds = float(1 * 60)
-        if last_transaction := self.sent_funds.order_by("created_at").last():
-            now = datetime.now(timezone.utc)
-            time_diff = (now - last_transaction.created_at).total_seconds()
+        earlier_transactions = self.sent_funds.filter(created_at__lt=moment)
+        if last_transaction := earlier_transactions.order_by("created_at").last():
+            time_diff = (moment - last_transaction.created_at).total_seconds()
             if time_diff < allowable_window_in_seconds:
                 return True
             return False
@@ -72,16 +108,233 @@ class User(AbstractBaseUser, AuditableModel):
 
 
 class Transaction(AuditableModel):
+    # No database constraints: transactions may live in shard databases
+    # that do not contain the user table (see monitoring.sharding).
     sender = models.ForeignKey(
-        settings.AUTH_USER_MODEL, on_delete=models.PROTECT, related_name="sent_funds"
+        settings.AUTH_USER_MODEL,
+        on_delete=models.PROTECT,
+        related_name="sent_funds",
+        db_constraint=False,
     )
     receiver = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.PROTECT,
         related_name="received_funds",
+        db_constraint=False,
     )
     amount = models.DecimalField(max_digits=20, decimal_places=2, default=0.00)
     is_flagged = models.BooleanField(default=False)
+    violation_codes = models.PositiveSmallIntegerField(default=0)
+    # Rules left out of the inline evaluation by the latency budget and
+    # evaluated afterwards by the reevaluate_deferred_rules task.
+    deferred_codes = models.PositiveSmallIntegerField(default=0)
+    objects = TransactionQuerySet.as_manager()
 
     class Meta:
         ordering = ("-created_at",)
+        indexes = [
+            models.Index(
+                fields=["violation_codes", "created_at"],
+                name="transaction_violation_idx",
+            ),
+            models.Index(fields=["created_at"], name="transaction_created_idx"),
+            models.Index(
+                fields=["is_flagged", "created_at"], name="transaction_flagged_idx"
+            ),
+            models.Index(fields=["amount"], name="transaction_amount_idx"),
+            # Transfers a user received recently, for retroactive flagging
+            models.Index(
+                fields=["receiver", "created_at"],
+                name="transaction_recv_created_idx",
+            ),
+            # Cover the conditional GET validators of a user's transactions
+            models.Index(
+                fields=["sender", "updated_at"], name="transaction_sender_updated_idx"
+            ),
+            models.Index(
+                fields=["receiver", "updated_at"],
+                name="transaction_recv_updated_idx",
+            ),
+        ]
+
+    @property
+    def violations(self) -> list:
+        return ViolationCode.names(self.violation_codes)
+
+
+class ModerationAudit(models.Model):
+    """One batch of users changed together by the bulk moderation API"""
+
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    changes = models.JSONField()
+    user_ids = models.JSONField()
+    updated = models.PositiveIntegerField()
+    reason = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+class IdempotencyKey(models.Model):
+    """A client-supplied Idempotency-Key and the response it produced.
+    A row without a status_code is a request still in progress."""
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True)
+    locked_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="unique_idempotency_key"),
+        ]
+
+
+class AmountStatistics(models.Model):
+    """Running statistics of the amounts a user has sent.
+    count/mean/m2 follow Welford's algorithm; ewm_mean/ewm_var are the
+    exponentially decayed equivalents that favour recent behaviour."""
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name="amount_stats",
+    )
+    count = models.PositiveIntegerField(default=0)
+    mean = models.FloatField(default=0.0)
+    m2 = models.FloatField(default=0.0)
+    ewm_mean = models.FloatField(default=0.0)
+    ewm_var = models.FloatField(default=0.0)
+    last_sent_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def variance(self) -> float:
+        if self.count < 2:
+            return 0.0
+        return self.m2 / (self.count - 1)
+
+    def zscore(self, amount: float, decayed: bool = False) -> float:
+        """Number of standard deviations `amount` lies above the mean"""
+        mean, variance = (
+            (self.ewm_mean, self.ewm_var) if decayed else (self.mean, self.variance)
+        )
+        if variance <= 0:
+            return 0.0
+        return (float(amount) - mean) / variance**0.5
+
+    @classmethod
+    def record(cls, user_id, amount: float) -> None:
+        """Adds an amount to the user's statistics in a single UPDATE.
+        Every column on the right-hand side refers to the pre-update row,
+        so concurrent inserts cannot lose an observation."""
+        x = Value(float(amount), output_field=FloatField())
+        alpha = Value(AMOUNT_STATS_DECAY, output_field=FloatField())
+        delta = x - F("mean")
+        ewm_delta = x - F("ewm_mean")
+        updated = cls.objects.filter(user_id=user_id).update(
+            count=F("count") + 1,
+            mean=_as_float(F("mean") + delta / (F("count") + 1.0)),
+            m2=_as_float(
+                F("m2") + delta * delta * F("count") / (F("count") + 1.0)
+            ),
+            ewm_mean=_as_float(F("ewm_mean") + alpha * ewm_delta),
+            ewm_var=_as_float(
+                (1.0 - alpha) * (F("ewm_var") + alpha * ewm_delta * ewm_delta)
+            ),
+        )
+        if updated:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    user_id=user_id, count=1, mean=float(amount), ewm_mean=float(amount)
+                )
+        except IntegrityError:
+            cls.record(user_id, amount)
+
+    def observe(self, amount: float) -> None:
+        """Adds an amount in memory, as `record` does in the database"""
+        x = float(amount)
+        if not self.count:
+            self.count, self.mean, self.ewm_mean = 1, x, x
+            return
+        delta, ewm_delta = x - self.mean, x - self.ewm_mean
+        self.m2 += delta * delta * self.count / (self.count + 1.0)
+        self.mean += delta / (self.count + 1.0)
+        self.count += 1
+        self.ewm_mean += AMOUNT_STATS_DECAY * ewm_delta
+        self.ewm_var = (1.0 - AMOUNT_STATS_DECAY) * (
+            self.ewm_var + AMOUNT_STATS_DECAY * ewm_delta * ewm_delta
+        )
+
+    @classmethod
+    def get_last_sent(cls, user_id):
+        return (
+            cls.objects.filter(user_id=user_id)
+            .values_list("last_sent_at", flat=True)
+            .first()
+        )
+
+    @classmethod
+    def lock_for_transfer(cls, user_id) -> None:
+        """Writes the sender's row unchanged so that a transfer's transaction
+        takes its write lock before reading anything: on SQLite the database
+        lock, which a transaction that read first could not later acquire
+        without failing as "database is locked"; elsewhere the row lock."""
+        cls.objects.filter(user_id=user_id).update(last_sent_at=F("last_sent_at"))
+
+    @classmethod
+    def advance_last_sent(cls, user_id, observed, sent_at) -> bool:
+        """Moves last_sent_at forward only if it still holds the value read
+        before evaluation. False means another process sent in between."""
+        updated = cls.objects.filter(user_id=user_id, last_sent_at=observed).update(
+            last_sent_at=sent_at
+        )
+        return bool(updated)
+
+
+class ShadowTally(models.Model):
+    """Daily totals of a challenger rule set's shadow evaluations"""
+
+    challenger = models.CharField(max_length=50)
+    day = models.DateField()
+    evaluated = models.PositiveIntegerField(default=0)
+    champion_flagged = models.PositiveIntegerField(default=0)
+    challenger_flagged = models.PositiveIntegerField(default=0)
+    both_flagged = models.PositiveIntegerField(default=0)
+    disagreements = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["challenger", "day"], name="unique_shadow_tally"
+            ),
+        ]
+
+
+class ShadowDisagreement(models.Model):
+    """A sampled transaction a challenger decided differently. Refers to the
+    transaction by id only, since it may live in a shard database."""
+
+    transaction_id = models.UUIDField()
+    challenger = models.CharField(max_length=50)
+    champion_codes = models.PositiveSmallIntegerField()
+    challenger_codes = models.PositiveSmallIntegerField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["challenger", "created_at"], name="shadow_disagreement_idx"
+            ),
+        ]
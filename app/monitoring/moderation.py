@@ -0,0 +1,53 @@
+"""Set-based moderation of many users at once.
+
+Changes are applied in chunks of primary keys, each with a single
+`UPDATE ... WHERE id IN (...)` and one `ModerationAudit` row committed
+together. Chunks are taken in primary key order after the last one, so a
+filter that the update itself invalidates (e.g. is_flagged=False when
+flagging) still visits every user exactly once.
+
+`users_moderated` is sent once per chunk with the ids and changes, for
+anything caching per-user state to drop it in bulk.
+"""
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.dispatch import Signal
+
+from .models import ModerationAudit, User
+
+# Sent with user_ids (list) and changes (dict) after each chunk commits
+users_moderated = Signal()
+
+
+def moderate_users(
+    actor: User, queryset, changes: dict, reason: str = "", batch_size: int = None
+) -> dict:
+    """Applies `changes` (tier and/or is_flagged) to every user of
+    `queryset`; returns the number of users updated and of chunks"""
+    batch_size = batch_size or settings.USER_MODERATION_BATCH_SIZE
+    queryset = queryset.order_by("pk")
+    updated = batches = 0
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        user_ids = list(page.values_list("pk", flat=True)[:batch_size])
+        if not user_ids:
+            break
+        with db_transaction.atomic():
+            count = User.objects.filter(pk__in=user_ids).update(
+                **changes, updated_at=datetime.now(timezone.utc)
+            )
+            ModerationAudit.objects.create(
+                actor=actor,
+                changes=changes,
+                user_ids=[str(user_id) for user_id in user_ids],
+                updated=count,
+                reason=reason,
+            )
+        users_moderated.send(sender=User, user_ids=user_ids, changes=changes)
+        updated += count
+        batches += 1
+        last_pk = user_ids[-1]
+    return {"updated": updated, "batches": batches}
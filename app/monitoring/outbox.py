@@ -0,0 +1,86 @@
+"""Commit-ordered log of flagged transactions for the live feed.
+
+On SQLite, `monitoring_flagged_outbox` gets a row from triggers on
+`monitoring_transaction` whenever a transaction is inserted flagged, gets
+flagged, or is stamped again while flagged, so every write path (save(),
+update(), bulk_create(), raw SQL) is covered. The row is written inside the
+writer's transaction and SQLite lets one transaction write to a database at a
+time, so `seq` increases in commit order: a reader that has seen `seq` N
+never sees a row below N appear later, however long the writer took to commit.
+
+Rows inserted with an updated_at over an hour old (seeding, rebalancing) are
+not news and are left out. The triggers keep the last OUTBOX_SIZE rows.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .models import Transaction
+
+OUTBOX_TABLE = "monitoring_flagged_outbox"
+OUTBOX_SIZE = 10_000
+TRANSACTION_TABLE = Transaction._meta.db_table
+
+_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+_APPEND = f"""
+        INSERT INTO {OUTBOX_TABLE}(transaction_id, flagged_at) VALUES (new.id, {_NOW});
+        DELETE FROM {OUTBOX_TABLE}
+        WHERE seq <= (SELECT max(seq) FROM {OUTBOX_TABLE}) - {OUTBOX_SIZE};
+"""
+
+_CREATE_STATEMENTS = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {OUTBOX_TABLE} (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        transaction_id char(32) NOT NULL,
+        flagged_at text NOT NULL
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {OUTBOX_TABLE}_insert
+    AFTER INSERT ON {TRANSACTION_TABLE}
+    WHEN new.is_flagged AND new.updated_at >= datetime('now', '-1 hour')
+    BEGIN {_APPEND} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {OUTBOX_TABLE}_update
+    AFTER UPDATE OF is_flagged, updated_at ON {TRANSACTION_TABLE}
+    WHEN new.is_flagged AND (NOT old.is_flagged OR new.updated_at IS NOT old.updated_at)
+    BEGIN {_APPEND} END
+    """,
+]
+
+
+def has_outbox(using: str = DEFAULT_DB_ALIAS) -> bool:
+    return connections[using].vendor == "sqlite"
+
+
+def create_outbox(using: str = DEFAULT_DB_ALIAS) -> None:
+    """Creates the outbox table and its triggers if missing"""
+    if not has_outbox(using):
+        return
+    with connections[using].cursor() as cursor:
+        for statement in _CREATE_STATEMENTS:
+            cursor.execute(statement)
+
+
+def last_seq(using: str, flagged_before: str = None) -> int:
+    """The latest seq, or the latest of rows flagged at or before a
+    'YYYY-MM-DD HH:MM:SS.SSS' UTC moment"""
+    sql = f"SELECT coalesce(max(seq), 0) FROM {OUTBOX_TABLE}"
+    params = []
+    if flagged_before is not None:
+        sql += " WHERE flagged_at <= %s"
+        params.append(flagged_before)
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()[0]
+
+
+def read_outbox(using: str, after: int) -> list:
+    """(seq, transaction id) of the rows after seq `after`, in commit order"""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"SELECT seq, transaction_id FROM {OUTBOX_TABLE}"
+            " WHERE seq > %s ORDER BY seq",
+            [after],
+        )
+        return cursor.fetchall()
@@ -0,0 +1,126 @@
+"""Retroactive flagging of transfers to users who have since been flagged.
+
+The flagged-recipient rule only runs when a transaction is created, so when
+a user is flagged the rescore_flagged_recipients task flags the transfers
+they received in the last FLAGGED_RECIPIENT_LOOKBACK_DAYS. Transfers are
+found through the (receiver, created_at) index and updated in chunks of
+RESCORE_BATCH_SIZE primary keys, each with one short `UPDATE` that ORs the
+violation code into the stored mask, so concurrent writers (e.g. the
+deferred rule task) are not overwritten and no lock is held for long.
+
+Each affected sender then gets one email covering all of their transfers.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import F
+from django.template.defaultfilters import linebreaksbr
+
+from .enums import ViolationCode
+from .models import Transaction, User
+from .sharding import get_transaction_databases
+
+FLAGGED_RECIPIENT_MASKS = ViolationCode.all_masks_with(
+    ViolationCode.FLAGGED_RECIPIENT
+)
+
+
+def schedule_rescore(user_ids) -> None:
+    """Queues the rescore once the current transaction commits"""
+    user_ids = [str(user_id) for user_id in user_ids]
+    if not user_ids:
+        return
+
+    def dispatch():
+        # Imported here so web processes only load Celery on first dispatch.
+        from .tasks import rescore_flagged_recipients
+
+        rescore_flagged_recipients.delay(user_ids)
+
+    db_transaction.on_commit(dispatch)
+
+
+def _flag_chunks(alias: str, queryset, batch_size: int):
+    """Flags `queryset` chunk by chunk; yields the (sender id, amount) rows
+    of each chunk once it is committed"""
+    queryset = queryset.order_by("pk")
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(page.values_list("pk", "sender_id", "amount")[:batch_size])
+        if not rows:
+            return
+        with db_transaction.atomic(using=alias):
+            Transaction.objects.using(alias).filter(
+                pk__in=[pk for pk, _sender, _amount in rows]
+            ).update(
+                is_flagged=True,
+                updated_at=datetime.now(timezone.utc),
+                violation_codes=F("violation_codes").bitor(
+                    ViolationCode.FLAGGED_RECIPIENT
+                ),
+            )
+        yield [(sender_id, amount) for _pk, sender_id, amount in rows]
+        last_pk = rows[-1][0]
+
+
+def _notify_senders(flagged: dict, since: datetime, batch_size: int) -> int:
+    from .tasks import send_policy_email
+
+    sender_ids = list(flagged)
+    notified = 0
+    for start in range(0, len(sender_ids), batch_size):
+        senders = User.objects.filter(
+            pk__in=sender_ids[start : start + batch_size]
+        ).values_list("pk", "email", "firstname")
+        for sender_id, email, firstname in senders:
+            count, total = flagged[sender_id]
+            message = (
+                f"{count} transaction(s) totalling #{total:,} sent since "
+                f"{since:%Y-%m-%d} went to an account that has since been flagged.\n"
+            )
+            send_policy_email.delay(
+                {
+                    "email": email,
+                    "message": linebreaksbr(message),
+                    "user_name": firstname,
+                }
+            )
+            notified += 1
+    return notified
+
+
+def flag_transfers_to(
+    user_ids, lookback_days: int = None, batch_size: int = None
+) -> dict:
+    """Flags the recent transfers received by those of `user_ids` that are
+    still flagged; returns how many were updated and senders notified"""
+    if lookback_days is None:
+        lookback_days = settings.FLAGGED_RECIPIENT_LOOKBACK_DAYS
+    batch_size = batch_size or settings.RESCORE_BATCH_SIZE
+    since = datetime.now(timezone.utc) - timedelta(days=lookback_days)
+    receivers = list(
+        User.objects.filter(pk__in=user_ids, is_flagged=True).values_list(
+            "pk", flat=True
+        )
+    )
+    # {sender id: [transfers flagged, their total amount]}
+    flagged = defaultdict(lambda: [0, Decimal(0)])
+    updated = 0
+    for receiver_id in receivers:
+        for alias in get_transaction_databases():
+            transfers = (
+                Transaction.objects.using(alias)
+                .filter(receiver_id=receiver_id, created_at__gte=since)
+                .exclude(violation_codes__in=FLAGGED_RECIPIENT_MASKS)
+            )
+            for rows in _flag_chunks(alias, transfers, batch_size):
+                updated += len(rows)
+                for sender_id, amount in rows:
+                    flagged[sender_id][0] += 1
+                    flagged[sender_id][1] += amount
+    notified = _notify_senders(flagged, since, batch_size)
+    return {"updated": updated, "notified": notified}
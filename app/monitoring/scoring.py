@@ -0,0 +1,225 @@
+"""Offline scoring of transfer files against the policy rules.
+
+Records are read lazily from a CSV or JSONL file and scored in chunks. For
+each chunk the parent process loads the attributes of every referenced user
+with two queries and hands the chunk to a worker process, which evaluates
+POLICY_RULES against `ScoringUser` stand-ins without touching the database.
+At most `2 * workers` chunks are in flight and results are written in input
+order as they complete, so memory stays constant whatever the file size.
+
+Each record needs `sender`, `receiver` (user id or email) and `amount`, and
+may carry `id` and `created_at` (ISO 8601, default now). Rules are
+evaluated as of `created_at`. The timing window sees the sender's last
+transfer in our database and earlier records of the same chunk, so sort
+files by sender and time for it to cover transfers within the file.
+"""
+import csv
+import json
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import Iterator
+
+from django.db import connections
+from django.db.models import Q
+
+from .enums import ViolationCode
+from .models import NEW_USER_SECONDS, AmountStatistics, User
+from .utils import POLICY_RULES
+
+USER_FIELDS = ["id", "email", "tier", "is_flagged", "created_at"]
+STATS_FIELDS = ["count", "mean", "m2", "ewm_mean", "ewm_var", "last_sent_at"]
+OUTPUT_FIELDS = [
+    "id",
+    "sender",
+    "receiver",
+    "amount",
+    "created_at",
+    "is_flagged",
+    "violation_codes",
+    "violations",
+]
+
+
+class ScoringUser:
+    """Stands in for `User` in POLICY_RULES, as of the record's moment"""
+
+    is_amount_above_tier_limit = User.is_amount_above_tier_limit
+
+    def __init__(self, attributes: dict, moment: datetime, last_sent_at=None):
+        self.tier = attributes["tier"]
+        self.is_flagged = attributes["is_flagged"]
+        self.created_at = attributes["created_at"]
+        self.stats = attributes.get("stats")
+        self.moment = moment
+        self.last_sent_at = last_sent_at
+
+    @property
+    def is_new(self) -> bool:
+        return (self.moment - self.created_at).total_seconds() < NEW_USER_SECONDS
+
+    @property
+    def amount_stats(self) -> AmountStatistics:
+        if self.stats is None:
+            raise AmountStatistics.DoesNotExist()
+        return AmountStatistics(**self.stats)
+
+    def sent_within_timing_window(self, moment: datetime) -> bool:
+        if self.last_sent_at is None:
+            return False
+        return (moment - self.last_sent_at).total_seconds() < 60
+
+
+def read_records(path: str, file_format: str = None) -> Iterator[dict]:
+    file_format = file_format or ("csv" if path.endswith(".csv") else "jsonl")
+    with open(path, newline="") as file:
+        if file_format == "csv":
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _user_key(value) -> str:
+    value = str(value).strip()
+    return value.lower() if "@" in value else value.replace("-", "").lower()
+
+
+def resolve_users(keys: set) -> dict:
+    """{user key: attributes} for the ids and emails in `keys`"""
+    emails = [key for key in keys if "@" in key]
+    ids = []
+    for key in keys - set(emails):
+        try:
+            ids.append(uuid.UUID(key))
+        except ValueError:
+            continue
+    users = {}
+    for row in User.objects.filter(Q(id__in=ids) | Q(email__in=emails)).values(
+        *USER_FIELDS
+    ):
+        users[row["id"]] = row
+    stats = AmountStatistics.objects.filter(user_id__in=list(users)).values(
+        "user_id", *STATS_FIELDS
+    )
+    for row in stats:
+        user = users[row.pop("user_id")]
+        user["last_sent_at"] = row.pop("last_sent_at")
+        user["stats"] = row
+    attributes = {}
+    for user_id, user in users.items():
+        user.setdefault("stats", None)
+        user.setdefault("last_sent_at", None)
+        attributes[user_id.hex] = user
+        if user["email"]:
+            attributes[user["email"].lower()] = user
+    return attributes
+
+
+def parse_record(record: dict, now: datetime) -> tuple:
+    """(sender key, receiver key, amount, moment); raises ValueError"""
+    try:
+        amount = Decimal(str(record["amount"]))
+    except (KeyError, InvalidOperation):
+        raise ValueError("invalid amount")
+    if not amount.is_finite() or amount <= 0:
+        raise ValueError("invalid amount")
+    moment = now
+    if record.get("created_at"):
+        created_at = str(record["created_at"]).replace("Z", "+00:00")
+        moment = datetime.fromisoformat(created_at)
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+    return _user_key(record["sender"]), _user_key(record["receiver"]), amount, moment
+
+
+def score_chunk(records: list, users: dict, now: datetime) -> tuple:
+    """Scores one chunk; returns ([(record, violation codes)], skipped).
+    Runs in worker processes, so it must not query the database."""
+    scored = []
+    skipped = 0
+    sent_in_chunk = {}
+    for record in records:
+        try:
+            sender_key, receiver_key, amount, moment = parse_record(record, now)
+            sender_attributes = users[sender_key]
+            receiver_attributes = users[receiver_key]
+        except (KeyError, ValueError, TypeError):
+            skipped += 1
+            continue
+        last_sent_at = max(
+            (
+                sent_at
+                for sent_at in (
+                    sender_attributes["last_sent_at"],
+                    sent_in_chunk.get(sender_attributes["id"]),
+                )
+                if sent_at is not None and sent_at < moment
+            ),
+            default=None,
+        )
+        sender = ScoringUser(sender_attributes, moment, last_sent_at)
+        receiver = ScoringUser(receiver_attributes, moment)
+        codes = 0
+        for rule in POLICY_RULES:
+            if rule.check(sender, receiver, amount, moment):
+                codes |= rule.code
+        sender_id = sender_attributes["id"]
+        sent_in_chunk[sender_id] = max(moment, sent_in_chunk.get(sender_id, moment))
+        scored.append((record, codes))
+    return scored, skipped
+
+
+def _chunks(records: Iterator[dict], size: int) -> Iterator[list]:
+    while chunk := list(islice(records, size)):
+        yield chunk
+
+
+def _with_users(chunk: list) -> dict:
+    keys = set()
+    for record in chunk:
+        for field in ("sender", "receiver"):
+            if record.get(field):
+                keys.add(_user_key(record[field]))
+    return resolve_users(keys)
+
+
+def score_records(
+    records: Iterator[dict], workers: int = 0, chunk_size: int = 5000
+) -> Iterator[tuple]:
+    """Yields (scored, skipped) per chunk, in input order. With workers=0
+    chunks are scored in this process."""
+    now = datetime.now(timezone.utc)
+    chunks = _chunks(iter(records), chunk_size)
+    if not workers:
+        for chunk in chunks:
+            yield score_chunk(chunk, _with_users(chunk), now)
+        return
+    # Children are forked with this process' connections; they never use
+    # them, but must not share the open sockets or file handles either.
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(score_chunk, chunk, _with_users(chunk), now))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def output_row(record: dict, codes: int) -> dict:
+    return {
+        "id": record.get("id"),
+        "sender": record.get("sender"),
+        "receiver": record.get("receiver"),
+        "amount": str(record.get("amount")),
+        "created_at": record.get("created_at"),
+        "is_flagged": bool(codes),
+        "violation_codes": codes,
+        "violations": ViolationCode.names(codes),
+    }
@@ -0,0 +1,103 @@
+"""Full-text index of user names and emails.
+
+On SQLite, `monitoring_user_search` is an FTS5 table over the email and
+firstname columns of `monitoring_user`, kept in sync by triggers so every
+write path (save(), update(), bulk_create(), raw SQL) updates it. Terms are
+matched as token prefixes ("zain" finds "Zainab", "example" finds
+"ada@example.com") through the index instead of a LIKE '%term%' scan.
+
+The index refers to users by rowid, which VACUUM may renumber, so the index
+is rebuilt after vacuuming. Other databases fall back to `icontains`.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .models import User
+
+SEARCH_TABLE = "monitoring_user_search"
+USER_TABLE = User._meta.db_table
+
+_CREATE_STATEMENTS = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        email, firstname,
+        content='{USER_TABLE}', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert AFTER INSERT ON {USER_TABLE}
+    BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, email, firstname)
+        VALUES (new.rowid, new.email, new.firstname);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete AFTER DELETE ON {USER_TABLE}
+    BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, email, firstname)
+        VALUES ('delete', old.rowid, old.email, old.firstname);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update
+    AFTER UPDATE OF email, firstname ON {USER_TABLE}
+    BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, email, firstname)
+        VALUES ('delete', old.rowid, old.email, old.firstname);
+        INSERT INTO {SEARCH_TABLE}(rowid, email, firstname)
+        VALUES (new.rowid, new.email, new.firstname);
+    END
+    """,
+]
+
+# Users whose email or firstname match the MATCH expression parameter
+MATCHING_USER_IDS_SQL = (
+    f"SELECT id FROM {USER_TABLE} WHERE rowid IN "
+    f"(SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s)"
+)
+
+
+def is_search_indexed(using: str = DEFAULT_DB_ALIAS) -> bool:
+    return connections[using].vendor == "sqlite"
+
+
+def create_search_index(using: str = DEFAULT_DB_ALIAS) -> None:
+    """Creates the index and its triggers if missing, then rebuilds it"""
+    if not is_search_indexed(using):
+        return
+    with connections[using].cursor() as cursor:
+        for statement in _CREATE_STATEMENTS:
+            cursor.execute(statement)
+    rebuild_search_index(using)
+
+
+def rebuild_search_index(using: str = DEFAULT_DB_ALIAS) -> None:
+    if not is_search_indexed(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+
+
+def match_expression(term: str) -> str:
+    """An FTS5 query matching `term` as a phrase of token prefixes; quoting
+    keeps user input from being parsed as FTS5 syntax."""
+    return '"{}"*'.format(term.replace('"', '""'))
+
+
+def search_users(queryset, term: str):
+    """Narrows a user queryset to users matching `term`"""
+    return queryset.extra(
+        where=[f"{USER_TABLE}.id IN ({MATCHING_USER_IDS_SQL})"],
+        params=[match_expression(term)],
+    )
+
+
+def matching_user_ids(term: str, among, batch_size: int = 500) -> list:
+    """Ids of the users in `among` matching `term`, looked up in batches to
+    stay within the database's query parameter limit"""
+    among = list(among)
+    user_ids = []
+    for start in range(0, len(among), batch_size):
+        batch = User.objects.filter(pk__in=among[start : start + batch_size])
+        user_ids += search_users(batch, term).values_list("pk", flat=True)
+    return user_ids
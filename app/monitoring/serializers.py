@@ -1,13 +1,47 @@
+import random
+import time
+
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS, OperationalError
+from django.db import transaction as db_transaction
 from django.utils.translation import gettext_lazy as _
 from rest_framework import exceptions, serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
-from .models import Transaction, User
-from .tasks import send_policy_email
+from .filters import UserFilter
+from .locks import sender_locks
+from .models import AmountStatistics, Transaction, User
+from .rescoring import schedule_rescore
+from .shadow import capture_inputs, should_shadow
+from .sharding import atomic_with_shards, on_rollback, shard_for
 from .utils import evaluate_policy
 
+TRANSFER_ATTEMPTS = 3
+# Upper bound of the first wait after a lock error, doubled per attempt
+LOCK_RETRY_DELAY = 0.05
+
+
+class StaleSenderState(Exception):
+    """The sender's last transfer changed while a transfer was evaluated"""
+
+
+class TransferConflict(exceptions.APIException):
+    status_code = 409
+    default_detail = _("Another transfer from this account is in progress. Retry.")
+    default_code = "transfer_conflict"
+
+
+class TransferBusy(exceptions.APIException):
+    status_code = 503
+    default_detail = _("Transfers are busy at the moment. Retry shortly.")
+    default_code = "transfer_busy"
+
+
+def is_lock_error(error: OperationalError) -> bool:
+    message = str(error).lower()
+    return "locked" in message or "deadlock" in message
+
 
 class CustomObtainTokenPairSerializer(TokenObtainPairSerializer):
     def validate(self, attrs):
@@ -73,6 +107,63 @@ class UpdateUserSerializer(serializers.ModelSerializer):
             "is_active": {"read_only": True},
         }
 
+    def update(self, instance: User, validated_data: dict):
+        was_flagged = instance.is_flagged
+        user = super().update(instance, validated_data)
+        if user.is_flagged and not was_flagged:
+            schedule_rescore([user.pk])
+        return user
+
+
+class UserChangesSerializer(serializers.Serializer):
+    tier = serializers.ChoiceField(choices=User.TIER_CHOICES, required=False)
+    is_flagged = serializers.BooleanField(required=False)
+
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError("Set tier and/or is_flagged.")
+        return attrs
+
+
+class BulkModerationSerializer(serializers.Serializer):
+    """Selects users by `ids`, by `filter` (the user list's filters) or,
+    with `all`, every user"""
+
+    ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        required=False,
+        allow_empty=False,
+        max_length=10000,
+    )
+    filter = serializers.DictField(required=False, allow_empty=False)
+    all = serializers.BooleanField(default=False)
+    set = UserChangesSerializer()
+    reason = serializers.CharField(required=False, allow_blank=True, max_length=255)
+
+    def validate(self, attrs):
+        selections = ("ids" in attrs) + ("filter" in attrs) + attrs["all"]
+        if selections != 1:
+            raise serializers.ValidationError("Provide one of ids, filter or all.")
+        return attrs
+
+    def validate_filter(self, value: dict) -> dict:
+        # Unknown keys would be ignored by the filterset, widening the
+        # selection to every user.
+        unknown = set(value) - set(UserFilter.base_filters) - {"search"}
+        if unknown:
+            raise serializers.ValidationError(
+                f"Unknown filter(s): {', '.join(sorted(unknown))}."
+            )
+        # Empty values are ignored by the filterset too
+        if not any(
+            criterion not in (None, [], {}) and str(criterion).strip()
+            for criterion in value.values()
+        ):
+            raise serializers.ValidationError(
+                'Set at least one filter, or use "all": true to select every user.'
+            )
+        return value
+
 
 class OnboardUserSerializer(serializers.Serializer):
     """Serializer for creating user object"""
@@ -102,12 +193,26 @@ class OnboardUserSerializer(serializers.Serializer):
 class TransactionSerializer(serializers.ModelSerializer):
     sender_name = serializers.CharField(source="sender.firstname", read_only=True)
     recipient_name = serializers.CharField(source="receiver.firstname", read_only=True)
+    violations = serializers.ListField(child=serializers.CharField(), read_only=True)
 
     class Meta:
         model = Transaction
         fields = "__all__"
 
 
+class ArchivedTransactionSerializer(serializers.Serializer):
+    """Read-only representation of a transaction row kept in an archive segment"""
+
+    id = serializers.UUIDField(read_only=True)
+    sender = serializers.UUIDField(source="sender_id", read_only=True)
+    receiver = serializers.UUIDField(source="receiver_id", read_only=True)
+    amount = serializers.DecimalField(max_digits=20, decimal_places=2, read_only=True)
+    is_flagged = serializers.BooleanField(read_only=True)
+    violation_codes = serializers.IntegerField(read_only=True)
+    created_at = serializers.DateTimeField(read_only=True)
+    updated_at = serializers.DateTimeField(read_only=True)
+
+
 class MakeTransactionSerializer(serializers.Serializer):
     recipient = serializers.PrimaryKeyRelatedField(
         queryset=User.objects.all(),
@@ -128,21 +233,49 @@ class MakeTransactionSerializer(serializers.Serializer):
         return super().validate(attrs)
 
     def create(self, validated_data: dict):
+        """Transfers from one sender are evaluated one at a time. The atomic
+        block on "default" starts by writing the sender's statistics row,
+        taking the write lock before anything is read; a striped lock orders
+        transfers within this process, and a conditional update of the
+        sender's last_sent_at detects transfers committed by other processes,
+        in which case the evaluation is retried against the new state.
+        Lock errors are retried after a short randomised backoff."""
         auth_user: User = self.context["request"].user
-        recipient = validated_data.get("recipient")
-        amount = validated_data.get("amount")
-        evaluation_result = evaluate_policy(
-            auth_user, recipient, validated_data.get("amount")
+        shadow = should_shadow()
+        for attempt in range(TRANSFER_ATTEMPTS):
+            try:
+                transaction, evaluation_result = self._transfer(
+                    auth_user, validated_data, shadow
+                )
+                break
+            except StaleSenderState:
+                continue
+            except OperationalError as error:
+                if not is_lock_error(error):
+                    raise
+                if attempt + 1 == TRANSFER_ATTEMPTS:
+                    raise TransferBusy()
+                time.sleep(random.uniform(0, LOCK_RETRY_DELAY * 2**attempt))
+        else:
+            raise TransferConflict()
+        # The view may run the transfer inside a longer transaction (see
+        # monitoring.idempotency); tasks must not run before it commits.
+        db_transaction.on_commit(
+            lambda: self._dispatch_tasks(auth_user, transaction, evaluation_result, shadow)
         )
-        transaction_flagged = evaluation_result.get("is_flagged")
-        data = {
-            "sender": auth_user,
-            "receiver": recipient,
-            "amount": amount,
-            "is_flagged": transaction_flagged,
-        }
-        transaction = Transaction.objects.create(**data)
-        if transaction_flagged:
+        return transaction
+
+    def _dispatch_tasks(
+        self, auth_user: User, transaction: Transaction, evaluation_result: dict, shadow: bool
+    ) -> None:
+        # Imported here so web processes only load Celery on first dispatch.
+        if transaction.deferred_codes:
+            from .tasks import reevaluate_deferred_rules
+
+            reevaluate_deferred_rules.delay(str(transaction.id), str(auth_user.pk))
+        if transaction.is_flagged:
+            from .tasks import send_policy_email
+
             send_policy_email.delay(
                 {
                     "email": auth_user.email,
@@ -150,7 +283,61 @@ class MakeTransactionSerializer(serializers.Serializer):
                     "user_name": auth_user.firstname,
                 }
             )
-        return transaction
+        if shadow:
+            from .tasks import evaluate_shadow_rules
+
+            evaluate_shadow_rules.delay(
+                str(transaction.id), evaluation_result["shadow_inputs"]
+            )
+
+    def _transfer(self, auth_user: User, validated_data: dict, shadow: bool) -> tuple:
+        """One attempt at a transfer.
+        The transaction is written to the sender's shard, in an atomic block
+        nested in the one on "default" and opened only after the evaluation
+        has read the shard, so that it also writes first. When the shard is
+        not "default" its block commits first: if the outermost transaction
+        on "default" (which may be the view's, see monitoring.idempotency)
+        then fails, the shard's row is deleted again. Only a crash between the
+        two commits can leave a transaction without its sender statistics."""
+        with atomic_with_shards():
+            AmountStatistics.lock_for_transfer(auth_user.pk)
+            with sender_locks.hold(auth_user.pk):
+                return self._create_transaction(auth_user, validated_data, shadow)
+
+    def _create_transaction(
+        self, auth_user: User, validated_data: dict, shadow: bool = False
+    ) -> tuple:
+        recipient = validated_data.get("recipient")
+        amount = validated_data.get("amount")
+        last_sent_at = AmountStatistics.get_last_sent(auth_user.pk)
+        evaluation_result = evaluate_policy(auth_user, recipient, amount)
+        if shadow:
+            # Captured before saving, which updates the sender's statistics
+            shadow_inputs = capture_inputs(auth_user, recipient, amount, last_sent_at)
+        data = {
+            "sender": auth_user,
+            "receiver": recipient,
+            "amount": amount,
+            "is_flagged": evaluation_result.get("is_flagged"),
+            "violation_codes": evaluation_result.get("violation_codes"),
+            "deferred_codes": evaluation_result.get("deferred_codes"),
+        }
+        with db_transaction.atomic(using=shard_for(auth_user.pk)):
+            transaction = Transaction.objects.create(**data)
+            if not AmountStatistics.advance_last_sent(
+                auth_user.pk, last_sent_at, transaction.created_at
+            ):
+                raise StaleSenderState()
+        if transaction._state.db != DEFAULT_DB_ALIAS:
+            on_rollback(
+                Transaction.objects.using(transaction._state.db)
+                .filter(pk=transaction.pk)
+                .delete
+            )
+        if shadow:
+            shadow_inputs["moment"] = transaction.created_at.isoformat()
+            evaluation_result["shadow_inputs"] = shadow_inputs
+        return transaction, evaluation_result
 
 
 class UserSerializer(serializers.ModelSerializer):
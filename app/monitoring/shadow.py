@@ -0,0 +1,210 @@
+"""Shadow (champion/challenger) evaluation of candidate policy rules.
+
+A SHADOW_SAMPLE_RATE fraction of transfers is handed to the
+evaluate_shadow_rules task along with the inputs the live evaluation saw:
+both users' tier, flag and age, and the sender's amount statistics and last
+transfer before this one. The worker replays POLICY_RULES (the champion)
+and every rule set named in SHADOW_CHALLENGERS against those inputs, so
+results only differ where the rules do, and never touches the transaction.
+
+Per challenger and day, totals are kept in one `ShadowTally` row and every
+transfer decided differently is stored as a `ShadowDisagreement`.
+"""
+import random
+from dataclasses import replace
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from .enums import ViolationCode
+from .models import AmountStatistics, ShadowDisagreement, ShadowTally, User
+from .scoring import ScoringUser
+from .utils import POLICY_RULES, is_amount_anomalous
+
+STATS_FIELDS = ["count", "mean", "m2", "ewm_mean", "ewm_var"]
+TALLY_FIELDS = [
+    "evaluated",
+    "champion_flagged",
+    "challenger_flagged",
+    "both_flagged",
+    "disagreements",
+]
+
+
+def challenger_rules(checks: dict) -> list:
+    """POLICY_RULES with the checks of the given violation codes replaced"""
+    return [
+        replace(rule, check=checks[rule.code]) if rule.code in checks else rule
+        for rule in POLICY_RULES
+    ]
+
+
+CHALLENGERS = {
+    "anomaly-3sd": challenger_rules(
+        {
+            ViolationCode.AMOUNT_ANOMALY: lambda sender, receiver, amount, moment: (
+                is_amount_anomalous(sender, amount, threshold=3.0)
+            ),
+        }
+    ),
+    "anomaly-decayed": challenger_rules(
+        {
+            ViolationCode.AMOUNT_ANOMALY: lambda sender, receiver, amount, moment: (
+                is_amount_anomalous(sender, amount, decayed=True)
+            ),
+        }
+    ),
+}
+
+
+def register_challenger(name: str, rules: list) -> None:
+    CHALLENGERS[name] = list(rules)
+
+
+def get_challengers() -> dict:
+    """{name: rules} of the challengers enabled by SHADOW_CHALLENGERS"""
+    unknown = set(settings.SHADOW_CHALLENGERS) - set(CHALLENGERS)
+    if unknown:
+        raise ImproperlyConfigured(
+            f"Unknown SHADOW_CHALLENGERS: {', '.join(sorted(unknown))}"
+        )
+    return {name: CHALLENGERS[name] for name in settings.SHADOW_CHALLENGERS}
+
+
+def should_shadow() -> bool:
+    rate = settings.SHADOW_SAMPLE_RATE
+    return bool(settings.SHADOW_CHALLENGERS) and rate > 0 and random.random() < rate
+
+
+def capture_inputs(sender: User, receiver: User, amount, last_sent_at) -> dict:
+    """The evaluation inputs of a transfer, in a form Celery can serialize.
+    Must be called before the transaction is saved, which updates the
+    sender's statistics; the live evaluation has already loaded them."""
+    try:
+        stats = sender.amount_stats
+        stats = {field: getattr(stats, field) for field in STATS_FIELDS}
+    except AmountStatistics.DoesNotExist:
+        stats = None
+    return {
+        "amount": str(amount),
+        "sender": {
+            "tier": sender.tier,
+            "is_flagged": sender.is_flagged,
+            "created_at": sender.created_at.isoformat(),
+            "stats": stats,
+            "last_sent_at": last_sent_at.isoformat() if last_sent_at else None,
+        },
+        "receiver": {
+            "tier": receiver.tier,
+            "is_flagged": receiver.is_flagged,
+            "created_at": receiver.created_at.isoformat(),
+        },
+    }
+
+
+def _user(attributes: dict, moment: datetime, last_sent_at=None) -> ScoringUser:
+    attributes = dict(attributes)
+    attributes["created_at"] = datetime.fromisoformat(attributes["created_at"])
+    if last_sent_at:
+        last_sent_at = datetime.fromisoformat(last_sent_at)
+    return ScoringUser(attributes, moment, last_sent_at)
+
+
+def evaluate_rules(rules: list, sender, receiver, amount, moment: datetime) -> int:
+    codes = 0
+    for rule in rules:
+        if rule.check(sender, receiver, amount, moment):
+            codes |= rule.code
+    return int(codes)
+
+
+def _tally(challenger: str, day: date, counts: dict) -> None:
+    """Adds counts to the challenger's row of the day in a single UPDATE"""
+    updated = ShadowTally.objects.filter(challenger=challenger, day=day).update(
+        **{field: F(field) + value for field, value in counts.items()}
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            ShadowTally.objects.create(challenger=challenger, day=day, **counts)
+    except IntegrityError:
+        _tally(challenger, day, counts)
+
+
+def record_shadow_evaluation(transaction_id, inputs: dict) -> dict:
+    """Evaluates the champion and every enabled challenger on `inputs` (see
+    capture_inputs, plus the transaction's "moment") and records the
+    outcome. Returns the violation codes of each rule set."""
+    moment = datetime.fromisoformat(inputs["moment"])
+    amount = Decimal(inputs["amount"])
+    sender_inputs = inputs["sender"]
+    sender = _user(sender_inputs, moment, sender_inputs["last_sent_at"])
+    receiver = _user(inputs["receiver"], moment)
+    champion = evaluate_rules(POLICY_RULES, sender, receiver, amount, moment)
+
+    results = {"champion": champion}
+    disagreements = []
+    for name, rules in get_challengers().items():
+        codes = evaluate_rules(rules, sender, receiver, amount, moment)
+        results[name] = codes
+        _tally(
+            name,
+            moment.date(),
+            {
+                "evaluated": 1,
+                "champion_flagged": int(bool(champion)),
+                "challenger_flagged": int(bool(codes)),
+                "both_flagged": int(bool(champion and codes)),
+                "disagreements": int(champion != codes),
+            },
+        )
+        if codes != champion:
+            disagreements.append(
+                ShadowDisagreement(
+                    transaction_id=transaction_id,
+                    challenger=name,
+                    champion_codes=champion,
+                    challenger_codes=codes,
+                    created_at=moment,
+                )
+            )
+    ShadowDisagreement.objects.bulk_create(disagreements)
+    return results
+
+
+def challenger_stats(since: date = None) -> list:
+    """Agreement and lift of each challenger over the days since `since`.
+    Lift is the challenger's flag rate relative to the champion's."""
+    tallies = ShadowTally.objects.all()
+    if since is not None:
+        tallies = tallies.filter(day__gte=since)
+    # Aliased because annotations may not reuse the model's field names
+    rows = (
+        tallies.values("challenger")
+        .annotate(**{f"total_{field}": Sum(field) for field in TALLY_FIELDS})
+        .order_by("challenger")
+    )
+    stats = []
+    for row in rows:
+        totals = {field: row[f"total_{field}"] for field in TALLY_FIELDS}
+        evaluated = totals["evaluated"]
+        stats.append(
+            {
+                "challenger": row["challenger"],
+                **totals,
+                "agreement": 1 - totals["disagreements"] / evaluated,
+                "champion_flag_rate": totals["champion_flagged"] / evaluated,
+                "challenger_flag_rate": totals["challenger_flagged"] / evaluated,
+                "lift": (
+                    totals["challenger_flagged"] / totals["champion_flagged"]
+                    if totals["champion_flagged"]
+                    else None
+                ),
+            }
+        )
+    return stats
@@ -0,0 +1,281 @@
+"""Horizontal sharding of transactions.
+
+Each `Transaction` lives in the shard chosen for its sender by rendezvous
+hashing over TRANSACTION_SHARDS, so every sender's writes go to a single
+SQLite file while different senders write to different files in parallel.
+Adding a shard only moves the senders that now hash to it (about 1/N of
+them); `rebalance_transactions` performs the move.
+
+Users and every other model stay in "default". Relations from transactions
+to users therefore cross databases: fetch users with prefetch_related()
+rather than select_related(), and filter on `sender_id`/`receiver_id`
+instead of joining. Reads by sender are routed to one shard, anything else
+(e.g. a user's received transactions) has to `scatter()` over all shards.
+"""
+import hashlib
+import heapq
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from itertools import islice
+
+from common.models import preserve_timestamps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, models
+from django.db import transaction as db_transaction
+from django.db.transaction import TransactionManagementError
+
+from .models import Transaction, User
+
+logger = logging.getLogger(__name__)
+_rollback = threading.local()
+
+
+def get_shards() -> list:
+    return list(settings.TRANSACTION_SHARDS) or [DEFAULT_DB_ALIAS]
+
+
+def is_sharded() -> bool:
+    return bool(settings.TRANSACTION_SHARDS)
+
+
+def get_transaction_databases(include_inactive: bool = False) -> list:
+    """"default" (which keeps rows written before sharding was enabled)
+    and the active shards, or with include_inactive every shard database."""
+    shards = settings.TRANSACTION_SHARD_DATABASES if include_inactive else get_shards()
+    return [DEFAULT_DB_ALIAS] + [alias for alias in shards if alias != DEFAULT_DB_ALIAS]
+
+
+def shard_for(sender_id) -> str:
+    shards = get_shards()
+    if len(shards) == 1:
+        return shards[0]
+    return max(
+        shards,
+        key=lambda alias: hashlib.blake2b(
+            f"{alias}:{sender_id}".encode(), digest_size=8
+        ).digest(),
+    )
+
+
+@contextmanager
+def atomic_with_shards():
+    """atomic() on "default" for work that also writes to shards.
+
+    A shard's atomic block nested in one on "default" commits on its own,
+    before "default" does. Functions registered with `on_rollback()` undo
+    such writes when the block they were registered in does not commit,
+    including when the outermost block fails to COMMIT. A longer transaction
+    wrapping it has to use it too, rather than atomic(), for its own failures
+    to undo the shard writes.
+    """
+    undo = getattr(_rollback, "undo", None)
+    outermost = undo is None
+    if outermost:
+        undo = _rollback.undo = []
+    start = len(undo)
+    try:
+        with db_transaction.atomic():
+            yield
+    except BaseException:
+        for function in reversed(undo[start:]):
+            try:
+                function()
+            except Exception:
+                logger.exception("Could not undo a shard write")
+        del undo[start:]
+        raise
+    finally:
+        if outermost:
+            del _rollback.undo
+
+
+def on_rollback(function) -> None:
+    """Registers `function` to undo a shard write if the enclosing
+    atomic_with_shards() block does not commit"""
+    undo = getattr(_rollback, "undo", None)
+    if undo is None:
+        raise TransactionManagementError(
+            "on_rollback() must be called inside atomic_with_shards()."
+        )
+    undo.append(function)
+
+
+class TransactionRouter:
+    """Routes transactions by sender; other models are left to "default"."""
+
+    def _shard_for_hints(self, model, hints: dict):
+        instance = hints.get("instance")
+        if model is not Transaction:
+            # Users of a transaction are fetched from "default", not from
+            # the transaction's own database as Django would assume.
+            if isinstance(instance, Transaction):
+                return DEFAULT_DB_ALIAS
+            return None
+        if not is_sharded():
+            return None
+        if isinstance(instance, Transaction) and instance.sender_id is not None:
+            return shard_for(instance.sender_id)
+        if isinstance(instance, User):
+            # Related managers of a user (user.sent_funds) hint with the user.
+            return shard_for(instance.pk)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._shard_for_hints(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard_for_hints(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if {type(obj1), type(obj2)} <= {Transaction, User}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.TRANSACTION_SHARD_DATABASES:
+            return app_label == "monitoring" and model_name == "transaction"
+        return None
+
+
+def _get_value(row, field: str):
+    return row[field] if isinstance(row, dict) else getattr(row, field)
+
+
+class ScatterQuerySet:
+    """The same query run on several shards.
+
+    Chained QuerySet methods (filter, order_by, values, ...) are applied to
+    every shard. Results are merged on the first ordering term, and slicing
+    fetches at most `stop` rows per shard, so paginators can page through
+    it without loading whole shards.
+    """
+
+    def __init__(self, querysets: list):
+        self.querysets = querysets
+        self.model = querysets[0].model
+
+    def __getattr__(self, name):
+        if name.startswith("__") or name == "querysets":
+            raise AttributeError(name)
+        attributes = [getattr(queryset, name) for queryset in self.querysets]
+        if not callable(attributes[0]):
+            raise AttributeError(name)
+
+        def scattered(*args, **kwargs):
+            results = [attribute(*args, **kwargs) for attribute in attributes]
+            if isinstance(results[0], models.QuerySet):
+                return ScatterQuerySet(results)
+            raise TypeError(f"{name}() cannot be scattered across shards")
+
+        return scattered
+
+    def map(self, function):
+        """Applies a QuerySet -> QuerySet function to every shard"""
+        return ScatterQuerySet([function(queryset) for queryset in self.querysets])
+
+    @property
+    def ordered(self) -> bool:
+        return all(queryset.ordered for queryset in self.querysets)
+
+    @property
+    def _ordering(self) -> tuple:
+        query = self.querysets[0].query
+        ordering = query.order_by or self.model._meta.ordering
+        if not ordering:
+            return "pk", False
+        term = str(ordering[0])
+        return term.lstrip("-"), term.startswith("-")
+
+    def _merge(self, querysets):
+        field, descending = self._ordering
+        return heapq.merge(
+            *querysets, key=lambda row: _get_value(row, field), reverse=descending
+        )
+
+    def __iter__(self):
+        return self._merge(self.querysets)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.step is not None or index.stop is None:
+                raise ValueError("Only bounded slices of shards are supported")
+            start = index.start or 0
+            merged = self._merge(queryset[: index.stop] for queryset in self.querysets)
+            return list(islice(merged, start, index.stop))
+        rows = self[index : index + 1]
+        if not rows:
+            raise IndexError(index)
+        return rows[0]
+
+    def count(self) -> int:
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def exists(self) -> bool:
+        return any(queryset.exists() for queryset in self.querysets)
+
+    def get(self, *args, **kwargs):
+        found = []
+        for queryset in self.querysets:
+            found += list(queryset.filter(*args, **kwargs)[:2])
+        if not found:
+            raise self.model.DoesNotExist(
+                f"{self.model._meta.object_name} matching query does not exist."
+            )
+        if len(found) > 1:
+            raise self.model.MultipleObjectsReturned(
+                f"get() returned more than one {self.model._meta.object_name}."
+            )
+        return found[0]
+
+
+def scatter(queryset: models.QuerySet):
+    """Runs `queryset` on every shard; a plain QuerySet when not sharded"""
+    if not is_sharded():
+        return queryset
+    return ScatterQuerySet([queryset.using(alias) for alias in get_shards()])
+
+
+def rebalance(batch_size: int = 1000) -> dict:
+    """Moves transactions stored outside their sender's shard.
+
+    Rows are first copied into the target shard and committed, then deleted
+    from the source, so an interruption can leave a row in both places but
+    never in neither; copies ignore conflicts, making a rerun finish the job.
+    Returns the number of rows moved from each database.
+    """
+    moved = defaultdict(int)
+    for source in get_transaction_databases(include_inactive=True):
+        sender_ids = (
+            Transaction.objects.using(source)
+            .order_by()
+            .values_list("sender_id", flat=True)
+            .distinct()
+        )
+        senders_by_target = defaultdict(list)
+        for sender_id in sender_ids:
+            target = shard_for(sender_id)
+            if target != source:
+                senders_by_target[target].append(sender_id)
+        for target, senders in senders_by_target.items():
+            misplaced = Transaction.objects.using(source).filter(sender_id__in=senders)
+            while True:
+                rows = list(misplaced.order_by("pk")[:batch_size])
+                if not rows:
+                    break
+                with preserve_timestamps(Transaction), db_transaction.atomic(
+                    using=target
+                ):
+                    Transaction.objects.using(target).bulk_create(
+                        rows, ignore_conflicts=True
+                    )
+                with db_transaction.atomic(using=source):
+                    Transaction.objects.using(source).filter(
+                        pk__in=[row.pk for row in rows]
+                    ).delete()
+                moved[source] += len(rows)
+    return dict(moved)
@@ -0,0 +1,33 @@
+from django.db import router
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import AmountStatistics, Transaction, User
+from .moderation import users_moderated
+from .outbox import create_outbox
+from .rescoring import schedule_rescore
+from .search import create_search_index
+
+
+@receiver(post_save, sender=Transaction)
+def update_amount_statistics(sender, instance: Transaction, created: bool, **kwargs):
+    if created:
+        AmountStatistics.record(instance.sender_id, instance.amount)
+
+
+@receiver(users_moderated)
+def rescore_flagged_users(sender, user_ids: list, changes: dict, **kwargs):
+    if changes.get("is_flagged"):
+        schedule_rescore(user_ids)
+
+
+def create_user_search_index(using: str, **kwargs):
+    """Connected to post_migrate in MonitoringConfig.ready()"""
+    if router.allow_migrate_model(using, User):
+        create_search_index(using)
+
+
+def create_flagged_outbox(using: str, **kwargs):
+    """Connected to post_migrate in MonitoringConfig.ready()"""
+    if router.allow_migrate_model(using, Transaction):
+        create_outbox(using)
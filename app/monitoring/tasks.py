@@ -1,4 +1,7 @@
+from datetime import datetime, timezone
+
 from core.celery import APP
+from django.db.models import F
 from django.template.loader import get_template
 
 
@@ -9,3 +12,77 @@ def send_policy_email(email_data):
     html_template = get_template("emails/transaction_violation_template.html")
     html_alternative = html_template.render(email_data)
     send_email("Policy Violation Detected", email_data["email"], html_alternative)
+
+
+@APP.task()
+def reevaluate_deferred_rules(transaction_id, sender_id):
+    """Runs the policy rules deferred by the latency budget and, when one is
+    violated, flags the transaction and notifies the sender. Clearing
+    deferred_codes claims the evaluation, so a retried or duplicate task
+    neither flags nor emails twice. Each deferred rule is counted in the
+    task metrics."""
+    from core.task_metrics import registry
+
+    from .enums import ViolationCode
+    from .models import Transaction
+    from .sharding import shard_for
+    from .utils import evaluate_deferred_rules
+
+    transactions = Transaction.objects.using(shard_for(sender_id))
+    transaction = transactions.get(pk=transaction_id)
+    if not transaction.deferred_codes:
+        return
+    result = evaluate_deferred_rules(transaction)
+    changes = {"deferred_codes": 0}
+    if result["violation_codes"]:
+        changes.update(
+            is_flagged=True,
+            updated_at=datetime.now(timezone.utc),
+            violation_codes=F("violation_codes").bitor(result["violation_codes"]),
+        )
+    claimed = transactions.filter(
+        pk=transaction.pk, deferred_codes=transaction.deferred_codes
+    ).update(**changes)
+    if not claimed:
+        return
+    for name in ViolationCode.names(transaction.deferred_codes):
+        registry.count(reevaluate_deferred_rules.name, f"deferred_{name}")
+    if not result["violation_codes"]:
+        return
+    send_policy_email(
+        {
+            "email": transaction.sender.email,
+            "message": result["violation_message"],
+            "user_name": transaction.sender.firstname,
+        }
+    )
+
+
+@APP.task()
+def export_analytics_snapshot():
+    from .analytics import export_snapshot
+
+    return export_snapshot()
+
+
+@APP.task()
+def purge_idempotency_keys():
+    from .idempotency import purge_expired_keys
+
+    return purge_expired_keys()
+
+
+@APP.task()
+def evaluate_shadow_rules(transaction_id, inputs):
+    """Replays a sampled transfer against the challenger rule sets"""
+    from .shadow import record_shadow_evaluation
+
+    return record_shadow_evaluation(transaction_id, inputs)
+
+
+@APP.task()
+def rescore_flagged_recipients(user_ids):
+    """Flags recent transfers to users who have since been flagged"""
+    from .rescoring import flag_transfers_to
+
+    return flag_transfers_to(user_ids)
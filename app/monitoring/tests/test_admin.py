@@ -0,0 +1,144 @@
+import pytest
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from monitoring.enums import ViolationCode
+from monitoring.models import Transaction, User
+from monitoring.sharding import shard_for
+
+from .factories import TransactionFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def admin_client(user_factory):
+    client = Client()
+    client.force_login(user_factory(is_admin=True))
+    return client
+
+
+def count_queries(queries: list) -> list:
+    return [query["sql"] for query in queries if "COUNT(" in query["sql"].upper()]
+
+
+class TestAdmin:
+    user_changelist_url = reverse("admin:monitoring_user_changelist")
+    transaction_changelist_url = reverse("admin:monitoring_transaction_changelist")
+
+    def test_only_admins_can_use_admin(self, user_factory):
+        client = Client()
+        client.force_login(user_factory())
+        response = client.get(self.user_changelist_url)
+        assert response.status_code == 302
+
+    def test_create_superuser_makes_an_admin(self):
+        user = User.objects.create_superuser("root@example.com", "passer@@@111")
+        assert user.is_admin and user.is_staff and user.is_active
+
+    def test_unfiltered_changelist_uses_row_estimate(
+        self, admin_client, user_factory, settings
+    ):
+        settings.ADMIN_EXACT_COUNT_LIMIT = 3
+        sender, receiver = user_factory(), user_factory()
+        TransactionFactory.create_batch(5, sender=sender, receiver=receiver)
+
+        with CaptureQueriesContext(connection) as context:
+            response = admin_client.get(self.transaction_changelist_url)
+        assert response.status_code == 200
+        assert response.context["cl"].result_count == 5
+        assert count_queries(context.captured_queries) == []
+        assert any("MAX(rowid)" in query["sql"] for query in context.captured_queries)
+
+    def test_filtered_changelist_count_is_capped(self, admin_client, user_factory, settings):
+        settings.ADMIN_EXACT_COUNT_LIMIT = 3
+        sender, receiver = user_factory(), user_factory()
+        TransactionFactory.create_batch(
+            4,
+            sender=sender,
+            receiver=receiver,
+            is_flagged=True,
+            violation_codes=ViolationCode.TIER_LIMIT,
+        )
+        TransactionFactory(sender=sender, receiver=receiver)
+
+        response = admin_client.get(self.transaction_changelist_url, {"is_flagged__exact": 1})
+        assert response.context["cl"].result_count == 3
+
+        settings.ADMIN_EXACT_COUNT_LIMIT = 100
+        response = admin_client.get(self.transaction_changelist_url, {"violation": "tier_limit"})
+        assert response.context["cl"].result_count == 4
+
+    def test_changelist_query_count_does_not_grow(
+        self, admin_client, user_factory, django_assert_max_num_queries
+    ):
+        for _ in range(20):
+            TransactionFactory(sender=user_factory(), receiver=user_factory())
+        with django_assert_max_num_queries(10):
+            response = admin_client.get(self.transaction_changelist_url)
+        assert response.status_code == 200
+        assert len(response.context["cl"].result_list) == 20
+
+    def test_bulk_actions(self, admin_client, user_factory):
+        users = user_factory.create_batch(3)
+        response = admin_client.post(
+            self.user_changelist_url,
+            {"action": "flag_users", "_selected_action": [user.pk for user in users[:2]]},
+        )
+        assert response.status_code == 302
+        assert set(User.objects.filter(is_flagged=True)) == set(users[:2])
+
+        flagged = TransactionFactory(
+            sender=users[0],
+            receiver=users[1],
+            is_flagged=True,
+            violation_codes=ViolationCode.NEW_RECIPIENT,
+        )
+        admin_client.post(
+            self.transaction_changelist_url,
+            {"action": "clear_flags", "_selected_action": [flagged.pk]},
+        )
+        flagged.refresh_from_db()
+        assert not flagged.is_flagged and flagged.violation_codes == 0
+
+    def test_change_form_uses_raw_id_widgets(self, admin_client, user_factory):
+        transaction = TransactionFactory(sender=user_factory(), receiver=user_factory())
+        response = admin_client.get(
+            reverse("admin:monitoring_transaction_change", args=[transaction.pk])
+        )
+        assert response.status_code == 200
+        assert "vForeignKeyRawIdAdminField" in response.content.decode()
+
+
+class TestShardedAdmin:
+    pytestmark = pytest.mark.django_db(databases="__all__")
+
+    def test_changelist_and_change_form_read_from_shards(
+        self, admin_client, user_factory, settings
+    ):
+        settings.TRANSACTION_SHARDS = ["transactions_0", "transactions_1"]
+        senders = user_factory.create_batch(6)
+        # Senders are hashed to shards; make sure both get some
+        while len({shard_for(sender.pk) for sender in senders}) < 2:
+            senders.append(user_factory())
+        receiver = user_factory()
+        for sender in senders:
+            TransactionFactory(sender=sender, receiver=receiver)
+        counts = {
+            alias: Transaction.objects.using(alias).count()
+            for alias in settings.TRANSACTION_SHARDS
+        }
+
+        for alias, count in counts.items():
+            response = admin_client.get(
+                reverse("admin:monitoring_transaction_changelist"), {"shard": alias}
+            )
+            assert response.status_code == 200
+            assert response.context["cl"].result_count == count
+
+        transaction = Transaction.objects.using("transactions_1").first()
+        response = admin_client.get(
+            reverse("admin:monitoring_transaction_change", args=[transaction.pk])
+        )
+        assert response.status_code == 200
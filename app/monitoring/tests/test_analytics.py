@@ -0,0 +1,99 @@
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from django.core.management import call_command
+from monitoring.enums import ViolationCode
+from monitoring.models import Transaction
+
+from .factories import TransactionFactory
+
+np = pytest.importorskip("numpy")
+from monitoring.analytics import Snapshot, export_snapshot  # noqa: E402
+
+pytestmark = pytest.mark.django_db
+
+DAY = date(2023, 8, 1)
+
+
+@pytest.fixture(autouse=True)
+def analytics_root(settings, tmp_path):
+    settings.ANALYTICS_ROOT = str(tmp_path / "analytics")
+    return tmp_path / "analytics"
+
+
+def make_transaction(day: date, hour: int, **kwargs):
+    transaction = TransactionFactory(**kwargs)
+    created_at = datetime(day.year, day.month, day.day, hour, tzinfo=timezone.utc)
+    Transaction.objects.filter(id=transaction.id).update(created_at=created_at)
+    return transaction
+
+
+class TestAnalyticsSnapshot:
+    def test_export_writes_complete_days_as_columns(self, user_factory, analytics_root):
+        alice, bob = user_factory(), user_factory()
+        make_transaction(DAY, 9, sender=alice, receiver=bob, amount="10.25")
+        make_transaction(DAY, 8, sender=bob, receiver=alice, amount=3)
+        make_transaction(DAY + timedelta(days=1), 8, sender=alice, receiver=bob)
+
+        exported = export_snapshot(until=DAY + timedelta(days=1))
+
+        assert exported == {"2023-08-01": 2}
+        partition = Snapshot().partitions()[0]
+        assert partition.day == DAY
+        assert isinstance(partition["amount"], np.memmap)
+        assert partition["amount"].tolist() == [300, 1025]
+        assert np.all(np.diff(partition["created_at"]) > 0)
+        assert partition["created_at"][0] == int(
+            datetime(2023, 8, 1, 8, tzinfo=timezone.utc).timestamp() * 1_000_000
+        )
+        assert (analytics_root / "transactions/2023/08/01/sender.npy").exists()
+
+    def test_rerun_only_refreshes_recent_days_and_keeps_user_codes(self, user_factory):
+        alice, bob = user_factory(), user_factory()
+        old = make_transaction(DAY, 9, sender=alice, receiver=bob)
+        recent = make_transaction(DAY + timedelta(days=5), 9, sender=alice, receiver=bob)
+        assert set(export_snapshot(until=DAY + timedelta(days=6))) == {
+            "2023-08-01",
+            "2023-08-06",
+        }
+        codes = {user.id: Snapshot().user_code(user.id) for user in (alice, bob)}
+
+        Transaction.objects.filter(id__in=[old.id, recent.id]).update(is_flagged=True)
+        user_factory()
+        exported = export_snapshot(until=DAY + timedelta(days=6), refresh_days=2)
+
+        assert set(exported) == {"2023-08-06"}
+        snapshot = Snapshot()
+        assert len(snapshot.users) == 3
+        assert {user_id: snapshot.user_code(user_id) for user_id in codes} == codes
+        assert snapshot.select(flagged=True).count() == 1
+
+    def test_select_filters_and_aggregates(self, user_factory):
+        alice, bob, carol = user_factory(), user_factory(), user_factory()
+        make_transaction(DAY, 1, sender=alice, receiver=bob, amount=100)
+        make_transaction(
+            DAY,
+            2,
+            sender=alice,
+            receiver=carol,
+            amount=250,
+            is_flagged=True,
+            violation_codes=ViolationCode.NEW_RECIPIENT,
+        )
+        make_transaction(DAY + timedelta(days=1), 3, sender=bob, receiver=carol, amount=40)
+        call_command("export_analytics_snapshot", until=DAY + timedelta(days=2))
+        snapshot = Snapshot()
+
+        assert snapshot.select().count() == 3
+        assert snapshot.select(start=DAY + timedelta(days=1)).sum() == 4000
+        assert snapshot.select(sender=alice.id).sum() == 35000
+        assert snapshot.select(violation=ViolationCode.NEW_RECIPIENT).count() == 1
+        assert snapshot.select(min_amount=50, max_amount=100).count() == 1
+        assert snapshot.select(sender=user_factory().id).count() == 0
+        assert snapshot.select(receiver=carol.id).top_users(by="sender", column="amount") == [
+            (alice.id, 25000),
+            (bob.id, 4000),
+        ]
+        assert snapshot.select().group_by_user(by="receiver")[
+            snapshot.user_code(carol.id)
+        ] == 2
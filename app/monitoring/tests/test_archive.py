@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.urls import reverse
+from monitoring import archive
+from monitoring.archive import get_archived_transaction, iter_archived_transactions
+from monitoring.models import Transaction
+
+from .conftest import api_client_with_credentials
+from .factories import TransactionFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def archive_root(settings, tmp_path):
+    settings.ARCHIVE_ROOT = str(tmp_path / "archive")
+    return tmp_path / "archive"
+
+
+def make_old_transaction(days_old: int, **kwargs):
+    transaction = TransactionFactory(**kwargs)
+    Transaction.objects.filter(id=transaction.id).update(
+        created_at=datetime.now(timezone.utc) - timedelta(days=days_old)
+    )
+    return transaction
+
+
+class TestArchive:
+    archive_list_url = reverse("transaction:archived-transaction-list")
+
+    def test_archive_command_moves_old_transactions(self, user_factory, archive_root):
+        sender, receiver = user_factory(), user_factory()
+        old = make_old_transaction(120, sender=sender, receiver=receiver, amount=50)
+        make_old_transaction(121, sender=sender, receiver=receiver)
+        recent = TransactionFactory(sender=sender, receiver=receiver)
+
+        call_command("archive_transactions", days=90)
+
+        assert list(Transaction.objects.values_list("id", flat=True)) == [recent.id]
+        assert len(list(archive_root.glob("*/*/*/*.jsonl.gz"))) == 2
+        archived = get_archived_transaction(old.id)
+        assert archived["amount"] == "50.00"
+        assert archived["sender_id"] == str(sender.id)
+        assert len(list(iter_archived_transactions(user_id=receiver.id))) == 2
+        assert list(iter_archived_transactions(user_id=user_factory().id)) == []
+
+    def test_retrieve_archived_transactions(
+        self, api_client, user_factory, authenticate_user
+    ):
+        user = authenticate_user()
+        own = make_old_transaction(
+            100, sender=user["user_instance"], receiver=user_factory(), amount=75
+        )
+        unowned = make_old_transaction(
+            100, sender=user_factory(), receiver=user_factory()
+        )
+        call_command("archive_transactions", days=90)
+
+        api_client_with_credentials(user["token"], api_client)
+        response = api_client.get(self.archive_list_url)
+        assert response.status_code == 200
+        assert response.json()["total"] == 1
+        assert response.json()["results"][0]["id"] == str(own.id)
+
+        url = reverse("transaction:archived-transaction-detail", kwargs={"pk": own.id})
+        response = api_client.get(url)
+        assert response.status_code == 200
+        assert response.json()["amount"] == "75.00"
+
+        url = reverse(
+            "transaction:archived-transaction-detail", kwargs={"pk": unowned.id}
+        )
+        assert api_client.get(url).status_code == 404
+
+    def test_list_pages_through_segments_lazily(
+        self, api_client, user_factory, authenticate_user, mocker
+    ):
+        user = authenticate_user()
+        for days_old in range(100, 106):
+            make_old_transaction(
+                days_old, sender=user["user_instance"], receiver=user_factory()
+            )
+        call_command("archive_transactions", days=90)
+        read_segment = mocker.spy(archive, "_read_segment")
+
+        api_client_with_credentials(user["token"], api_client)
+        response = api_client.get(self.archive_list_url, {"page": 2, "page_size": 2})
+
+        assert response.status_code == 200
+        assert response.json()["total"] == 6
+        assert len(response.json()["results"]) == 2
+        # One segment per day; only the two on the page are decompressed
+        assert read_segment.call_count == 2
+
+    def test_failed_batch_leaves_no_segment(self, user_factory, archive_root, mocker):
+        make_old_transaction(120, sender=user_factory(), receiver=user_factory())
+        mocker.patch(
+            "django.db.models.query.QuerySet.delete", side_effect=DatabaseError
+        )
+
+        with pytest.raises(DatabaseError):
+            call_command("archive_transactions", days=90)
+
+        assert Transaction.objects.count() == 1
+        assert list(archive_root.glob("*/*/*/*")) == []
+
+    def test_interrupted_batch_is_finished_by_next_run(
+        self, user_factory, archive_root
+    ):
+        committed = make_old_transaction(
+            120, sender=user_factory(), receiver=user_factory()
+        )
+        rolled_back = make_old_transaction(
+            121, sender=user_factory(), receiver=user_factory()
+        )
+        for transaction in (committed, rolled_back):
+            row = Transaction.objects.values(*archive.ARCHIVE_FIELDS).get(
+                id=transaction.id
+            )
+            archive.write_segment(transaction.created_at.date(), [row], pending=True)
+        Transaction.objects.filter(id=committed.id).delete()
+
+        archive.recover_pending_segments()
+
+        assert get_archived_transaction(committed.id)["id"] == str(committed.id)
+        assert get_archived_transaction(rolled_back.id) is None
+        assert list(archive_root.glob("*/*/*/*.pending")) == []
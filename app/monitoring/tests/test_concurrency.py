@@ -0,0 +1,163 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from django.db import OperationalError, connection
+from monitoring.enums import ViolationCode
+from monitoring.locks import StripedLock, sender_locks
+from monitoring.models import AmountStatistics, Transaction
+from monitoring.serializers import (
+    MakeTransactionSerializer,
+    TransferBusy,
+    TransferConflict,
+)
+
+
+def make_transfer(sender, recipient, amount="200.00"):
+    request = type("Request", (), {"user": sender})()
+    serializer = MakeTransactionSerializer(context={"request": request})
+    try:
+        return serializer.create({"recipient": recipient, "amount": Decimal(amount)})
+    finally:
+        connection.close()
+
+
+@pytest.fixture
+def old_recipient(user_factory):
+    recipient = user_factory()
+    recipient.created_at = datetime.now(timezone.utc) - timedelta(days=1)
+    recipient.save()
+    return recipient
+
+
+class TestSenderSerialization:
+    def test_striped_lock_serializes_same_key(self):
+        locks = StripedLock(stripes=8)
+        counter = {"value": 0, "overlap": 0, "active": 0}
+
+        def work():
+            for _ in range(200):
+                with locks.hold("sender-1"):
+                    counter["active"] += 1
+                    if counter["active"] > 1:
+                        counter["overlap"] += 1
+                    counter["value"] += 1
+                    counter["active"] -= 1
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert counter == {"value": 1600, "overlap": 0, "active": 0}
+
+    @pytest.mark.django_db(transaction=True)
+    def test_concurrent_transfers_from_one_sender_are_ordered(
+        self, user_factory, old_recipient, mocker
+    ):
+        mocker.patch("monitoring.tasks.send_policy_email.delay")
+        sender = user_factory()
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            list(pool.map(lambda _: make_transfer(sender, old_recipient), range(6)))
+
+        transactions = Transaction.objects.filter(sender=sender)
+        assert transactions.count() == 6
+        # Only the first transfer may pass the one minute timing window.
+        assert transactions.filter(is_flagged=False).count() == 1
+        assert transactions.with_violations(ViolationCode.TIMING_WINDOW).count() == 5
+
+    @pytest.mark.django_db(transaction=True)
+    def test_different_senders_proceed_in_parallel(
+        self, user_factory, old_recipient, mocker
+    ):
+        mocker.patch("monitoring.tasks.send_policy_email.delay")
+        first_sender = user_factory()
+        second_sender = user_factory()
+        while sender_locks.stripe(second_sender.pk) == sender_locks.stripe(
+            first_sender.pk
+        ):
+            second_sender = user_factory()
+
+        with sender_locks.hold(first_sender.pk):
+            # The first sender's stripe is held, yet the second sender's
+            # transfer completes without waiting for it.
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                future = pool.submit(make_transfer, second_sender, old_recipient)
+                assert future.result(timeout=5).sender_id == second_sender.pk
+
+    @pytest.mark.django_db
+    def test_transfer_retried_when_another_process_sent_first(
+        self, user_factory, old_recipient, mocker
+    ):
+        sender = user_factory()
+        original = AmountStatistics.advance_last_sent
+        observed_values = []
+
+        def advance(user_id, observed, sent_at):
+            observed_values.append(observed)
+            if len(observed_values) == 1:
+                return False  # last_sent_at moved on since it was read
+            return original(user_id, observed, sent_at)
+
+        mocker.patch.object(AmountStatistics, "advance_last_sent", side_effect=advance)
+        request = type("Request", (), {"user": sender})()
+        transaction = MakeTransactionSerializer(context={"request": request}).create(
+            {"recipient": old_recipient, "amount": Decimal("200.00")}
+        )
+        assert len(observed_values) == 2
+        # The first attempt's insert was rolled back.
+        assert list(Transaction.objects.filter(sender=sender)) == [transaction]
+        assert AmountStatistics.get_last_sent(sender.pk) == transaction.created_at
+
+    @pytest.mark.django_db
+    def test_conflict_after_repeated_interference(
+        self, user_factory, old_recipient, mocker
+    ):
+        mocker.patch.object(AmountStatistics, "advance_last_sent", return_value=False)
+        sender = user_factory()
+        request = type("Request", (), {"user": sender})()
+        with pytest.raises(TransferConflict):
+            MakeTransactionSerializer(context={"request": request}).create(
+                {"recipient": old_recipient, "amount": Decimal("200.00")}
+            )
+        assert not Transaction.objects.filter(sender=sender).exists()
+
+    @pytest.mark.django_db(transaction=True)
+    def test_concurrent_transfers_from_many_senders_all_commit(
+        self, user_factory, old_recipient, mocker
+    ):
+        mocker.patch("monitoring.tasks.send_policy_email.delay")
+        senders = [user_factory() for _ in range(8)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda sender: make_transfer(sender, old_recipient), senders))
+
+        assert Transaction.objects.count() == 8
+
+    @pytest.mark.django_db
+    def test_lock_errors_are_retried(self, user_factory, old_recipient, mocker):
+        mocker.patch("monitoring.serializers.LOCK_RETRY_DELAY", 0)
+        lock = mocker.patch.object(
+            AmountStatistics,
+            "lock_for_transfer",
+            side_effect=[OperationalError("database is locked"), None],
+        )
+        sender = user_factory()
+        request = type("Request", (), {"user": sender})()
+        transaction = MakeTransactionSerializer(context={"request": request}).create(
+            {"recipient": old_recipient, "amount": Decimal("200.00")}
+        )
+        assert lock.call_count == 2
+        assert list(Transaction.objects.filter(sender=sender)) == [transaction]
+
+        lock.side_effect = OperationalError("database is locked")
+        with pytest.raises(TransferBusy):
+            MakeTransactionSerializer(context={"request": request}).create(
+                {"recipient": old_recipient, "amount": Decimal("200.00")}
+            )
+        lock.side_effect = OperationalError("no such table: stats")
+        with pytest.raises(OperationalError):
+            MakeTransactionSerializer(context={"request": request}).create(
+                {"recipient": old_recipient, "amount": Decimal("200.00")}
+            )
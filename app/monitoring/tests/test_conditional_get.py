@@ -0,0 +1,102 @@
+import time
+
+import pytest
+from django.urls import reverse
+from django.utils.http import http_date
+from monitoring.models import Transaction
+
+from .conftest import api_client_with_credentials
+from .factories import TransactionFactory
+
+pytestmark = pytest.mark.django_db
+
+
+class TestConditionalGet:
+    transaction_list_url = reverse("transaction:transaction-list")
+
+    @pytest.fixture
+    def user(self, api_client, authenticate_user):
+        user = authenticate_user()
+        api_client_with_credentials(user["token"], api_client)
+        return user["user_instance"]
+
+    def test_unchanged_list_is_not_modified(
+        self, api_client, user_factory, user, django_assert_max_num_queries
+    ):
+        other = user_factory()
+        transaction = TransactionFactory(sender=user, receiver=other)
+        response = api_client.get(self.transaction_list_url)
+        etag = response["ETag"]
+        assert response.status_code == 200
+        assert etag.startswith('W/"')
+        assert "Last-Modified" not in response
+
+        with django_assert_max_num_queries(2):  # authentication and validators
+            response = api_client.get(self.transaction_list_url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response["ETag"] == etag
+        assert not response.content
+
+        response = api_client.get(
+            self.transaction_list_url, {"is_flagged": True}, HTTP_IF_NONE_MATCH=etag
+        )
+        assert response.status_code == 200
+
+        transaction.is_flagged = True
+        transaction.save()
+        response = api_client.get(self.transaction_list_url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        etag = response["ETag"]
+
+        Transaction.objects.filter(pk=transaction.pk).delete()
+        response = api_client.get(self.transaction_list_url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response.json()["results"] == []
+
+    def test_list_ignores_if_modified_since(self, api_client, user_factory, user):
+        other = user_factory()
+        leaving, _staying = TransactionFactory.create_batch(
+            2, sender=user, receiver=other, is_flagged=True
+        )
+        # Leaves the filtered list without moving the latest updated_at in it
+        Transaction.objects.filter(pk=leaving.pk).update(is_flagged=False)
+
+        response = api_client.get(
+            self.transaction_list_url,
+            {"is_flagged": True},
+            HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60),
+        )
+        assert response.status_code == 200
+        assert len(response.json()["results"]) == 1
+
+    def test_unchanged_detail_is_not_modified(self, api_client, user_factory, user):
+        transaction = TransactionFactory(sender=user, receiver=user_factory())
+        url = reverse("transaction:transaction-detail", args=[transaction.id])
+        response = api_client.get(url)
+        assert response.status_code == 200
+
+        response = api_client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        assert response.status_code == 304
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        assert response.status_code == 304
+
+        transaction.save()
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        assert response.status_code == 200
+        assert response.json()["id"] == str(transaction.id)
+
+    def test_validators_depend_on_user(self, api_client, user, authenticate_user):
+        response = api_client.get(reverse("user:user-detail", args=[user.id]))
+        assert response.status_code == 200
+        etag = response["ETag"]
+        assert "Authorization" in response["Vary"]
+
+        user.firstname = "Changed"
+        user.save()
+        response = api_client.get(
+            reverse("user:user-detail", args=[user.id]), HTTP_IF_NONE_MATCH=etag
+        )
+        assert response.status_code == 200
+        assert response.json()["firstname"] == "Changed"
@@ -0,0 +1,67 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+from uuid import uuid4
+
+import pytest
+from core.renderers import FastJSONRenderer
+from django.urls import reverse
+from monitoring.enums import ViolationCode
+from rest_framework.renderers import JSONRenderer
+
+from .conftest import api_client_with_credentials
+from .factories import TransactionFactory
+
+pytestmark = pytest.mark.django_db
+
+
+class TestFastList:
+    transaction_list_url = reverse("transaction:transaction-list")
+    user_list_url = reverse("user:user-list")
+
+    def get_both(self, api_client, settings, url, params=None):
+        settings.FAST_LIST_SERIALIZATION = True
+        fast = api_client.get(url, params)
+        settings.FAST_LIST_SERIALIZATION = False
+        standard = api_client.get(url, params)
+        assert fast.status_code == standard.status_code == 200
+        return fast, standard
+
+    def test_transaction_list_matches_serializer(
+        self, api_client, user_factory, authenticate_user, settings
+    ):
+        user = authenticate_user()
+        TransactionFactory(
+            sender=user["user_instance"],
+            receiver=user_factory(firstname="Ada"),
+            amount="1234.50",
+            is_flagged=True,
+            violation_codes=ViolationCode.TIER_LIMIT | ViolationCode.NEW_RECIPIENT,
+        )
+        TransactionFactory(receiver=user["user_instance"], sender=user_factory())
+        api_client_with_credentials(user["token"], api_client)
+
+        fast, standard = self.get_both(
+            api_client, settings, self.transaction_list_url, {"ordering": "created_at"}
+        )
+        assert fast.content == standard.content
+        assert fast.json()["results"][0]["amount"] == "1234.50"
+
+    def test_user_list_matches_serializer(
+        self, api_client, user_factory, authenticate_user, settings
+    ):
+        user_factory.create_batch(3)
+        user = authenticate_user(is_admin=True)
+        api_client_with_credentials(user["token"], api_client)
+        fast, standard = self.get_both(api_client, settings, self.user_list_url)
+        assert fast.content == standard.content
+        assert fast.json()["total"] == 4
+
+    def test_fast_renderer_matches_json_renderer(self):
+        data = {
+            "id": uuid4(),
+            "at": datetime(2023, 8, 27, 10, 0, 0, 123456, tzinfo=timezone.utc),
+            "amount": Decimal("1.50"),
+            "name": "Ọlá",
+            "firstname": "line\u2028para\u2029end",
+        }
+        assert FastJSONRenderer().render(data) == JSONRenderer().render(data)
@@ -0,0 +1,123 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import time_machine
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+from monitoring.models import IdempotencyKey, Transaction
+
+from .conftest import api_client_with_credentials
+
+pytestmark = pytest.mark.django_db
+
+SEND_POLICY_MAIL = "monitoring.tasks.send_policy_email.delay"
+
+
+class TestIdempotency:
+    transaction_list_url = reverse("transaction:transaction-list")
+
+    @pytest.fixture
+    def sender(self, api_client, authenticate_user, mocker):
+        mocker.patch(SEND_POLICY_MAIL)
+        user = authenticate_user()
+        api_client_with_credentials(user["token"], api_client)
+        return user["user_instance"]
+
+    def transfer(self, api_client, recipient, amount="100.00", key="transfer-1"):
+        return api_client.post(
+            self.transaction_list_url,
+            {"recipient": recipient.id, "amount": amount},
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_original_response(
+        self,
+        api_client,
+        user_factory,
+        sender,
+        django_assert_max_num_queries,
+        django_capture_on_commit_callbacks,
+    ):
+        recipient = user_factory()
+        # The response is cached once the transfer commits
+        with django_capture_on_commit_callbacks(execute=True):
+            first = self.transfer(api_client, recipient)
+        assert first.status_code == 200
+        assert "Idempotent-Replayed" not in first
+
+        with django_assert_max_num_queries(2):  # authentication only
+            retry = self.transfer(api_client, recipient)
+        assert retry.status_code == 200
+        assert retry.json() == first.json()
+        assert retry["Idempotent-Replayed"] == "true"
+        assert Transaction.objects.filter(sender=sender).count() == 1
+
+        cache.clear()
+        retry = self.transfer(api_client, recipient)
+        assert retry["Idempotent-Replayed"] == "true"
+        assert Transaction.objects.filter(sender=sender).count() == 1
+
+        assert self.transfer(api_client, recipient, key="transfer-2").status_code == 200
+        assert Transaction.objects.filter(sender=sender).count() == 2
+
+    def test_key_reused_with_different_request_is_rejected(
+        self, api_client, user_factory, sender
+    ):
+        recipient = user_factory()
+        self.transfer(api_client, recipient)
+        response = self.transfer(api_client, recipient, amount="999.00")
+        assert response.status_code == 422
+        assert Transaction.objects.filter(sender=sender).count() == 1
+
+    def test_in_progress_and_failed_requests(self, api_client, user_factory, sender):
+        recipient = user_factory()
+        now = datetime.now(timezone.utc)
+        record = IdempotencyKey.objects.create(
+            user=sender,
+            key="transfer-1",
+            fingerprint="",
+            locked_at=now,
+            expires_at=now + timedelta(days=1),
+        )
+        assert self.transfer(api_client, recipient).status_code == 409
+
+        IdempotencyKey.objects.filter(pk=record.pk).update(
+            locked_at=now - timedelta(minutes=5)
+        )
+        assert self.transfer(api_client, recipient).status_code == 200
+        assert Transaction.objects.filter(sender=sender).count() == 1
+
+        response = self.transfer(api_client, sender, key="to-self")
+        assert response.status_code == 400
+        assert not IdempotencyKey.objects.filter(key="to-self").exists()
+
+        response = self.transfer(api_client, recipient, key="x" * 256)
+        assert response.status_code == 400
+
+    def test_response_is_stored_with_the_transfer(
+        self, api_client, user_factory, sender, mocker
+    ):
+        recipient = user_factory()
+        mocker.patch(
+            "monitoring.idempotency.complete", side_effect=RuntimeError("crashed")
+        )
+        with pytest.raises(RuntimeError):
+            self.transfer(api_client, recipient)
+        assert not Transaction.objects.filter(sender=sender).exists()
+        assert not IdempotencyKey.objects.filter(user=sender).exists()
+
+    def test_expired_keys_are_purged(self, api_client, user_factory, sender):
+        recipient = user_factory()
+        self.transfer(api_client, recipient, key="old")
+        self.transfer(api_client, recipient, key="new")
+        with time_machine.travel(datetime.now(timezone.utc) + timedelta(hours=23)):
+            call_command("purge_idempotency_keys")
+        assert IdempotencyKey.objects.count() == 2
+
+        IdempotencyKey.objects.filter(key="old").update(
+            expires_at=datetime.now(timezone.utc)
+        )
+
+        call_command("purge_idempotency_keys")
+        assert list(IdempotencyKey.objects.values_list("key", flat=True)) == ["new"]
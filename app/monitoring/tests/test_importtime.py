@@ -0,0 +1,25 @@
+from core.importtime import ImportReport, measure, parse_importtime
+
+SAMPLE_OUTPUT = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |     celery.five
+import time:      2000 |       2120 |   celery.app
+import time:       500 |       2620 | celery
+import time:       300 |        300 | monitoring.utils
+"""
+
+
+class TestImportTime:
+    def test_parse_importtime(self):
+        report = ImportReport("web", parse_importtime(SAMPLE_OUTPUT))
+        assert len(report.modules) == 4
+        assert report.total_ms == 2.92
+        assert report.slowest(1) == [("celery", 2.62)]
+        assert report.imported("celery")
+        assert not report.imported("cel")
+
+    def test_web_entry_point_does_not_import_celery(self):
+        report = measure("web")
+        assert report.imported("monitoring.views")
+        assert not report.imported("celery")
+        assert not report.imported("monitoring.tasks")
+        assert not report.imported("drf_spectacular")
@@ -0,0 +1,206 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.urls import reverse
+from monitoring.live import (
+    STREAM_PATH,
+    FlaggedFeed,
+    FlaggedPoller,
+    get_feed,
+    reset_feed,
+    with_live_feed,
+)
+from monitoring.models import Transaction
+
+from .factories import TransactionFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def feed(settings):
+    # Streams start the poller thread; tests poll themselves instead
+    settings.LIVE_FEED_POLL_SECONDS = 3600
+    reset_feed()
+    yield get_feed()
+    reset_feed()
+
+
+def stream_scope(token: str = None, last_event_id: int = None) -> dict:
+    headers = []
+    if token:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    if last_event_id:
+        headers.append((b"last-event-id", str(last_event_id).encode()))
+    return {"type": "http", "path": STREAM_PATH, "query_string": b"", "headers": headers}
+
+
+async def run_stream(scope: dict, publish=(), expect: bytes = b"", timeout: float = 5):
+    """Runs the stream until `expect` appears in the body, publishing
+    `publish` once the response has started, then disconnects."""
+    messages = []
+    started, received, disconnect = asyncio.Event(), asyncio.Event(), asyncio.Event()
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+        started.set()
+        if expect in b"".join(message.get("body", b"") for message in messages):
+            received.set()
+
+    task = asyncio.ensure_future(with_live_feed(None)(scope, receive, send))
+    await asyncio.wait_for(started.wait(), timeout)
+    for data in publish:
+        get_feed().publish(data)
+    if not task.done():
+        await asyncio.wait_for(received.wait(), timeout)
+    disconnect.set()
+    await asyncio.wait_for(task, timeout)
+    status = messages[0]["status"]
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return status, body
+
+
+def parse_events(body: bytes) -> list:
+    events = []
+    for block in body.decode().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        if fields.get("event") == "flagged":
+            events.append((int(fields["id"]), json.loads(fields["data"])))
+    return events
+
+
+class TestLiveFeed:
+    transaction_list_url = reverse("transaction:transaction-list")
+
+    def test_replays_buffered_events_after_last_event_id(self):
+        async def scenario():
+            feed = FlaggedFeed(buffer_size=3, queue_size=10)
+            ids = [feed.publish({"n": n}) for n in range(5)]
+            assert ids == sorted(ids)
+            assert [data["n"] for _, data in feed.buffer] == [2, 3, 4]
+
+            subscriber = feed.subscribe(last_event_id=ids[2])
+            assert subscriber.queue.get_nowait() == (ids[3], {"n": 3})
+            assert subscriber.queue.get_nowait() == (ids[4], {"n": 4})
+            assert subscriber.queue.empty()
+
+        async_to_sync(scenario)()
+
+    def test_slow_subscriber_is_disconnected(self):
+        async def scenario():
+            feed = FlaggedFeed(buffer_size=10, queue_size=2)
+            slow, fast = feed.subscribe(), feed.subscribe()
+            for n in range(3):
+                feed.publish({"n": n})
+                await asyncio.sleep(0)
+                if not fast.queue.empty():
+                    fast.queue.get_nowait()
+            assert slow.closed
+            assert slow.queue.get_nowait() is None
+            assert not fast.closed
+
+        async_to_sync(scenario)()
+
+    def test_flagged_transfer_is_published_by_poller(
+        self, api_client, user_factory, authenticate_user, feed, mocker
+    ):
+        mocker.patch("monitoring.tasks.send_policy_email.delay")
+        poller = FlaggedPoller(feed)
+        user = authenticate_user()
+        api_client.credentials(HTTP_AUTHORIZATION="Bearer " + user["token"])
+        new_recipient = user_factory()
+
+        api_client.post(
+            self.transaction_list_url, {"recipient": new_recipient.id, "amount": 10}
+        )
+        assert not feed.buffer
+        assert poller.poll() == 1
+        assert poller.poll() == 0
+
+        [(_event_id, data)] = feed.buffer
+        transaction = user["user_instance"].sent_funds.get()
+        assert data["id"] == str(transaction.id)
+        assert data["violations"] == ["new_recipient"]
+
+    def test_transactions_flagged_later_are_published(self, user_factory, feed):
+        poller = FlaggedPoller(feed)
+        sender, receiver = user_factory(), user_factory()
+        later, _clean = TransactionFactory.create_batch(
+            2, sender=sender, receiver=receiver
+        )
+        assert poller.poll() == 0
+
+        # As the deferred rule task, rescoring and the admin actions do
+        Transaction.objects.filter(pk=later.pk).update(
+            is_flagged=True, violation_codes=4, updated_at=datetime.now(timezone.utc)
+        )
+        assert poller.poll() == 1
+        [(_event_id, data)] = feed.buffer
+        assert data["id"] == str(later.id)
+        assert poller.poll() == 0
+
+    def test_flags_committed_late_are_published(self, user_factory, feed):
+        poller = FlaggedPoller(feed)
+        sender, receiver = user_factory(), user_factory()
+        late, other = TransactionFactory.create_batch(
+            2, sender=sender, receiver=receiver
+        )
+        assert poller.poll() == 0
+
+        Transaction.objects.filter(pk=other.pk).update(
+            is_flagged=True, updated_at=datetime.now(timezone.utc)
+        )
+        assert poller.poll() == 1
+        # Stamped long before it committed, after a newer flag was read
+        Transaction.objects.filter(pk=late.pk).update(
+            is_flagged=True, updated_at=datetime.now(timezone.utc) - timedelta(hours=1)
+        )
+        assert poller.poll() == 1
+        assert [data["id"] for _, data in feed.buffer] == [str(other.id), str(late.id)]
+
+    def test_flags_set_before_the_poller_started_are_skipped(self, user_factory, feed):
+        sender, receiver = user_factory(), user_factory()
+        TransactionFactory(sender=sender, receiver=receiver, is_flagged=True)
+        assert FlaggedPoller(feed).poll() == 0
+
+    def test_stream_requires_admin(self, authenticate_user):
+        status, body = async_to_sync(run_stream)(stream_scope())
+        assert status == 401
+
+        user = authenticate_user()
+        status, body = async_to_sync(run_stream)(stream_scope(user["token"]))
+        assert status == 403
+
+    def test_stream_replays_and_pushes_events(self, authenticate_user, feed, settings):
+        settings.LIVE_FEED_HEARTBEAT_SECONDS = 0.05
+        admin = authenticate_user(is_admin=True)
+        first, second = feed.publish({"n": 1}), feed.publish({"n": 2})
+
+        status, body = async_to_sync(run_stream)(
+            stream_scope(admin["token"], last_event_id=first),
+            publish=[{"n": 3}],
+            expect=b'"n": 3',
+        )
+        assert status == 200
+        events = parse_events(body)
+        assert [data["n"] for _, data in events] == [2, 3]
+        assert events[0][0] == second
+        assert body.startswith(b"retry: ")
+        assert not feed.subscribers
+
+        status, body = async_to_sync(run_stream)(
+            stream_scope(admin["token"]), expect=b": ping"
+        )
+        assert parse_events(body) == []
@@ -0,0 +1,67 @@
+import random
+import statistics
+
+import pytest
+from django.core.management import call_command
+from monitoring.loadtest import (
+    LOADTEST_EMAIL,
+    LOADTEST_PASSWORD,
+    LoadDriver,
+    percentile,
+)
+from django.db.models import Count, Max
+from monitoring.models import AmountStatistics, Transaction, User
+
+
+class TestLoadTest:
+    @pytest.mark.django_db
+    def test_seed_load_data(self):
+        call_command("seed_load_data", users=50, transactions=400, batch_size=100, seed=1)
+        assert User.objects.filter(email__startswith="loadtest").count() == 50
+        assert Transaction.objects.count() == 400
+        user = User.objects.get(email=LOADTEST_EMAIL.format(0))
+        assert user.check_password(LOADTEST_PASSWORD)
+        flagged = Transaction.objects.filter(is_flagged=True)
+        assert flagged.count() == Transaction.objects.exclude(violation_codes=0).count()
+
+        # Bulk inserts skip post_save; statistics are built alongside
+        sent = Transaction.objects.values("sender").annotate(
+            count=Count("id"), last=Max("created_at")
+        )
+        stats = AmountStatistics.objects.in_bulk()
+        assert len(stats) == len(sent)
+        for row in sent:
+            assert stats[row["sender"]].count == row["count"]
+            assert stats[row["sender"]].last_sent_at == row["last"]
+
+        heavy = max(stats.values(), key=lambda row: row.count)
+        amounts = [
+            float(amount)
+            for amount in Transaction.objects.filter(sender=heavy.user_id).values_list(
+                "amount", flat=True
+            )
+        ]
+        assert heavy.mean == pytest.approx(statistics.mean(amounts))
+        assert heavy.variance == pytest.approx(statistics.variance(amounts))
+
+    def test_percentile(self):
+        values = sorted(range(1, 101))
+        assert percentile(values, 50) == 50
+        assert percentile(values, 99) == 99
+        assert percentile([], 99) == 0.0
+
+    @pytest.mark.django_db(transaction=True)
+    def test_load_driver_against_live_server(self, live_server, mocker):
+        mocker.patch("monitoring.tasks.send_policy_email.delay")
+        call_command("seed_load_data", users=5, transactions=0, seed=2)
+        driver = LoadDriver(
+            live_server.url,
+            concurrency=2,
+            duration=1,
+            user_pool=5,
+            rng=random.Random(3),
+        )
+        summary = driver.run()
+        assert summary["login"]["requests"] >= 2
+        assert summary["list"]["requests"] > 0
+        assert all(stats["errors"] == 0 for stats in summary.values())
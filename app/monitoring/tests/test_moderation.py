@@ -0,0 +1,118 @@
+import pytest
+from django.urls import reverse
+from monitoring.models import ModerationAudit, User
+from monitoring.moderation import users_moderated
+
+from .conftest import api_client_with_credentials
+
+pytestmark = pytest.mark.django_db
+
+
+class TestBulkModeration:
+    bulk_moderate_url = reverse("user:user-bulk-moderate")
+
+    @pytest.fixture
+    def admin(self, api_client, authenticate_user):
+        admin = authenticate_user(is_admin=True)
+        api_client_with_credentials(admin["token"], api_client)
+        return admin["user_instance"]
+
+    def test_only_admins_can_moderate(self, api_client, authenticate_user, user_factory):
+        user = authenticate_user()
+        api_client_with_credentials(user["token"], api_client)
+        response = api_client.post(
+            self.bulk_moderate_url,
+            {"ids": [str(user_factory().id)], "set": {"is_flagged": True}},
+            format="json",
+        )
+        assert response.status_code == 403
+
+    def test_flag_users_by_id_in_batches(
+        self, api_client, admin, user_factory, settings, django_assert_max_num_queries
+    ):
+        settings.USER_MODERATION_BATCH_SIZE = 2
+        ring = user_factory.create_batch(5)
+        bystander = user_factory()
+        received = []
+
+        def receiver(**kwargs):
+            received.append(kwargs)
+
+        users_moderated.connect(receiver)
+        try:
+            # Authentication, then per batch: ids, savepoint, update, audit, release
+            with django_assert_max_num_queries(2 + 3 * 5 + 1):
+                response = api_client.post(
+                    self.bulk_moderate_url,
+                    {
+                        "ids": [str(user.id) for user in ring],
+                        "set": {"is_flagged": True, "tier": "T2"},
+                        "reason": "ring #12",
+                    },
+                    format="json",
+                )
+        finally:
+            users_moderated.disconnect(receiver)
+        assert response.status_code == 200
+        assert response.json() == {"updated": 5, "batches": 3}
+        assert set(User.objects.filter(is_flagged=True, tier="T2")) == set(ring)
+        bystander.refresh_from_db()
+        assert not bystander.is_flagged
+
+        audits = ModerationAudit.objects.order_by("created_at")
+        assert [audit.updated for audit in audits] == [2, 2, 1]
+        assert {audit.actor_id for audit in audits} == {admin.id}
+        assert audits[0].changes == {"is_flagged": True, "tier": "T2"}
+        assert audits[0].reason == "ring #12"
+        assert sum(len(audit.user_ids) for audit in audits) == 5
+        assert [len(kwargs["user_ids"]) for kwargs in received] == [2, 2, 1]
+
+    def test_moderate_users_matching_filter(self, api_client, admin, user_factory):
+        ring = [user_factory(firstname=f"Mule{n}", tier="T3") for n in range(3)]
+        user_factory(firstname="Mule9", tier="T1")
+        user_factory(firstname="Honest", tier="T3")
+
+        response = api_client.post(
+            self.bulk_moderate_url,
+            {"filter": {"search": "mule", "tier": "T3"}, "set": {"tier": "T1"}},
+            format="json",
+        )
+        assert response.json()["updated"] == 3
+        assert set(User.objects.filter(firstname__startswith="Mule", tier="T1")) == set(
+            ring
+        ) | {User.objects.get(firstname="Mule9")}
+        assert User.objects.get(firstname="Honest").tier == "T3"
+
+    def test_moderate_every_user_only_when_asked(self, api_client, admin, user_factory):
+        user_factory.create_batch(2)
+
+        response = api_client.post(
+            self.bulk_moderate_url,
+            {"all": True, "set": {"tier": "T2"}},
+            format="json",
+        )
+        assert response.status_code == 200
+        assert response.json()["updated"] == User.objects.count()
+        assert not User.objects.exclude(tier="T2").exists()
+
+    @pytest.mark.parametrize(
+        "payload",
+        [
+            {"set": {"is_flagged": True}},
+            {"ids": [], "set": {"is_flagged": True}},
+            {"filter": {"tier": "T1"}, "set": {}},
+            {"filter": {"tier": "T1"}, "ids": ["1"], "set": {"is_flagged": True}},
+            {"filter": {"tierr": "T1"}, "set": {"is_flagged": True}},
+            {"filter": {"tier": "T9"}, "set": {"is_flagged": True}},
+            {"filter": {"search": ""}, "set": {"is_flagged": True}},
+            {"filter": {"search": "  ", "tier": ""}, "set": {"is_flagged": True}},
+            {"filter": {"tier": None}, "set": {"is_flagged": True}},
+            {"filter": {"tier": "T1"}, "all": True, "set": {"is_flagged": True}},
+        ],
+    )
+    def test_invalid_requests_change_nothing(self, api_client, admin, user_factory, payload):
+        user_factory()
+        response = api_client.post(self.bulk_moderate_url, payload, format="json")
+        assert response.status_code == 400
+        assert not User.objects.filter(is_flagged=True).exists()
+        assert not ModerationAudit.objects.exists()
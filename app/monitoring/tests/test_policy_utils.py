@@ -2,7 +2,9 @@ from datetime import datetime, timedelta, timezone
 
 import pytest
 import time_machine
-from monitoring.models import User
+from monitoring.enums import ViolationCode
+from monitoring.models import AmountStatistics, Transaction, User
+from monitoring.utils import _rule_latency_ms, evaluate_policy, is_amount_anomalous
 
 from .factories import TransactionFactory
 
@@ -68,3 +70,83 @@ class TestPolicyValidators:
 
         sender.refresh_from_db()
         assert sender.is_within_timing_window == expected_flagged_status
+
+    def test_violation_masks_cover_every_combination(self):
+        masks = ViolationCode.all_masks_with(ViolationCode.TIMING_WINDOW)
+        assert len(masks) == 32
+        assert all(mask & ViolationCode.TIMING_WINDOW for mask in masks)
+
+    def test_count_transactions_with_violation(self, user_factory):
+        sender, receiver = user_factory(), user_factory()
+        TransactionFactory(
+            sender=sender,
+            receiver=receiver,
+            violation_codes=ViolationCode.TIER_LIMIT | ViolationCode.TIMING_WINDOW,
+        )
+        TransactionFactory(
+            sender=sender, receiver=receiver, violation_codes=ViolationCode.TIER_LIMIT
+        )
+        TransactionFactory(sender=sender, receiver=receiver)
+        queryset = Transaction.objects.with_violations(ViolationCode.TIER_LIMIT)
+        assert queryset.count() == 2
+
+    def test_amount_statistics_match_batch_computation(self, user_factory):
+        sender, receiver = user_factory(), user_factory()
+        amounts = [100, 250, 175, 90, 310, 120]
+        for amount in amounts:
+            TransactionFactory(sender=sender, receiver=receiver, amount=amount)
+        stats = AmountStatistics.objects.get(user=sender)
+        mean = sum(amounts) / len(amounts)
+        variance = sum((a - mean) ** 2 for a in amounts) / (len(amounts) - 1)
+        assert stats.count == len(amounts)
+        assert stats.mean == pytest.approx(mean)
+        assert stats.variance == pytest.approx(variance)
+        assert 0 < stats.ewm_mean < max(amounts)
+
+        in_memory = AmountStatistics()
+        for amount in amounts:
+            in_memory.observe(amount)
+        for field in ("count", "mean", "m2", "ewm_mean", "ewm_var"):
+            assert getattr(in_memory, field) == pytest.approx(getattr(stats, field))
+
+    def test_flag_amount_anomaly(self, user_factory):
+        sender, receiver = user_factory(), user_factory()
+        for amount in [1000, 1200, 900, 1100, 950, 1050, 1000, 980, 1020, 1010]:
+            TransactionFactory(sender=sender, receiver=receiver, amount=amount)
+        sender.refresh_from_db()
+        assert not is_amount_anomalous(sender, 1150)
+        assert is_amount_anomalous(sender, 50_000)
+
+    def test_no_anomaly_without_enough_history(self, user_factory):
+        sender, receiver = user_factory(), user_factory()
+        TransactionFactory(sender=sender, receiver=receiver, amount=10)
+        TransactionFactory(sender=sender, receiver=receiver, amount=12)
+        sender.refresh_from_db()
+        assert not is_amount_anomalous(sender, 1_000_000)
+
+    def test_slow_rules_are_deferred_past_the_budget(self, user_factory):
+        sender, receiver = user_factory(), user_factory()
+        TransactionFactory(sender=sender, receiver=receiver)
+
+        inline = evaluate_policy(sender, receiver, 100, budget_ms=1000)
+        assert inline["violation_codes"] == (
+            ViolationCode.NEW_RECIPIENT | ViolationCode.TIMING_WINDOW
+        )
+        assert inline["deferred_codes"] == 0
+
+        deferred = evaluate_policy(sender, receiver, 100, budget_ms=0)
+        assert deferred["violation_codes"] == ViolationCode.NEW_RECIPIENT
+        assert deferred["deferred_codes"] == ViolationCode.TIMING_WINDOW
+        assert "timing window" not in deferred["violation_message"]
+
+    def test_degraded_rule_is_deferred_until_estimate_decays(self, user_factory):
+        sender, receiver = user_factory(), user_factory()
+        _rule_latency_ms[ViolationCode.TIMING_WINDOW] = 500.0
+
+        result = evaluate_policy(sender, receiver, 100, budget_ms=50)
+        assert result["deferred_codes"] == ViolationCode.TIMING_WINDOW
+        assert _rule_latency_ms[ViolationCode.TIMING_WINDOW] < 500.0
+
+        _rule_latency_ms[ViolationCode.TIMING_WINDOW] = 1.0
+        result = evaluate_policy(sender, receiver, 100, budget_ms=50)
+        assert result["deferred_codes"] == 0
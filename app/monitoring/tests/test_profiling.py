@@ -0,0 +1,84 @@
+import pstats
+
+import pytest
+from core.profiling import ProfilingMiddleware
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.urls import reverse
+
+from .conftest import api_client_with_credentials
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def profiling(settings, tmp_path):
+    settings.PROFILING_ENABLED = True
+    settings.PROFILING_TOKEN = "profile-secret"
+    settings.PROFILING_SAMPLE_RATE = 0.0
+    settings.PROFILING_DIR = str(tmp_path)
+    return tmp_path
+
+
+class TestProfiling:
+    profile_list_url = reverse("profile:profile-list")
+    user_list_url = reverse("user:user-list")
+
+    def test_middleware_disabled_by_default(self):
+        with pytest.raises(MiddlewareNotUsed):
+            ProfilingMiddleware(lambda request: HttpResponse())
+
+    def test_profile_request_with_header(self, api_client, authenticate_user, profiling):
+        user = authenticate_user(is_admin=True)
+        api_client_with_credentials(user["token"], api_client)
+
+        response = api_client.get(self.user_list_url)
+        assert "X-Profile-Id" not in response
+        assert not list(profiling.iterdir())
+
+        response = api_client.get(self.user_list_url, HTTP_X_PROFILE="profile-secret")
+        assert response.status_code == 200
+        profile_id = response["X-Profile-Id"]
+        pstats.Stats(str(profiling / f"{profile_id}.prof"))
+
+        response = api_client.get(self.profile_list_url)
+        assert response.status_code == 200
+        assert [profile["id"] for profile in response.json()] == [profile_id]
+
+        url = reverse("profile:profile-detail", kwargs={"pk": profile_id})
+        profile = api_client.get(url).json()
+        assert profile["path"] == self.user_list_url
+        assert profile["sql_count"] == len(profile["sql"]) > 0
+        assert "cumulative" in profile["summary"]
+
+        url = reverse("profile:profile-download", kwargs={"pk": profile_id})
+        response = api_client.get(url)
+        assert response.status_code == 200
+        assert response["Content-Disposition"].endswith(f'{profile_id}.prof"')
+
+    def test_wrong_token_is_not_profiled(self, api_client, authenticate_user, profiling):
+        user = authenticate_user()
+        api_client_with_credentials(user["token"], api_client)
+        response = api_client.get(self.user_list_url, HTTP_X_PROFILE="guess")
+        assert "X-Profile-Id" not in response
+
+    def test_sampling_profiler_mode(self, rf, profiling):
+        def view(request):
+            sum(range(200_000))
+            return HttpResponse()
+
+        request = rf.get(
+            "/", HTTP_X_PROFILE="profile-secret", HTTP_X_PROFILE_MODE="sample"
+        )
+        response = ProfilingMiddleware(view)(request)
+        assert (profiling / f"{response['X-Profile-Id']}.folded").exists()
+
+    def test_sample_rate_triggers_profiling(self, rf, profiling, settings):
+        settings.PROFILING_SAMPLE_RATE = 1.0
+        response = ProfilingMiddleware(lambda request: HttpResponse())(rf.get("/"))
+        assert "X-Profile-Id" in response
+
+    def test_only_admins_list_profiles(self, api_client, authenticate_user, profiling):
+        user = authenticate_user(is_admin=False)
+        api_client_with_credentials(user["token"], api_client)
+        assert api_client.get(self.profile_list_url).status_code == 403
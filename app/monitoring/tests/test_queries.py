@@ -0,0 +1,73 @@
+import pytest
+from core.queries import NPlusOneError, NPlusOneMiddleware, QueryTracker, fingerprint
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.test import override_settings
+from django.urls import reverse
+from monitoring.models import User
+
+from .conftest import api_client_with_credentials
+from .factories import TransactionFactory
+
+pytestmark = pytest.mark.django_db
+
+
+class TestQueryDetection:
+    transaction_list_url = reverse("transaction:transaction-list")
+
+    def test_fingerprint_ignores_literals(self):
+        first = fingerprint("SELECT * FROM t WHERE id = 1 AND name = 'ray'")
+        second = fingerprint("SELECT  *  FROM t WHERE id = 42 AND name = 'bob'")
+        assert first == second
+        assert fingerprint("WHERE id IN (%s, %s, %s)") == fingerprint("WHERE id IN (%s)")
+
+    def test_tracker_raises_with_call_site(self, user_factory):
+        user_factory.create_batch(4)
+        with pytest.raises(NPlusOneError) as error:
+            with QueryTracker(threshold=2) as tracker:
+                for user in User.objects.all():
+                    User.objects.get(id=user.id)
+            tracker.check()
+        assert "4x" in str(error.value)
+        assert "test_queries.py" in str(error.value)
+
+    def test_transaction_list_has_no_n_plus_one(
+        self, api_client, user_factory, authenticate_user, assert_no_n_plus_one
+    ):
+        user = authenticate_user()
+        for _ in range(5):
+            TransactionFactory(sender=user["user_instance"], receiver=user_factory())
+            TransactionFactory(receiver=user["user_instance"], sender=user_factory())
+        api_client_with_credentials(user["token"], api_client)
+        with assert_no_n_plus_one(threshold=2):
+            response = api_client.get(self.transaction_list_url)
+        assert response.status_code == 200
+        assert response.json()["total"] == 10
+
+    @override_settings(NPLUSONE_DETECTION="raise", NPLUSONE_THRESHOLD=2)
+    def test_middleware_raises_in_raise_mode(self, rf, user_factory):
+        user_factory.create_batch(4)
+
+        def view(request):
+            for user in User.objects.all():
+                User.objects.get(id=user.id)
+            return HttpResponse()
+
+        with pytest.raises(NPlusOneError):
+            NPlusOneMiddleware(view)(rf.get("/"))
+
+    @override_settings(NPLUSONE_DETECTION="log", NPLUSONE_THRESHOLD=2)
+    def test_middleware_reports_in_log_mode(self, rf, user_factory):
+        user_factory.create_batch(4)
+
+        def view(request):
+            for user in User.objects.all():
+                User.objects.get(id=user.id)
+            return HttpResponse()
+
+        response = NPlusOneMiddleware(view)(rf.get("/"))
+        assert response["X-Repeated-Queries"] == "1"
+
+    def test_middleware_disabled_by_default(self):
+        with pytest.raises(MiddlewareNotUsed):
+            NPlusOneMiddleware(lambda request: HttpResponse())
@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from django.urls import reverse
+from monitoring.enums import ViolationCode
+from monitoring.models import Transaction
+from monitoring.rescoring import flag_transfers_to
+
+from .conftest import api_client_with_credentials
+from .factories import TransactionFactory
+
+pytestmark = pytest.mark.django_db
+
+SEND_POLICY_MAIL = "monitoring.tasks.send_policy_email.delay"
+RESCORE_FLAGGED_RECIPIENTS = "monitoring.tasks.rescore_flagged_recipients.delay"
+
+
+class TestRetroactiveFlagging:
+    def test_flagging_a_user_schedules_a_rescore(
+        self,
+        api_client,
+        authenticate_user,
+        user_factory,
+        mocker,
+        django_capture_on_commit_callbacks,
+    ):
+        admin = authenticate_user(is_admin=True)
+        api_client_with_credentials(admin["token"], api_client)
+        rescore = mocker.patch(RESCORE_FLAGGED_RECIPIENTS)
+        user = user_factory()
+        url = reverse("user:user-detail", kwargs={"pk": user.id})
+
+        with django_capture_on_commit_callbacks(execute=True):
+            assert api_client.patch(url, {"is_flagged": True}).status_code == 200
+        rescore.assert_called_once_with([str(user.id)])
+
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            assert api_client.patch(url, {"tier": "T2"}).status_code == 200
+        assert callbacks == []
+
+    def test_flags_recent_transfers_in_chunks_and_notifies_each_sender_once(
+        self, user_factory, mocker, django_assert_max_num_queries
+    ):
+        send_policy_email = mocker.patch(SEND_POLICY_MAIL)
+        receiver = user_factory(is_flagged=True)
+        regular, other_sender = user_factory(), user_factory()
+        sender = user_factory(firstname="Ada")
+        recent = TransactionFactory.create_batch(
+            3, sender=sender, receiver=receiver, amount=100
+        )
+        already = TransactionFactory(
+            sender=sender,
+            receiver=receiver,
+            violation_codes=ViolationCode.FLAGGED_RECIPIENT,
+            is_flagged=True,
+        )
+        Transaction.objects.filter(pk=recent[0].pk).update(
+            violation_codes=ViolationCode.TIMING_WINDOW, is_flagged=True
+        )
+        from_other = TransactionFactory(sender=other_sender, receiver=receiver)
+        old = TransactionFactory(sender=sender, receiver=receiver)
+        Transaction.objects.filter(pk=old.pk).update(
+            created_at=datetime.now(timezone.utc) - timedelta(days=40)
+        )
+        elsewhere = TransactionFactory(sender=sender, receiver=regular)
+
+        # Receivers, then per chunk: ids, savepoint, update, release;
+        # then the senders to notify
+        with django_assert_max_num_queries(1 + 4 * 2 + 1 + 1):
+            result = flag_transfers_to([receiver.id, regular.id], batch_size=2)
+
+        assert result == {"updated": 4, "notified": 2}
+        codes = dict(Transaction.objects.values_list("pk", "violation_codes"))
+        assert codes[recent[0].pk] == (
+            ViolationCode.TIMING_WINDOW | ViolationCode.FLAGGED_RECIPIENT
+        )
+        for transaction in recent[1:] + [already, from_other]:
+            assert codes[transaction.pk] == ViolationCode.FLAGGED_RECIPIENT
+        assert codes[old.pk] == 0
+        assert codes[elsewhere.pk] == 0
+        assert Transaction.objects.filter(is_flagged=True).count() == 5
+
+        assert send_policy_email.call_count == 2
+        [email] = [
+            call.args[0]
+            for call in send_policy_email.call_args_list
+            if call.args[0]["email"] == sender.email
+        ]
+        assert email["user_name"] == "Ada"
+        assert "3 transaction(s) totalling #300" in email["message"]
@@ -0,0 +1,78 @@
+import pytest
+from core.schema import clear_schema_cache, get_artifact_path
+from django.core.management import CommandError, call_command
+from django.urls import reverse
+from drf_spectacular.generators import SchemaGenerator
+
+
+@pytest.fixture(autouse=True)
+def schema_artifact_dir(settings, tmp_path):
+    settings.SCHEMA_ARTIFACT_DIR = str(tmp_path)
+    settings.CODE_VERSION = "test-version"
+    clear_schema_cache()
+    yield tmp_path
+    clear_schema_cache()
+
+
+class TestSchema:
+    schema_url = reverse("schema")
+
+    def test_schema_is_generated_once_and_revalidated(self, api_client, mocker):
+        get_schema = mocker.spy(SchemaGenerator, "get_schema")
+        response = api_client.get(self.schema_url)
+        assert response.status_code == 200
+        etag = response["ETag"]
+        assert b"/api/v1/transaction/" in response.content
+
+        response = api_client.get(self.schema_url)
+        assert response.status_code == 200
+        assert response["ETag"] == etag
+
+        response = api_client.get(self.schema_url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert get_schema.call_count == 1
+        assert get_artifact_path().exists()
+
+    def test_build_schema_command_precomputes_artifact(self, api_client, mocker):
+        call_command("build_schema")
+        assert get_artifact_path().exists()
+        get_schema = mocker.spy(SchemaGenerator, "get_schema")
+        response = api_client.get(self.schema_url, {"format": "json"})
+        assert response.status_code == 200
+        assert response.json()["info"]["title"] == "Real-time Transaction Monitoring App"
+        assert get_schema.call_count == 0
+
+    def test_code_version_change_regenerates(self, settings):
+        call_command("build_schema")
+        first = get_artifact_path()
+        settings.CODE_VERSION = "next-version"
+        clear_schema_cache()
+        assert get_artifact_path() != first
+
+    def test_unknown_language_and_version_get_the_default_schema(
+        self, api_client, schema_artifact_dir, settings
+    ):
+        settings.USE_I18N = True
+        response = api_client.get(self.schema_url, {"format": "json"})
+        etag = response["ETag"]
+
+        for params in (
+            {"lang": "../../pwned"},
+            {"lang": "xx-unknown"},
+            {"version": "../../pwned"},
+        ):
+            response = api_client.get(self.schema_url, {"format": "json", **params})
+            assert response.status_code == 200
+            assert response["ETag"] == etag
+        assert [path.name for path in schema_artifact_dir.iterdir()] == [
+            get_artifact_path().name
+        ]
+
+        with pytest.raises(CommandError):
+            call_command("build_schema", lang="../../pwned")
+
+    def test_docs_are_served_without_installing_drf_spectacular(self, api_client):
+        for name in ("swagger-ui", "redoc"):
+            response = api_client.get(reverse(name))
+            assert response.status_code == 200
+            assert reverse("schema") in response.content.decode()
@@ -0,0 +1,110 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from django.core.management import call_command
+from monitoring.enums import ViolationCode
+from monitoring.models import AmountStatistics
+from monitoring.scoring import read_records, score_records
+
+pytestmark = pytest.mark.django_db
+
+NOW = datetime.now(timezone.utc)
+
+
+def moment(minutes: float) -> str:
+    return (NOW - timedelta(minutes=minutes)).isoformat()
+
+
+@pytest.fixture
+def accounts(user_factory):
+    sender = user_factory(tier="T1")
+    flagged = user_factory(is_flagged=True)
+    regular = user_factory()
+    for user in (sender, flagged, regular):
+        type(user).objects.filter(pk=user.pk).update(
+            created_at=NOW - timedelta(days=30)
+        )
+    AmountStatistics.objects.create(
+        user=sender,
+        count=20,
+        mean=100.0,
+        m2=19 * 100.0,
+        last_sent_at=NOW - timedelta(hours=1),
+    )
+    return sender, flagged, regular
+
+
+def write_jsonl(path, records):
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    return str(path)
+
+
+class TestOfflineScoring:
+    def records(self, sender, flagged, regular) -> list:
+        def record(id, sender, receiver, amount, minutes=None):
+            record = {"id": id, "sender": sender, "receiver": receiver}
+            record["amount"] = amount
+            if minutes is not None:
+                record["created_at"] = moment(minutes)
+            return record
+
+        return [
+            record("ok", str(sender.id), regular.email, "120", 30),
+            record("flagged-recipient", sender.email, str(flagged.id), "110", 20),
+            record("window", str(sender.id), str(regular.id), "90", 19.5),
+            record("tier+anomaly", str(sender.id), str(regular.id), "1500000", 10),
+            record("unknown", "nobody@example.com", str(regular.id), "10"),
+            record("bad-amount", str(sender.id), str(regular.id), "-3"),
+        ]
+
+    def test_scores_records_like_the_live_rules(self, accounts, tmp_path):
+        path = write_jsonl(tmp_path / "transfers.jsonl", self.records(*accounts))
+
+        results = list(score_records(read_records(path), chunk_size=10))
+
+        [(scored, skipped)] = results
+        assert skipped == 2
+        assert {record["id"]: codes for record, codes in scored} == {
+            "ok": 0,
+            "flagged-recipient": ViolationCode.FLAGGED_RECIPIENT,
+            "window": ViolationCode.TIMING_WINDOW,
+            "tier+anomaly": ViolationCode.TIER_LIMIT | ViolationCode.AMOUNT_ANOMALY,
+        }
+
+    # The pool closes the connections before forking, ending a test transaction
+    @pytest.mark.django_db(transaction=True)
+    def test_command_streams_flagged_records_from_a_process_pool(
+        self, accounts, tmp_path, django_assert_max_num_queries
+    ):
+        source = tmp_path / "transfers.csv"
+        with open(source, "w", newline="") as file:
+            fieldnames = ["id", "sender", "receiver", "amount", "created_at"]
+            writer = csv.DictWriter(file, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(self.records(*accounts)[:4] * 5)
+        output = tmp_path / "flagged.jsonl"
+        stderr = io.StringIO()
+
+        # Two queries (users and their statistics) per chunk
+        with django_assert_max_num_queries(2 * 5):
+            call_command(
+                "score_transactions_file",
+                str(source),
+                output=str(output),
+                workers=2,
+                chunk_size=4,
+                stderr=stderr,
+            )
+
+        rows = [json.loads(line) for line in output.read_text().splitlines()]
+        assert [row["id"] for row in rows[:3]] == [
+            "flagged-recipient",
+            "window",
+            "tier+anomaly",
+        ]
+        assert len(rows) == 15
+        assert rows[2]["violations"] == ["tier_limit", "amount_anomaly"]
+        assert "Scored 20 record(s), 15 flagged, 0 skipped" in stderr.getvalue()
@@ -0,0 +1,104 @@
+from datetime import datetime, timezone
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from monitoring.models import Transaction, User
+from monitoring.search import rebuild_search_index
+
+from .conftest import api_client_with_credentials
+from .factories import TransactionFactory
+
+pytestmark = pytest.mark.django_db
+
+
+class TestSearch:
+    user_list_url = reverse("user:user-list")
+    transaction_list_url = reverse("transaction:transaction-list")
+
+    def search_emails(self, api_client, **params) -> list:
+        response = api_client.get(self.user_list_url, params)
+        assert response.status_code == 200
+        return sorted(row["email"] for row in response.json()["results"])
+
+    def test_user_search_uses_full_text_index(
+        self, api_client, user_factory, authenticate_user
+    ):
+        admin = authenticate_user(is_admin=True)
+        api_client_with_credentials(admin["token"], api_client)
+        # Fixed names, so random ones (e.g. "Adams") can't match the searches
+        User.objects.filter(pk=admin["user_instance"].pk).update(
+            email="root@admin.test", firstname="Root"
+        )
+        user_factory(email="ada@lovelace.dev", firstname="Ada")
+        zainab = user_factory(email="zainab@example.com", firstname="Zainab")
+
+        assert self.search_emails(api_client, search="zai") == ["zainab@example.com"]
+        assert self.search_emails(api_client, search="lovelace") == ["ada@lovelace.dev"]
+        assert self.search_emails(api_client, search="Ada lovelace.dev") == [
+            "ada@lovelace.dev"
+        ]
+        assert self.search_emails(api_client, search='"bad * syntax') == []
+
+        zainab.firstname = "Chioma"
+        zainab.save()
+        User.objects.filter(email="ada@lovelace.dev").update(firstname="Grace")
+        assert self.search_emails(api_client, search="zainab") == ["zainab@example.com"]
+        assert self.search_emails(api_client, search="chio") == ["zainab@example.com"]
+        assert self.search_emails(api_client, search="ada") == ["ada@lovelace.dev"]
+        assert self.search_emails(api_client, search="grace") == ["ada@lovelace.dev"]
+
+        zainab.delete()
+        rebuild_search_index()
+        assert self.search_emails(api_client, search="chio") == []
+
+        with CaptureQueriesContext(connection) as context:
+            self.search_emails(api_client, search="grace")
+        assert not any("LIKE" in query["sql"] for query in context.captured_queries)
+
+    def test_user_range_filters(self, api_client, user_factory, authenticate_user):
+        admin = authenticate_user(is_admin=True)
+        api_client_with_credentials(admin["token"], api_client)
+        old = user_factory(tier="T2")
+        User.objects.filter(pk=old.pk).update(
+            created_at=datetime(2023, 1, 1, tzinfo=timezone.utc)
+        )
+
+        assert self.search_emails(api_client, created_before="2023-06-01T00:00:00Z") == [
+            old.email
+        ]
+        assert old.email not in self.search_emails(
+            api_client, created_after="2023-06-01T00:00:00Z"
+        )
+        assert self.search_emails(api_client, tier="T2") == [old.email]
+
+    def test_transaction_search_and_range_filters(
+        self, api_client, user_factory, authenticate_user
+    ):
+        user = authenticate_user()
+        me = user["user_instance"]
+        api_client_with_credentials(user["token"], api_client)
+        tolu, emeka = user_factory(firstname="Tolu"), user_factory(firstname="Emeka")
+        small = TransactionFactory(sender=me, receiver=tolu, amount=50)
+        large = TransactionFactory(sender=emeka, receiver=me, amount=5000)
+        old = TransactionFactory(sender=me, receiver=emeka, amount=700)
+        Transaction.objects.filter(pk=old.pk).update(
+            created_at=datetime(2023, 1, 1, tzinfo=timezone.utc)
+        )
+
+        def ids(**params) -> set:
+            response = api_client.get(self.transaction_list_url, params)
+            assert response.status_code == 200
+            return {row["id"] for row in response.json()["results"]}
+
+        assert ids(search="tol") == {str(small.id)}
+        assert ids(search="emeka") == {str(large.id), str(old.id)}
+        assert ids(min_amount=100, max_amount=1000) == {str(old.id)}
+        assert ids(min_amount=700) == {str(large.id), str(old.id)}
+        assert ids(created_before="2023-06-01T00:00:00Z") == {str(old.id)}
+        assert ids(search="emeka", created_after="2023-06-01T00:00:00Z") == {
+            str(large.id)
+        }
+        response = api_client.get(self.transaction_list_url, {"min_amount": "lots"})
+        assert response.status_code == 400
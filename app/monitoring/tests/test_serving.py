@@ -0,0 +1,92 @@
+import runpy
+import socket
+import urllib.error
+import urllib.request
+
+import pytest
+from core.serving import (
+    APP_ROOT,
+    FEED,
+    FEED_MODE,
+    MODES,
+    check_shared_cache,
+    default_workers,
+    running_server,
+)
+from monitoring.live import STREAM_PATH
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestServing:
+    @pytest.mark.parametrize("mode", MODES)
+    def test_gunicorn_config_for_each_mode(self, mode, monkeypatch):
+        monkeypatch.setenv("SERVER_MODE", mode)
+        monkeypatch.setenv("WEB_CONCURRENCY", "3")
+
+        conf = runpy.run_path(str(APP_ROOT / "gunicorn.conf.py"))
+
+        assert conf["wsgi_app"] == MODES[mode]["app"]
+        assert conf["worker_class"] == MODES[mode]["worker_class"]
+        assert conf["workers"] == 3
+        assert conf["preload_app"] is True
+        assert conf["max_requests"] > 0 and conf["max_requests_jitter"] > 0
+        assert conf["graceful_timeout"] > 0
+        # gunicorn would take a module-level `config` for its own setting
+        assert "config" not in conf
+
+    def test_feed_is_served_by_one_process(self, monkeypatch):
+        monkeypatch.setenv("SERVER_MODE", FEED_MODE)
+        monkeypatch.setenv("WEB_CONCURRENCY", "3")
+
+        conf = runpy.run_path(str(APP_ROOT / "gunicorn.conf.py"))
+
+        assert conf["wsgi_app"] == FEED["app"]
+        assert conf["worker_class"] == FEED["worker_class"]
+        assert conf["workers"] == 1
+
+    def test_workers_use_every_core(self):
+        # SQLite takes one writer at a time, so sync gets no extra workers
+        assert default_workers("sync", cpus=4) == 4
+        assert default_workers("gthread", cpus=4) == 4
+        assert default_workers("uvicorn", cpus=4) == 4
+        assert default_workers(FEED_MODE, cpus=4) == 1
+
+    def test_several_workers_need_a_shared_cache(self, settings):
+        settings.DEBUG = False
+        with pytest.raises(RuntimeError):
+            check_shared_cache(workers=2)
+        check_shared_cache(workers=1)
+
+        settings.CACHES = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
+                "LOCATION": "memcached:11211",
+            }
+        }
+        check_shared_cache(workers=2)
+
+    def test_preforked_server_answers_requests(self):
+        pytest.importorskip("gunicorn")
+
+        with running_server("gthread", free_port(), workers=2) as base_url:
+            with pytest.raises(urllib.error.HTTPError) as error:
+                urllib.request.urlopen(base_url + "/api/v1/user/", timeout=5)
+
+        assert error.value.code == 401
+
+    def test_feed_server_only_serves_the_stream(self):
+        pytest.importorskip("uvicorn")
+
+        with running_server(FEED_MODE, free_port()) as base_url:
+            with pytest.raises(urllib.error.HTTPError) as stream_error:
+                urllib.request.urlopen(base_url + STREAM_PATH, timeout=5)
+            with pytest.raises(urllib.error.HTTPError) as api_error:
+                urllib.request.urlopen(base_url + "/api/v1/user/", timeout=5)
+
+        assert stream_error.value.code == 401
+        assert api_error.value.code == 404
@@ -0,0 +1,145 @@
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from django.urls import reverse
+from monitoring.enums import ViolationCode
+from monitoring.models import (
+    AmountStatistics,
+    ShadowDisagreement,
+    ShadowTally,
+    Transaction,
+    User,
+)
+from monitoring.shadow import record_shadow_evaluation
+
+from .conftest import api_client_with_credentials
+
+pytestmark = pytest.mark.django_db
+
+SEND_POLICY_MAIL = "monitoring.tasks.send_policy_email.delay"
+EVALUATE_SHADOW_RULES = "monitoring.tasks.evaluate_shadow_rules.delay"
+
+
+class TestShadowEvaluation:
+    transaction_list_url = reverse("transaction:transaction-list")
+    shadow_stats_url = reverse("transaction:transaction-shadow-stats")
+
+    @pytest.fixture
+    def sender(self, api_client, authenticate_user, mocker):
+        mocker.patch(SEND_POLICY_MAIL)
+        user = authenticate_user()
+        api_client_with_credentials(user["token"], api_client)
+        # Usually sends 100 with a standard deviation of 10
+        AmountStatistics.objects.create(
+            user=user["user_instance"], count=20, mean=100.0, m2=19 * 100.0
+        )
+        return user["user_instance"]
+
+    @pytest.fixture
+    def recipient(self, user_factory):
+        recipient = user_factory()
+        User.objects.filter(pk=recipient.pk).update(
+            created_at=datetime.now(timezone.utc) - timedelta(days=30)
+        )
+        return recipient
+
+    def test_challenger_replays_the_inputs_of_sampled_transfers(
+        self,
+        api_client,
+        sender,
+        recipient,
+        settings,
+        mocker,
+        django_capture_on_commit_callbacks,
+    ):
+        settings.SHADOW_SAMPLE_RATE = 1.0
+        settings.SHADOW_CHALLENGERS = ["anomaly-3sd", "anomaly-decayed"]
+        evaluate_shadow_rules = mocker.patch(EVALUATE_SHADOW_RULES)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client.post(
+                self.transaction_list_url,
+                {"recipient": recipient.id, "amount": "135.00"},
+            )
+
+        assert response.status_code == 200
+        transaction = Transaction.objects.get(sender=sender)
+        assert not transaction.is_flagged  # 3.5 standard deviations
+        evaluate_shadow_rules.assert_called_once()
+        transaction_id, inputs = evaluate_shadow_rules.call_args.args
+        assert transaction_id == str(transaction.id)
+        # The statistics the live evaluation saw, before this transfer
+        assert inputs["sender"]["stats"]["count"] == 20
+
+        results = record_shadow_evaluation(transaction_id, inputs)
+
+        assert results == {
+            "champion": 0,
+            "anomaly-3sd": ViolationCode.AMOUNT_ANOMALY,
+            "anomaly-decayed": 0,
+        }
+        [disagreement] = ShadowDisagreement.objects.all()
+        assert disagreement.challenger == "anomaly-3sd"
+        assert disagreement.challenger_codes == ViolationCode.AMOUNT_ANOMALY
+        tallies = ShadowTally.objects.order_by("challenger")
+        assert [
+            (tally.challenger, tally.evaluated, tally.disagreements) for tally in tallies
+        ] == [("anomaly-3sd", 1, 1), ("anomaly-decayed", 1, 0)]
+        assert not Transaction.objects.get(pk=transaction.pk).is_flagged
+
+    def test_unsampled_transfers_are_not_dispatched(
+        self, api_client, sender, recipient, settings, mocker
+    ):
+        settings.SHADOW_SAMPLE_RATE = 0.0
+        settings.SHADOW_CHALLENGERS = ["anomaly-3sd"]
+        evaluate_shadow_rules = mocker.patch(EVALUATE_SHADOW_RULES)
+
+        response = api_client.post(
+            self.transaction_list_url, {"recipient": recipient.id, "amount": "135.00"}
+        )
+
+        assert response.status_code == 200
+        evaluate_shadow_rules.assert_not_called()
+
+    def test_stats_report_agreement_and_lift(self, api_client, authenticate_user):
+        admin = authenticate_user(is_admin=True)
+        api_client_with_credentials(admin["token"], api_client)
+        today = datetime.now(timezone.utc).date()
+        for day, evaluated, champion, challenger, both, disagreements in (
+            (today, 100, 4, 6, 4, 2),
+            (today - timedelta(days=1), 100, 6, 6, 5, 2),
+            (today - timedelta(days=30), 100, 0, 50, 0, 50),
+        ):
+            ShadowTally.objects.create(
+                challenger="anomaly-3sd",
+                day=day,
+                evaluated=evaluated,
+                champion_flagged=champion,
+                challenger_flagged=challenger,
+                both_flagged=both,
+                disagreements=disagreements,
+            )
+
+        response = api_client.get(self.shadow_stats_url, {"days": 7})
+
+        assert response.status_code == 200
+        [stats] = response.json()["challengers"]
+        assert stats["challenger"] == "anomaly-3sd"
+        assert stats["evaluated"] == 200
+        assert stats["agreement"] == 0.98
+        assert stats["lift"] == 1.2
+
+    def test_stats_window_is_clamped(self, api_client, authenticate_user):
+        admin = authenticate_user(is_admin=True)
+        api_client_with_credentials(admin["token"], api_client)
+
+        response = api_client.get(self.shadow_stats_url, {"days": 10**12})
+        assert response.status_code == 200
+        since = date.fromisoformat(response.json()["since"])
+        assert (datetime.now(timezone.utc).date() - since).days == 365
+
+    def test_stats_are_for_admins_only(self, api_client, authenticate_user):
+        user = authenticate_user()
+        api_client_with_credentials(user["token"], api_client)
+
+        assert api_client.get(self.shadow_stats_url).status_code == 403
@@ -0,0 +1,269 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from uuid import uuid4
+
+import pytest
+from common.models import preserve_timestamps
+from django.core.management import call_command
+from django.db import connections
+from django.urls import reverse
+from monitoring import idempotency
+from monitoring.models import AmountStatistics, Transaction, User
+from monitoring.serializers import MakeTransactionSerializer
+from monitoring.sharding import rebalance, shard_for
+
+from .conftest import api_client_with_credentials
+from .factories import TransactionFactory
+
+pytestmark = pytest.mark.django_db(databases="__all__")
+
+SHARDS = ["transactions_0", "transactions_1"]
+
+
+@pytest.fixture
+def sharded(settings):
+    settings.TRANSACTION_SHARDS = SHARDS
+    return SHARDS
+
+
+def count_per_database() -> dict:
+    return {
+        alias: Transaction.objects.using(alias).count()
+        for alias in ["default"] + SHARDS
+    }
+
+
+def create_transactions(senders, receiver, start: datetime) -> list:
+    rows = [
+        Transaction(
+            sender=sender,
+            receiver=receiver,
+            amount=100 + index,
+            created_at=start + timedelta(minutes=index),
+            updated_at=start + timedelta(minutes=index),
+        )
+        for index, sender in enumerate(senders)
+    ]
+    with preserve_timestamps(Transaction):
+        return Transaction.objects.bulk_create(rows)
+
+
+class TestSharding:
+    transaction_list_url = reverse("transaction:transaction-list")
+
+    def test_shards_only_hold_transactions(self):
+        tables = connections["transactions_0"].introspection.table_names()
+        assert "monitoring_transaction" in tables
+        assert "monitoring_user" not in tables
+
+    def test_adding_a_shard_only_moves_keys_to_it(self, settings, sharded):
+        sender_ids = [uuid4() for _ in range(300)]
+        before = {sender_id: shard_for(sender_id) for sender_id in sender_ids}
+        assert set(before.values()) == set(SHARDS)
+
+        settings.TRANSACTION_SHARDS = SHARDS + ["transactions_2"]
+        moved = [
+            sender_id for sender_id in sender_ids if shard_for(sender_id) != before[sender_id]
+        ]
+        assert {shard_for(sender_id) for sender_id in moved} == {"transactions_2"}
+        assert 50 < len(moved) < 150
+
+    def test_transfer_is_written_to_sender_shard(
+        self, api_client, user_factory, authenticate_user, sharded, mocker
+    ):
+        mocker.patch("monitoring.tasks.send_policy_email.delay")
+        user = authenticate_user()
+        api_client_with_credentials(user["token"], api_client)
+        recipient = user_factory()
+
+        response = api_client.post(
+            self.transaction_list_url, {"recipient": recipient.id, "amount": 500}
+        )
+        assert response.status_code == 200
+        sender_shard = shard_for(user["user_instance"].pk)
+        assert count_per_database() == {
+            "default": 0,
+            **{alias: int(alias == sender_shard) for alias in SHARDS},
+        }
+        assert user["user_instance"].sent_funds.count() == 1
+
+    def test_transfer_undone_on_shard_when_default_fails(
+        self, user_factory, sharded, mocker
+    ):
+        sender, recipient = user_factory(), user_factory()
+
+        @contextmanager
+        def failing_hold(key):
+            yield
+            raise RuntimeError("default failed to commit")
+
+        mocker.patch("monitoring.serializers.sender_locks.hold", failing_hold)
+        request = type("Request", (), {"user": sender})()
+        with pytest.raises(RuntimeError):
+            MakeTransactionSerializer(context={"request": request}).create(
+                {"recipient": recipient, "amount": Decimal("200.00")}
+            )
+        assert count_per_database() == {"default": 0, **{alias: 0 for alias in SHARDS}}
+
+    def test_transfer_undone_on_shard_when_idempotent_view_fails(
+        self,
+        api_client,
+        user_factory,
+        authenticate_user,
+        sharded,
+        mocker,
+        django_capture_on_commit_callbacks,
+    ):
+        mocker.patch("monitoring.tasks.send_policy_email.delay")
+        user = authenticate_user()
+        api_client_with_credentials(user["token"], api_client)
+        recipient = user_factory()
+
+        def transfer():
+            return api_client.post(
+                self.transaction_list_url,
+                {"recipient": recipient.id, "amount": 500},
+                HTTP_IDEMPOTENCY_KEY="transfer-1",
+            )
+
+        original_complete = idempotency.complete
+        complete = mocker.patch(
+            "monitoring.idempotency.complete", side_effect=RuntimeError("crashed")
+        )
+        with pytest.raises(RuntimeError):
+            transfer()
+        assert count_per_database() == {"default": 0, **{alias: 0 for alias in SHARDS}}
+
+        complete.side_effect = original_complete
+        with django_capture_on_commit_callbacks(execute=True):
+            assert transfer().status_code == 200
+        assert transfer()["Idempotent-Replayed"] == "true"
+        assert sum(count_per_database().values()) == 1
+
+    def test_stale_attempt_leaves_no_row_on_shard(self, user_factory, sharded, mocker):
+        mocker.patch("monitoring.tasks.send_policy_email.delay")
+        sender, recipient = user_factory(), user_factory()
+        original = AmountStatistics.advance_last_sent
+        attempts = []
+
+        def advance(user_id, observed, sent_at):
+            attempts.append(observed)
+            return len(attempts) > 1 and original(user_id, observed, sent_at)
+
+        mocker.patch.object(AmountStatistics, "advance_last_sent", side_effect=advance)
+        request = type("Request", (), {"user": sender})()
+        transaction = MakeTransactionSerializer(context={"request": request}).create(
+            {"recipient": recipient, "amount": Decimal("200.00")}
+        )
+        assert len(attempts) == 2
+        assert list(
+            Transaction.objects.using(shard_for(sender.pk)).filter(sender=sender)
+        ) == [transaction]
+
+    def test_search_matching_many_users_only_looks_at_counterparties(
+        self, api_client, user_factory, authenticate_user, sharded
+    ):
+        user = authenticate_user()
+        api_client_with_credentials(user["token"], api_client)
+        namesakes = User.objects.bulk_create(
+            User(email=f"zainab{index}@example.com", firstname="Zainab")
+            for index in range(1200)
+        )
+        receiver = user["user_instance"]
+        received = TransactionFactory(sender=namesakes[700], receiver=receiver)
+        TransactionFactory(sender=user_factory(firstname="Emeka"), receiver=receiver)
+
+        response = api_client.get(self.transaction_list_url, {"search": "zaina"})
+        assert response.status_code == 200
+        assert [row["id"] for row in response.json()["results"]] == [str(received.id)]
+
+    def test_bulk_create_groups_rows_by_shard(self, user_factory, sharded):
+        senders = user_factory.create_batch(20)
+        create_transactions(senders, user_factory(), datetime.now(timezone.utc))
+
+        for sender in senders:
+            assert Transaction.objects.using(shard_for(sender.pk)).filter(
+                sender=sender
+            ).exists()
+        counts = count_per_database()
+        assert counts["default"] == 0
+        assert all(counts[alias] for alias in SHARDS)
+
+    def test_list_gathers_received_transactions_from_all_shards(
+        self, api_client, user_factory, authenticate_user, sharded
+    ):
+        user = authenticate_user()
+        receiver = user["user_instance"]
+        start = datetime(2023, 8, 1, tzinfo=timezone.utc)
+        senders = user_factory.create_batch(10)
+        create_transactions(senders, receiver, start)
+        TransactionFactory(sender=receiver, receiver=senders[0], amount=5, is_flagged=True)
+        assert all(count_per_database()[alias] for alias in SHARDS)
+        api_client_with_credentials(user["token"], api_client)
+
+        response = api_client.get(self.transaction_list_url, {"page_size": 4})
+        assert response.status_code == 200
+        assert response.json()["total"] == 11
+        first_page = response.json()["results"]
+        assert [row["amount"] for row in first_page] == [
+            "5.00",
+            "109.00",
+            "108.00",
+            "107.00",
+        ]
+        assert first_page[1]["sender_name"] == senders[9].firstname
+
+        response = api_client.get(
+            self.transaction_list_url, {"page_size": 4, "page": 3, "ordering": "created_at"}
+        )
+        assert [row["amount"] for row in response.json()["results"]] == [
+            "108.00",
+            "109.00",
+            "5.00",
+        ]
+
+        response = api_client.get(self.transaction_list_url, {"is_flagged": True})
+        assert [row["amount"] for row in response.json()["results"]] == ["5.00"]
+
+        senders[3].firstname = "Zainab"
+        senders[3].save()
+        response = api_client.get(self.transaction_list_url, {"search": "zaina"})
+        assert [row["amount"] for row in response.json()["results"]] == ["103.00"]
+
+    def test_retrieve_finds_transaction_on_any_shard(
+        self, api_client, user_factory, authenticate_user, sharded
+    ):
+        user = authenticate_user()
+        received = TransactionFactory(sender=user_factory(), receiver=user["user_instance"])
+        api_client_with_credentials(user["token"], api_client)
+
+        response = api_client.get(
+            reverse("transaction:transaction-detail", args=[received.id])
+        )
+        assert response.status_code == 200
+        assert response.json()["id"] == str(received.id)
+
+        other = TransactionFactory(sender=user_factory(), receiver=user_factory())
+        response = api_client.get(reverse("transaction:transaction-detail", args=[other.id]))
+        assert response.status_code == 404
+
+    def test_rebalance_moves_rows_to_their_shard(self, settings, user_factory):
+        senders = user_factory.create_batch(12)
+        start = datetime(2023, 8, 1, tzinfo=timezone.utc)
+        create_transactions(senders, user_factory(), start)
+        assert count_per_database()["default"] == 12
+
+        settings.TRANSACTION_SHARDS = SHARDS
+        moved = rebalance(batch_size=5)
+        assert moved == {"default": 12}
+        assert count_per_database()["default"] == 0
+        for sender in senders:
+            moved_row = Transaction.objects.using(shard_for(sender.pk)).get(sender=sender)
+            assert moved_row.created_at >= start
+            assert moved_row.created_at < start + timedelta(minutes=12)
+        assert rebalance() == {}
+
+        settings.TRANSACTION_SHARDS = SHARDS[:1]
+        call_command("rebalance_transactions")
+        assert count_per_database() == {"default": 0, SHARDS[0]: 12, SHARDS[1]: 0}
@@ -0,0 +1,141 @@
+import json
+import threading
+import time
+
+import pytest
+from core import task_metrics
+from core.task_metrics import (
+    LATENCY_BUCKETS,
+    Histogram,
+    MetricsRegistry,
+    collect,
+    render_prometheus,
+)
+from django.core.management import call_command
+
+from monitoring.tasks import send_policy_email
+
+pytestmark = pytest.mark.django_db
+
+TASK_NAME = "monitoring.tasks.send_policy_email"
+
+
+@pytest.fixture
+def metrics(settings, tmp_path):
+    settings.CELERY_METRICS_DIR = str(tmp_path)
+    task_metrics.registry.reset()
+    yield task_metrics.registry
+    task_metrics.registry.reset()
+
+
+class TestTaskMetrics:
+    def test_histogram_buckets_and_merge(self):
+        histogram = Histogram(LATENCY_BUCKETS)
+        for value in (0.05, 3, 3, 400, 10_000):
+            histogram.observe(value)
+        assert histogram.count == 5
+        assert histogram.counts[0] == 1
+        assert histogram.counts[LATENCY_BUCKETS.index(5)] == 2
+        assert histogram.counts[-1] == 1
+        assert histogram.quantile(0.5) == 5
+
+        other = Histogram(LATENCY_BUCKETS)
+        other.merge(histogram.to_dict())
+        other.merge(histogram.to_dict())
+        assert other.count == 10
+        assert other.sum == pytest.approx(2 * histogram.sum)
+
+    def test_task_events_are_merged_and_rendered(self):
+        registry = MetricsRegistry()
+        registry.count(TASK_NAME, "deferred_timing_window")
+        registry.count(TASK_NAME, "deferred_timing_window", 2)
+
+        merged = MetricsRegistry()
+        merged.merge(registry.snapshot())
+        merged.merge(registry.snapshot())
+        assert merged.tasks[TASK_NAME].events == {"deferred_timing_window": 6}
+        assert (
+            f'celery_task_events_total{{task="{TASK_NAME}",event="deferred_timing_window"}} 6'
+            in render_prometheus(merged)
+        )
+
+    def test_records_queue_latency_and_runtime(self, metrics, active_user):
+        email_data = {"email": active_user.email, "message": "m", "user_name": "u"}
+        send_policy_email.apply(
+            args=[email_data], headers={"published_at": time.time() - 90}
+        )
+
+        recorded = metrics.snapshot()[TASK_NAME]
+        assert recorded["succeeded"] == 1
+        assert recorded["failed"] == 0
+        assert recorded["queue_latency"]["count"] == 1
+        assert 90 <= recorded["queue_latency"]["sum"] < 120
+        assert recorded["queue_latency"]["counts"][LATENCY_BUCKETS.index(120)] == 1
+        assert recorded["runtime"]["count"] == 1
+
+    def test_records_failures_and_retries(self, metrics):
+        task_metrics.record_task_failure(sender=send_policy_email)
+        task_metrics.record_task_retry(sender=send_policy_email)
+        task_metrics.record_task_retry(sender=send_policy_email)
+
+        recorded = metrics.snapshot()[TASK_NAME]
+        assert recorded["failed"] == 1
+        assert recorded["retried"] == 2
+        assert recorded["succeeded"] == 0
+
+    def test_publish_stamps_header(self):
+        headers = {}
+        task_metrics.stamp_publish_time(headers=headers)
+        assert time.time() - headers["published_at"] < 1
+
+    def test_merges_process_dumps(self, metrics, tmp_path, capsys):
+        metrics.observe(TASK_NAME, "queue_latency", 200)
+        metrics.increment(TASK_NAME, "succeeded")
+        metrics.dump(force=True)
+        other = MetricsRegistry()
+        other.observe(TASK_NAME, "queue_latency", 2)
+        other.increment(TASK_NAME, "retried")
+        (tmp_path / "other-1.json").write_text(json.dumps(other.snapshot()))
+
+        merged = collect()
+        recorded = merged.tasks[TASK_NAME]
+        assert recorded.queue_latency.count == 2
+        assert recorded.counters == {"succeeded": 1, "failed": 0, "retried": 1}
+
+        exposition = render_prometheus(merged)
+        assert (
+            f'celery_task_queue_latency_seconds_bucket{{task="{TASK_NAME}",le="+Inf"}} 2'
+            in exposition
+        )
+        assert f'celery_task_retried_total{{task="{TASK_NAME}"}} 1' in exposition
+
+        call_command("task_metrics", "--format", "json")
+        assert json.loads(capsys.readouterr().out)[TASK_NAME]["succeeded"] == 1
+
+    def test_dump_files_survive_pid_reuse(self, metrics, tmp_path, mocker):
+        mocker.patch("core.task_metrics.os.getpid", return_value=1234)
+        metrics.increment(TASK_NAME, "succeeded")
+        metrics.dump(force=True)
+        # A new process given the same pid keeps the dead one's counts
+        other = MetricsRegistry()
+        other.increment(TASK_NAME, "succeeded")
+        other.dump(force=True)
+
+        assert len(list(tmp_path.glob("*-1234-*.json"))) == 2
+        assert collect().tasks[TASK_NAME].counters["succeeded"] == 2
+
+    def test_idle_process_dumps_on_timer(self, metrics, settings, tmp_path):
+        settings.CELERY_METRICS_DUMP_INTERVAL = 0.01
+        metrics.increment(TASK_NAME, "succeeded")
+        stop = threading.Event()
+        timer = threading.Thread(target=task_metrics.dump_periodically, args=(stop,))
+        timer.start()
+        try:
+            deadline = time.monotonic() + 5
+            while not list(tmp_path.glob("*.json")) and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            stop.set()
+            timer.join()
+
+        assert collect().tasks[TASK_NAME].counters["succeeded"] == 1
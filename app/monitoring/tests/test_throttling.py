@@ -0,0 +1,97 @@
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+from monitoring.throttling import TokenBucketThrottle, parse_rate
+
+from .conftest import api_client_with_credentials
+
+pytestmark = pytest.mark.django_db
+
+SEND_POLICY_MAIL = "monitoring.tasks.send_policy_email.delay"
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket:
+    def test_parse_rate(self):
+        assert parse_rate("60/min") == (60, 60)
+        assert parse_rate("5/s") == (5, 1)
+
+    def test_bucket_allows_burst_then_refills(self):
+        clock = FakeClock()
+        throttle = TokenBucketThrottle()
+        throttle.timer = clock
+        allowed = [throttle.take_token("bucket", 3, 1000) for _ in range(4)]
+        assert allowed == [True, True, True, False]
+        assert throttle.wait() == 1
+
+        clock.now += 1
+        assert throttle.take_token("bucket", 3, 1000)
+        assert not throttle.take_token("bucket", 3, 1000)
+
+        clock.now += 10  # idle long enough to refill completely
+        assert [throttle.take_token("bucket", 3, 1000) for _ in range(4)] == [
+            True,
+            True,
+            True,
+            False,
+        ]
+
+
+class TestTransactionThrottling:
+    transaction_list_url = reverse("transaction:transaction-list")
+
+    def test_transaction_creation_is_throttled_per_user(
+        self, api_client, user_factory, authenticate_user, settings, mocker
+    ):
+        mocker.patch(SEND_POLICY_MAIL)
+        settings.REST_FRAMEWORK = {
+            **settings.REST_FRAMEWORK,
+            "DEFAULT_THROTTLE_RATES": {"transaction": "2/min", "transaction_T1": "100/min"},
+        }
+        recipient = user_factory()
+        user = authenticate_user()
+        api_client_with_credentials(user["token"], api_client)
+        data = {"recipient": f"{recipient.id}", "amount": "200.00"}
+        assert api_client.post(self.transaction_list_url, data).status_code == 200
+        assert api_client.post(self.transaction_list_url, data).status_code == 200
+
+        response = api_client.post(self.transaction_list_url, data)
+        assert response.status_code == 429
+        assert int(response["Retry-After"]) == 30
+
+        # Reads are not throttled
+        assert api_client.get(self.transaction_list_url).status_code == 200
+
+    def test_transaction_creation_is_throttled_per_tier(
+        self, api_client, user_factory, authenticate_user, settings, mocker
+    ):
+        mocker.patch(SEND_POLICY_MAIL)
+        settings.REST_FRAMEWORK = {
+            **settings.REST_FRAMEWORK,
+            "DEFAULT_THROTTLE_RATES": {"transaction": "100/min", "transaction_T2": "1/min"},
+        }
+        recipient = user_factory()
+        user = authenticate_user(tier="T2")
+        api_client_with_credentials(user["token"], api_client)
+        data = {"recipient": f"{recipient.id}", "amount": "200.00"}
+        assert api_client.post(self.transaction_list_url, data).status_code == 200
+        assert api_client.post(self.transaction_list_url, data).status_code == 429
+
+        # Each user of the tier has a bucket of their own
+        other = user_factory(tier="T2", is_active=True)
+        api_client.force_authenticate(other)
+        assert api_client.post(self.transaction_list_url, data).status_code == 200
@@ -1,8 +1,10 @@
 from datetime import datetime, timedelta, timezone
 
 import pytest
+from core import task_metrics
+from django.core import mail
 from django.urls import reverse
-from monitoring.enums import TIER_AMOUNT
+from monitoring.enums import TIER_AMOUNT, ViolationCode
 from monitoring.models import Transaction
 from monitoring.utils import MAX_TRANSACTION_AMOUNT
 
@@ -12,13 +14,19 @@ from .factories import TransactionFactory
 pytestmark = pytest.mark.django_db
 
 SEND_POLICY_MAIL = "monitoring.tasks.send_policy_email.delay"
+REEVALUATE_DEFERRED_RULES = "monitoring.tasks.reevaluate_deferred_rules.delay"
 
 
 class TestTransaction:
     transaction_list_url = reverse("transaction:transaction-list")
 
     def test_make_transaction(
-        self, api_client, user_factory, authenticate_user, mocker
+        self,
+        api_client,
+        user_factory,
+        authenticate_user,
+        mocker,
+        django_capture_on_commit_callbacks,
     ):
         mock_send_policy_violation_mail = mocker.patch(SEND_POLICY_MAIL)
         recipient = user_factory()  # new user
@@ -26,12 +34,14 @@ class TestTransaction:
         token = user["token"]
         api_client_with_credentials(token, api_client)
         data = {"recipient": f"{recipient.id}", "amount": "200000.00"}
-        response = api_client.post(self.transaction_list_url, data)
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client.post(self.transaction_list_url, data)
         assert response.status_code == 200
         created_transaction = Transaction.objects.get(sender=user["user_instance"])
         assert created_transaction.receiver == recipient
         assert str(created_transaction.amount) == data["amount"]
         assert created_transaction.is_flagged == True  # Recipient is a new user
+        assert created_transaction.violation_codes == ViolationCode.NEW_RECIPIENT
         email_data = {
             "email": user.get("user_instance").email,
             "message": "Recipient account is new.<br>",
@@ -74,6 +84,40 @@ class TestTransaction:
         assert response.json()["receiver"] == str(receiver.id)
         assert response.json()["amount"] == "100.00"
 
+    def test_filter_transactions_by_violation(
+        self, api_client, user_factory, authenticate_user
+    ):
+        user = authenticate_user()
+        sender = user["user_instance"]
+        TransactionFactory(
+            sender=sender,
+            receiver=user_factory(),
+            is_flagged=True,
+            violation_codes=ViolationCode.TIER_LIMIT | ViolationCode.NEW_RECIPIENT,
+        )
+        TransactionFactory(
+            sender=sender,
+            receiver=user_factory(),
+            is_flagged=True,
+            violation_codes=ViolationCode.MAX_AMOUNT,
+        )
+        TransactionFactory(sender=sender, receiver=user_factory())
+        token = user["token"]
+        api_client_with_credentials(token, api_client)
+        response = api_client.get(self.transaction_list_url, {"violation": "tier_limit"})
+        assert response.status_code == 200
+        assert response.json()["total"] == 1
+        assert response.json()["results"][0]["violations"] == [
+            "new_recipient",
+            "tier_limit",
+        ]
+
+        response = api_client.get(
+            self.transaction_list_url,
+            {"violation": ["tier_limit", "max_amount"]},
+        )
+        assert response.json()["total"] == 2
+
     def test_deny_retrieval_for_unowned_transaction(
         self, api_client, user_factory, authenticate_user
     ):
@@ -89,7 +133,12 @@ class TestTransaction:
         assert response.status_code == 404
 
     def test_transaction_amount_above_tier_limit(
-        self, api_client, user_factory, authenticate_user, mocker
+        self,
+        api_client,
+        user_factory,
+        authenticate_user,
+        mocker,
+        django_capture_on_commit_callbacks,
     ):
         mock_send_policy_violation_mail = mocker.patch(SEND_POLICY_MAIL)
 
@@ -103,7 +152,8 @@ class TestTransaction:
 
         api_client_with_credentials(token, api_client)
         data = {"recipient": f"{recipient.id}", "amount": 2_000_000}
-        response = api_client.post(self.transaction_list_url, data)
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client.post(self.transaction_list_url, data)
         assert response.status_code == 200
 
         created_transaction = Transaction.objects.get(sender=user_instance)
@@ -119,7 +169,12 @@ class TestTransaction:
         mock_send_policy_violation_mail.assert_called_once_with(email_data)
 
     def test_transaction_for_flagged_recipient(
-        self, api_client, user_factory, authenticate_user, mocker
+        self,
+        api_client,
+        user_factory,
+        authenticate_user,
+        mocker,
+        django_capture_on_commit_callbacks,
     ):
         mock_send_policy_violation_mail = mocker.patch(SEND_POLICY_MAIL)
 
@@ -131,7 +186,8 @@ class TestTransaction:
         token = user["token"]
         api_client_with_credentials(token, api_client)
         data = {"recipient": f"{recipient.id}", "amount": 200}
-        response = api_client.post(self.transaction_list_url, data)
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client.post(self.transaction_list_url, data)
         assert response.status_code == 200
 
         email_data = {
@@ -142,7 +198,12 @@ class TestTransaction:
         mock_send_policy_violation_mail.assert_called_once_with(email_data)
 
     def test_transaction_violating_timing_window(
-        self, api_client, user_factory, authenticate_user, mocker
+        self,
+        api_client,
+        user_factory,
+        authenticate_user,
+        mocker,
+        django_capture_on_commit_callbacks,
     ):
         mock_send_policy_violation_mail = mocker.patch(SEND_POLICY_MAIL)
 
@@ -159,7 +220,8 @@ class TestTransaction:
 
         api_client_with_credentials(token, api_client)
         data = {"recipient": f"{recipient.id}", "amount": 200}
-        response = api_client.post(self.transaction_list_url, data)
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client.post(self.transaction_list_url, data)
         assert response.status_code == 200
 
         email_data = {
@@ -169,8 +231,63 @@ class TestTransaction:
         }
         mock_send_policy_violation_mail.assert_called_once_with(email_data)
 
+    def test_deferred_timing_window_flags_transaction_later(
+        self,
+        api_client,
+        user_factory,
+        authenticate_user,
+        mocker,
+        settings,
+        django_capture_on_commit_callbacks,
+    ):
+        settings.POLICY_LATENCY_BUDGET_MS = 0
+        mock_send_policy_violation_mail = mocker.patch(SEND_POLICY_MAIL)
+        mock_reevaluate = mocker.patch(REEVALUATE_DEFERRED_RULES)
+        recipient = user_factory()
+        recipient.created_at = datetime.now(timezone.utc) - timedelta(days=1)
+        recipient.save()
+        user = authenticate_user(tier="T1")
+        TransactionFactory(sender=user["user_instance"], receiver=recipient)
+
+        api_client_with_credentials(user["token"], api_client)
+        data = {"recipient": f"{recipient.id}", "amount": 200}
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client.post(self.transaction_list_url, data)
+        assert response.status_code == 200
+
+        transaction = Transaction.objects.get(amount=200)
+        assert not transaction.is_flagged
+        assert transaction.deferred_codes == ViolationCode.TIMING_WINDOW
+        mock_send_policy_violation_mail.assert_not_called()
+        mock_reevaluate.assert_called_once_with(
+            str(transaction.id), str(user["user_instance"].pk)
+        )
+
+        from monitoring.tasks import reevaluate_deferred_rules
+
+        task_metrics.registry.reset()
+        reevaluate_deferred_rules(*mock_reevaluate.call_args.args)
+        transaction.refresh_from_db()
+        assert transaction.is_flagged
+        assert transaction.violations == ["timing_window"]
+        assert transaction.deferred_codes == 0
+        assert len(mail.outbox) == 1
+        assert mail.outbox[0].to == [user["user_instance"].email]
+        events = task_metrics.registry.snapshot()[reevaluate_deferred_rules.name]["events"]
+        assert events == {"deferred_timing_window": 1}
+
+        # A retried task finds the rules already evaluated
+        reevaluate_deferred_rules(*mock_reevaluate.call_args.args)
+        assert len(mail.outbox) == 1
+        task_metrics.registry.reset()
+
     def test_transaction_amount_above_max_limit(
-        self, api_client, user_factory, authenticate_user, mocker
+        self,
+        api_client,
+        user_factory,
+        authenticate_user,
+        mocker,
+        django_capture_on_commit_callbacks,
     ):
         """Max allowable limit is 5m"""
         mock_send_policy_violation_mail = mocker.patch(SEND_POLICY_MAIL)
@@ -185,7 +302,8 @@ class TestTransaction:
 
         api_client_with_credentials(token, api_client)
         data = {"recipient": f"{recipient.id}", "amount": 6_000_000}
-        response = api_client.post(self.transaction_list_url, data)
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client.post(self.transaction_list_url, data)
         assert response.status_code == 200
 
         email_data = {
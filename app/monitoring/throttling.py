@@ -0,0 +1,102 @@
+"""Token-bucket throttles for transaction creation.
+
+Buckets are kept in the cache using the GCRA formulation: a bucket is a
+single integer, its theoretical arrival time (TAT) in milliseconds, and
+taking a token is one atomic `incr`. A rate of "60/min" gives a bucket of
+60 tokens refilled at one token per second. Unlike DRF's SimpleRateThrottle
+no per-request history is stored, so each key costs O(1) in the cache.
+
+Every process serving requests must share the cache: with a per-process
+one (LocMemCache) each worker keeps its own buckets and lets the full rate
+through, so gunicorn refuses to start several workers on one (see
+core.serving.check_shared_cache).
+"""
+import math
+import time
+
+from django.core.cache import cache as default_cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate: str) -> tuple:
+    """'60/min' -> (60, 60)"""
+    num_requests, period = rate.split("/")
+    return int(num_requests), PERIODS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    scope = None
+    cache = default_cache
+    cache_format = "throttle_bucket_%(scope)s_%(ident)s"
+    timer = time.time
+
+    def __init__(self):
+        self._wait = None
+
+    def get_scope(self, request, view) -> str:
+        return self.scope
+
+    def get_ident_key(self, request, view) -> str:
+        raise NotImplementedError(".get_ident_key() must be overridden")
+
+    def get_rate(self, scope: str):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+
+    def allow_request(self, request, view) -> bool:
+        scope = self.get_scope(request, view)
+        rate = self.get_rate(scope)
+        if rate is None:
+            return True
+        capacity, period = parse_rate(rate)
+        interval_ms = max(int(period * 1000 / capacity), 1)
+        key = self.cache_format % {
+            "scope": scope,
+            "ident": self.get_ident_key(request, view),
+        }
+        return self.take_token(key, capacity, interval_ms)
+
+    def take_token(self, key: str, capacity: int, interval_ms: int) -> bool:
+        now_ms = int(self.timer() * 1000)
+        timeout = math.ceil(capacity * interval_ms / 1000) + 1
+        self.cache.add(key, now_ms, timeout)
+        try:
+            tat_ms = self.cache.incr(key, interval_ms)
+        except ValueError:  # expired between add() and incr()
+            tat_ms = 0
+        if tat_ms - interval_ms < now_ms:
+            # The bucket refilled completely while idle; restart from now.
+            # Concurrent resets can only hand out a token or two extra.
+            tat_ms = now_ms + interval_ms
+            self.cache.set(key, tat_ms, timeout)
+        if tat_ms - now_ms > capacity * interval_ms:
+            self.cache.decr(key, interval_ms)
+            self._wait = math.ceil((tat_ms - now_ms - capacity * interval_ms) / 1000)
+            return False
+        self.cache.touch(key, timeout)
+        return True
+
+    def wait(self):
+        return self._wait
+
+
+class UserTransactionThrottle(TokenBucketThrottle):
+    """One bucket per authenticated user"""
+
+    scope = "transaction"
+
+    def get_ident_key(self, request, view) -> str:
+        return str(request.user.pk)
+
+
+class TierTransactionThrottle(TokenBucketThrottle):
+    """One bucket per authenticated user, sized by the rate of the user's
+    tier, e.g. rate key `transaction_T1`"""
+
+    def get_scope(self, request, view) -> str:
+        return f"transaction_{request.user.tier}"
+
+    def get_ident_key(self, request, view) -> str:
+        return str(request.user.pk)
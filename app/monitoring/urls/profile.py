@@ -0,0 +1,13 @@
+from django.urls import include, path
+from rest_framework.routers import DefaultRouter
+
+from ..views import ProfileViewSet
+
+app_name = "profile"
+
+router = DefaultRouter()
+router.register("", ProfileViewSet, basename="profile")
+
+urlpatterns = [
+    path("", include(router.urls)),
+]
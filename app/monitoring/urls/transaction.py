@@ -1,11 +1,14 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from ..views import TransactionViewSets
+from ..views import ArchivedTransactionViewSet, TransactionViewSets
 
 app_name = "transaction"
 
 router = DefaultRouter()
+router.register(
+    "archive", ArchivedTransactionViewSet, basename="archived-transaction"
+)
 router.register("", TransactionViewSets)
 
 urlpatterns = [
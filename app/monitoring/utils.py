@@ -1,13 +1,25 @@
-from typing import Any
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable
 
 from django.conf import settings
 from django.core.mail import EmailMultiAlternatives
 from django.template.defaultfilters import linebreaksbr
 
-from .enums import TIER_AMOUNT
-from .models import User
+from .enums import TIER_AMOUNT, ViolationCode
+from .models import AmountStatistics, User
+
+logger = logging.getLogger(__name__)
 
 MAX_TRANSACTION_AMOUNT = 5_000_000.00 #5m
+# A transfer this many standard deviations above the sender's usual amount
+# is an anomaly, once enough transfers have been seen to trust the statistics.
+AMOUNT_ANOMALY_ZSCORE = 4.0
+AMOUNT_ANOMALY_MIN_SAMPLES = 10
+AMOUNT_ANOMALY_DECAYED = False
 
 
 def send_email(subject: str, email_to: str, html_alternative: Any):
@@ -18,26 +30,143 @@ def send_email(subject: str, email_to: str, html_alternative: Any):
     msg.send(fail_silently=False)
 
 
-def evaluate_policy(sender: User, receiver: User, amount: float) -> dict:
+def is_amount_anomalous(
+    sender: User, amount: float, threshold: float = None, decayed: bool = None
+) -> bool:
+    """Compares amount with the sender's stored running statistics"""
+    try:
+        stats: AmountStatistics = sender.amount_stats
+    except AmountStatistics.DoesNotExist:
+        return False
+    if stats.count < AMOUNT_ANOMALY_MIN_SAMPLES:
+        return False
+    if threshold is None:
+        threshold = AMOUNT_ANOMALY_ZSCORE
+    if decayed is None:
+        decayed = AMOUNT_ANOMALY_DECAYED
+    return stats.zscore(amount, decayed=decayed) > threshold
+
+
+@dataclass(frozen=True)
+class PolicyRule:
+    """A violation check. Deferrable rules need DB or cache round trips and
+    can be postponed past the latency budget; their inputs must not change
+    once the transaction is saved, since they may run after it."""
+
+    code: ViolationCode
+    check: Callable
+    message: Callable
+    deferrable: bool = False
+
+
+POLICY_RULES = [
+    PolicyRule(
+        ViolationCode.NEW_RECIPIENT,
+        lambda sender, receiver, amount, moment: receiver.is_new,
+        lambda sender, amount: "Recipient account is new.\n",
+    ),
+    PolicyRule(
+        ViolationCode.FLAGGED_RECIPIENT,
+        lambda sender, receiver, amount, moment: receiver.is_flagged,
+        lambda sender, amount: "Recipient account is flagged.\n",
+    ),
+    PolicyRule(
+        ViolationCode.TIER_LIMIT,
+        lambda sender, receiver, amount, moment: sender.is_amount_above_tier_limit(amount),
+        lambda sender, amount: f"Transaction amount of #{amount:,} is above #{TIER_AMOUNT.get(sender.tier):,}, your tier limit.\n",
+    ),
+    PolicyRule(
+        ViolationCode.TIMING_WINDOW,
+        lambda sender, receiver, amount, moment: sender.sent_within_timing_window(moment),
+        lambda sender, amount: "Transaction violated 1 minute timing window.\n",
+        deferrable=True,
+    ),
+    PolicyRule(
+        ViolationCode.MAX_AMOUNT,
+        lambda sender, receiver, amount, moment: amount > MAX_TRANSACTION_AMOUNT,
+        lambda sender, amount: f"Transaction amount of #{amount:,} is above #{MAX_TRANSACTION_AMOUNT:,} max limit\n",
+    ),
+    # Reads statistics the saved transaction is added to, so it runs inline.
+    PolicyRule(
+        ViolationCode.AMOUNT_ANOMALY,
+        lambda sender, receiver, amount, moment: is_amount_anomalous(sender, amount),
+        lambda sender, amount: f"Transaction amount of #{amount:,} is unusually high for your account.\n",
+    ),
+]
+
+# Expected duration of each deferrable rule. A slower observation replaces
+# the estimate at once; every deferral decays it, so a degraded dependency
+# is only probed inline about once per few hundred transfers.
+_rule_latency_ms = defaultdict(float)
+RULE_LATENCY_DECAY = 0.99
+
+
+def reset_rule_latencies() -> None:
+    _rule_latency_ms.clear()
+
+
+def evaluate_policy(
+    sender: User, receiver: User, amount: float, budget_ms: float = None
+) -> dict:
+    """Runs the policy rules in order. A deferrable rule expected to take the
+    evaluation past `budget_ms` (POLICY_LATENCY_BUDGET_MS by default) is
+    skipped and reported in `deferred_codes`."""
+    if budget_ms is None:
+        budget_ms = settings.POLICY_LATENCY_BUDGET_MS
+    started = time.perf_counter()
+    moment = datetime.now(timezone.utc)
     violation_message = ""
-    is_flagged = False
-    if receiver.is_new:
-        is_flagged = True
-        violation_message += "Recipient account is new.\n"
-    if receiver.is_flagged:
-        is_flagged = True
-        violation_message += "Recipient account is flagged.\n"
-    if sender.is_amount_above_tier_limit(amount):
-        is_flagged = True
-        violation_message += f"Transaction amount of #{amount:,} is above #{TIER_AMOUNT.get(sender.tier):,}, your tier limit.\n"
-    if sender.is_within_timing_window:
-        is_flagged = True
-        violation_message += "Transaction violated 1 minute timing window.\n"
-    if amount > MAX_TRANSACTION_AMOUNT:
-        is_flagged = True
-        violation_message += f"Transaction amount of #{amount:,} is above #{MAX_TRANSACTION_AMOUNT:,} max limit\n"
+    violation_codes = 0
+    deferred_codes = 0
+    for rule in POLICY_RULES:
+        if rule.deferrable:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if elapsed_ms + _rule_latency_ms[rule.code] > budget_ms:
+                deferred_codes |= rule.code
+                _rule_latency_ms[rule.code] *= RULE_LATENCY_DECAY
+                continue
+        rule_started = time.perf_counter()
+        if rule.check(sender, receiver, amount, moment):
+            violation_codes |= rule.code
+            violation_message += rule.message(sender, amount)
+        if rule.deferrable:
+            duration_ms = (time.perf_counter() - rule_started) * 1000
+            _rule_latency_ms[rule.code] = max(
+                duration_ms, _rule_latency_ms[rule.code] * RULE_LATENCY_DECAY
+            )
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if deferred_codes:
+        logger.info(
+            "Policy evaluation deferred %s after %.1fms (budget %sms)",
+            ViolationCode.names(deferred_codes),
+            elapsed_ms,
+            budget_ms,
+        )
     violation_message = linebreaksbr(violation_message)
     return {
-        "is_flagged": is_flagged,
+        "is_flagged": bool(violation_codes),
+        "violation_codes": int(violation_codes),
+        "deferred_codes": int(deferred_codes),
+        "elapsed_ms": elapsed_ms,
         "violation_message": violation_message,
     }
+
+
+def evaluate_deferred_rules(transaction) -> dict:
+    """Evaluates the rules deferred for a saved transaction, as of the
+    moment it was created."""
+    violation_message = ""
+    violation_codes = 0
+    for rule in POLICY_RULES:
+        if rule.code & transaction.deferred_codes and rule.check(
+            transaction.sender,
+            transaction.receiver,
+            transaction.amount,
+            transaction.created_at,
+        ):
+            violation_codes |= rule.code
+            violation_message += rule.message(transaction.sender, transaction.amount)
+    return {
+        "violation_codes": int(violation_codes),
+        "violation_message": linebreaksbr(violation_message),
+    }
@@ -1,14 +1,38 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from core.lazy import extend_schema_lazily
+from core.profiling import get_profile, get_profile_file, list_profiles
+from core.renderers import FastJSONRenderer
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db.models import F, Q
+from django.http import FileResponse
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
-from drf_spectacular.utils import extend_schema
-from rest_framework import filters, status, viewsets
+from rest_framework import exceptions, filters, status, viewsets
+from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView
 
+from .archive import ArchivedTransactions, get_archived_transaction
+from .enums import ViolationCode
+from .filters import (
+    TransactionFilter,
+    TransactionSearchFilter,
+    UserFilter,
+    UserSearchFilter,
+    search_user_queryset,
+)
+from .idempotency import IDEMPOTENCY_HEADER, idempotent
+from .mixins import ConditionalGetMixin, FastListMixin
+from .moderation import moderate_users
 from .models import Transaction, User
+from .permissions import IsAdmin
 from .serializers import (
+    ArchivedTransactionSerializer,
+    BulkModerationSerializer,
     CustomObtainTokenPairSerializer,
     MakeTransactionSerializer,
     OnboardUserSerializer,
@@ -17,6 +41,14 @@ from .serializers import (
     UpdateUserSerializer,
     UserSerializer,
 )
+from .shadow import challenger_stats
+from .sharding import ScatterQuerySet, is_sharded, scatter
+from .throttling import TierTransactionThrottle, UserTransactionThrottle
+
+AMOUNT_PLACES = Decimal("0.01")
+SHADOW_STATS_DAYS = 7
+# Longer windows are cut to this; huge values would overflow the date range
+SHADOW_STATS_MAX_DAYS = 366
 
 
 class CustomObtainTokenPairView(TokenObtainPairView):
@@ -41,10 +73,12 @@ class PasswordChangeView(viewsets.GenericViewSet):
         )
 
 
-class UserViewsets(viewsets.ModelViewSet):
+class UserViewsets(ConditionalGetMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = get_user_model().objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    fast_list_values = UserSerializer.Meta.fields
     http_method_names = [
         "get",
         "post",
@@ -52,9 +86,10 @@ class UserViewsets(viewsets.ModelViewSet):
     ]
     filter_backends = [
         DjangoFilterBackend,
-        filters.SearchFilter,
+        UserSearchFilter,
         filters.OrderingFilter,
     ]
+    filterset_class = UserFilter
     search_fields = [
         "email",
         "firstname",
@@ -86,7 +121,7 @@ class UserViewsets(viewsets.ModelViewSet):
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
 
-    @extend_schema(responses={200: UserSerializer()})
+    @extend_schema_lazily(responses={200: UserSerializer()})
     def create(self, request, *args, **kwargs):
         """Accounts are automatically activated upon creation."""
         serializer = self.get_serializer(data=request.data)
@@ -100,26 +135,73 @@ class UserViewsets(viewsets.ModelViewSet):
         """
         return super().list(request, *args, **kwargs)
 
-    @extend_schema(responses={200: UserSerializer()})
+    @extend_schema_lazily(responses={200: UserSerializer()})
     def partial_update(self, request, *args, **kwargs):
         """Enables a user to update the tier, flag status, and admin status for a specified user."""
         return super().partial_update(request, *args, **kwargs)
 
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="bulk-moderate",
+        permission_classes=[IsAdmin],
+        serializer_class=BulkModerationSerializer,
+    )
+    def bulk_moderate(self, request, *args, **kwargs):
+        """Set the tier and/or flag status of many users at once.\n
+        Users are selected by `ids`, by `filter`, which takes the same
+        parameters as the user list (e.g. {"search": "ring", "tier": "T1"}),
+        or every user with {"all": true}.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        queryset = User.objects.all()
+        if "ids" in data:
+            queryset = queryset.filter(pk__in=data["ids"])
+        elif "filter" in data:
+            filterset = UserFilter(data["filter"], queryset=queryset, request=request)
+            if not filterset.is_valid():
+                raise exceptions.ValidationError({"filter": filterset.errors})
+            search = data["filter"].get("search", "")
+            queryset = search_user_queryset(filterset.qs, search)
+        result = moderate_users(
+            request.user, queryset, data["set"], reason=data.get("reason", "")
+        )
+        return Response(result, status.HTTP_200_OK)
 
-class TransactionViewSets(viewsets.ModelViewSet):
+
+class TransactionViewSets(ConditionalGetMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Transaction.objects.all().select_related("sender", "receiver")
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    fast_list_values = [
+        "id",
+        "created_at",
+        "updated_at",
+        "amount",
+        "is_flagged",
+        "violation_codes",
+        "deferred_codes",
+        "sender_id",
+        "receiver_id",
+    ]
+    fast_list_annotations = {
+        "sender_name": F("sender__firstname"),
+        "recipient_name": F("receiver__firstname"),
+    }
     http_method_names = ["get", "post"]
     filter_backends = [
         DjangoFilterBackend,
-        filters.SearchFilter,
+        TransactionSearchFilter,
         filters.OrderingFilter,
     ]
-    filterset_fields = ["is_flagged"]
-    search_fields = ["sender__firstname", "receiver__firstname", "amount"]
+    filterset_class = TransactionFilter
+    search_fields = ["sender__firstname", "receiver__firstname"]
     ordering_fields = [
         "created_at",
+        "amount",
     ]
 
     def get_serializer_class(self):
@@ -127,14 +209,67 @@ class TransactionViewSets(viewsets.ModelViewSet):
             return MakeTransactionSerializer
         return super().get_serializer_class()
 
+    def get_throttles(self):
+        if self.action == "create":
+            return [UserTransactionThrottle(), TierTransactionThrottle()]
+        return super().get_throttles()
+
     def get_queryset(self):
         user: User = self.request.user
-        return Transaction.objects.filter(Q(sender=user) | Q(receiver=user)).distinct()
+        if is_sharded():
+            # Received transactions live in the senders' shards.
+            return scatter(
+                Transaction.objects.filter(Q(sender=user) | Q(receiver=user))
+                .prefetch_related("sender", "receiver")
+            )
+        return (
+            super()
+            .get_queryset()
+            .filter(Q(sender=user) | Q(receiver=user))
+            .distinct()
+        )
+
+    def filter_queryset(self, queryset):
+        if isinstance(queryset, ScatterQuerySet):
+            return queryset.map(super().filter_queryset)
+        return super().filter_queryset(queryset)
+
+    def use_fast_list(self) -> bool:
+        # The name annotations join users, which are not on the shards.
+        return super().use_fast_list() and not is_sharded()
 
     def list(self, request, *args, **kwargs):
         """Retrieve transactions associated with an authenticated user."""
         return super().list(request, *args, **kwargs)
 
+    def fast_list_row(self, row: dict) -> dict:
+        """Same keys and values as TransactionSerializer"""
+        return {
+            "id": row["id"],
+            "sender_name": row["sender_name"],
+            "recipient_name": row["recipient_name"],
+            "violations": ViolationCode.names(row["violation_codes"]),
+            "created_at": timezone.localtime(row["created_at"]),
+            "updated_at": timezone.localtime(row["updated_at"]),
+            "amount": f"{row['amount'].quantize(AMOUNT_PLACES):f}",
+            "is_flagged": row["is_flagged"],
+            "violation_codes": row["violation_codes"],
+            "deferred_codes": row["deferred_codes"],
+            "sender": row["sender_id"],
+            "receiver": row["receiver_id"],
+        }
+
+    @extend_schema_lazily(
+        parameters=[
+            {
+                "name": IDEMPOTENCY_HEADER,
+                "location": "header",
+                "description": "Unique per transfer; a retry with the same key "
+                "returns the original response instead of transferring again.",
+            }
+        ]
+    )
+    @idempotent
     def create(self, request, *args, **kwargs):
         """Initiate a transfer from an authenticated user to another user.\n
         Transactions are restricted to occur between the same accounts.
@@ -149,3 +284,83 @@ class TransactionViewSets(viewsets.ModelViewSet):
             },
             status.HTTP_200_OK,
         )
+
+    @extend_schema_lazily(
+        parameters=[
+            {
+                "name": "days",
+                "type": int,
+                "description": "Days of shadow evaluations to include "
+                "(at most 366)",
+            }
+        ]
+    )
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="shadow-stats",
+        permission_classes=[IsAdmin],
+    )
+    def shadow_stats(self, request, *args, **kwargs):
+        """Agreement of each challenger rule set with the live rules.\n
+        Lift is the challenger's flag rate relative to the live rules'.
+        """
+        try:
+            days = int(request.query_params.get("days", SHADOW_STATS_DAYS))
+        except ValueError:
+            raise exceptions.ValidationError({"days": "Must be a whole number."})
+        if days < 1:
+            raise exceptions.ValidationError({"days": "Must be at least 1."})
+        days = min(days, SHADOW_STATS_MAX_DAYS)
+        since = timezone.now().date() - timedelta(days=days - 1)
+        return Response({"since": since, "challengers": challenger_stats(since)})
+
+
+class ArchivedTransactionViewSet(viewsets.GenericViewSet):
+    """Read-only access to transactions moved into cold storage."""
+
+    serializer_class = ArchivedTransactionSerializer
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request, *args, **kwargs):
+        """Retrieve archived transactions associated with an authenticated user."""
+        page = self.paginate_queryset(ArchivedTransactions(request.user.id))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def retrieve(self, request, pk=None, *args, **kwargs):
+        row = get_archived_transaction(pk)
+        user_id = str(request.user.id)
+        if row is None or user_id not in (row["sender_id"], row["receiver_id"]):
+            raise exceptions.NotFound()
+        return Response(self.get_serializer(row).data)
+
+
+class ProfileViewSet(viewsets.ViewSet):
+    """Profiles captured by the request profiling middleware."""
+
+    permission_classes = [IsAdmin]
+
+    def list(self, request, *args, **kwargs):
+        """List stored profiles, newest first."""
+        fields = ["id", "created_at", "method", "path", "status_code", "duration_ms"]
+        profiles = [
+            {field: profile.get(field) for field in fields + ["mode", "sql_count"]}
+            for profile in list_profiles()
+        ]
+        return Response(profiles)
+
+    def retrieve(self, request, pk=None, *args, **kwargs):
+        """Profile metadata including SQL timings and the pstats summary."""
+        profile = get_profile(pk)
+        if profile is None:
+            raise exceptions.NotFound()
+        return Response(profile)
+
+    @action(detail=True, methods=["get"])
+    def download(self, request, pk=None):
+        """Download the raw cProfile dump or, for sampled profiles, the folded stacks."""
+        path = get_profile_file(pk, "prof") or get_profile_file(pk, "folded")
+        if path is None:
+            raise exceptions.NotFound()
+        return FileResponse(open(path, "rb"), as_attachment=True, filename=path.name)
@@ -1,6 +1,9 @@
 #!/bin/sh
 python manage.py makemigrations --no-input
 python manage.py migrate --no-input
+for database in $(python manage.py shell -c "from django.conf import settings; print(' '.join(settings.TRANSACTION_SHARD_DATABASES))"); do
+    python manage.py migrate --no-input --database "$database"
+done
 rm celerybeat.pid
 
 exec "$@"
\ No newline at end of file
@@ -1,6 +1,10 @@
 #!/bin/sh
 python manage.py makemigrations --no-input
 python manage.py migrate --no-input
+for database in $(python manage.py shell -c "from django.conf import settings; print(' '.join(settings.TRANSACTION_SHARD_DATABASES))"); do
+    python manage.py migrate --no-input --database "$database"
+done
+python manage.py build_schema
 rm celerybeat.pid
 rm logs/debug.log
 exec "$@"
\ No newline at end of file